@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from ldap import ALREADY_EXISTS
 from ldap import INVALID_DN_SYNTAX
 from ldap import MOD_ADD
 from ldap import MOD_DELETE
@@ -17,7 +18,9 @@ from node.behaviors import OdictStorage
 from node.ext.ldap import BASE
 from node.ext.ldap import LDAPSession
 from node.ext.ldap import ONELEVEL
+from node.ext.ldap.base import ADD_WINDOW
 from node.ext.ldap.base import ensure_text
+from node.ext.ldap.base import prefetch_pages
 from node.ext.ldap.events import LDAPNodeAddedEvent
 from node.ext.ldap.events import LDAPNodeCreatedEvent
 from node.ext.ldap.events import LDAPNodeDetachedEvent
@@ -26,6 +29,7 @@ from node.ext.ldap.events import LDAPNodeRemovedEvent
 from node.ext.ldap.filter import LDAPDictFilter
 from node.ext.ldap.filter import LDAPFilter
 from node.ext.ldap.filter import LDAPRelationFilter
+from node.ext.ldap.filter import equality_filter
 from node.ext.ldap.interfaces import ILDAPStorage
 from node.ext.ldap.schema import LDAPSchemaInfo
 from node.interfaces import IInvalidate
@@ -34,6 +38,7 @@ from node.utils import debug
 from node.utils import decode
 from node.utils import encode
 from node.utils import UNSET
+from odict import odict
 from plumber import Behavior
 from plumber import default
 from plumber import finalize
@@ -52,11 +57,37 @@ ACTION_MODIFY = 1
 ACTION_DELETE = 2
 
 
+class LDAPBulkResult(object):
+    """Report of a bulk operation.
+
+    ``added`` contains the keys of entries added in order. ``errors`` maps
+    keys of entries failed to the ``ldap.LDAPError`` they failed with.
+    """
+
+    def __init__(self):
+        self.added = list()
+        self.errors = odict()
+
+    def __repr__(self):
+        return '<{} added={} errors={}>'.format(
+            self.__class__.__name__,
+            len(self.added),
+            len(self.errors)
+        )
+
+
 class LDAPAttributesBehavior(Behavior):
 
     @plumb
     def __init__(_next, self, name=None, parent=None):
         _next(self, name=name, parent=parent)
+        # attribute values as persisted in the directory. Used to compute
+        # modifications. None if not loaded or if the current values are the
+        # persisted ones, see ``_persisted_values``.
+        self._persisted = None
+        # flag whether the current values are the persisted ones. They get
+        # copied to ``_persisted`` before the first modification.
+        self._persisted_current = False
         self.load()
 
     @default
@@ -67,7 +98,8 @@ class LDAPAttributesBehavior(Behavior):
                 or not ldap_node.ldap_session \
                 or ldap_node._action == ACTION_ADD:
             return
-        # clear in case reload
+        # clear in case reload. Values to be replaced need no copy
+        self._persisted_current = False
         self.clear()
         # query all attributes
         attrlist = ['*']
@@ -80,21 +112,25 @@ class LDAPAttributesBehavior(Behavior):
         # if self.session._props.memberOfSupport:
         #    attrlist.append('memberOf')
 
-        # fetch attributes for ldap_node
-        entry = ldap_node.ldap_session.search(
-            scope=BASE,
-            baseDN=ldap_node.DN,
-            force_reload=ldap_node._reload,
-            attrlist=attrlist
-        )
-        # result length must be 1
-        if len(entry) != 1:  # pragma: no cover
-            raise RuntimeError(
-                "Fatal. Expected entry does not exist "
-                "or more than one entry found"
+        # attributes read by a search of the parent node
+        attrs = ldap_node._seed_attrs
+        ldap_node._seed_attrs = None
+        if attrs is None:
+            # fetch attributes for ldap_node
+            entry = ldap_node.ldap_session.search(
+                scope=BASE,
+                baseDN=ldap_node.DN,
+                force_reload=ldap_node._reload,
+                attrlist=attrlist
             )
+            # result length must be 1
+            if len(entry) != 1:  # pragma: no cover
+                raise RuntimeError(
+                    "Fatal. Expected entry does not exist "
+                    "or more than one entry found"
+                )
+            attrs = entry[0][1]
         # read attributes from result and set to self
-        attrs = entry[0][1]
         for key, item in attrs.items():
             if len(item) == 1 and not self.is_multivalued(key):
                 self[key] = item[0]
@@ -103,6 +139,7 @@ class LDAPAttributesBehavior(Behavior):
         # __setitem__ has set our changed flag. We just loaded from LDAP, so
         # unset it
         self.changed = False
+        self._set_persisted()
         # node has been modified prior to (re)loading attributes, so unset
         # markers there too
         if ldap_node._action not in [ACTION_ADD, ACTION_DELETE]:
@@ -123,11 +160,13 @@ class LDAPAttributesBehavior(Behavior):
         if not self.is_binary(key):
             val = decode(val)
         key = ensure_text(key)
+        self._copy_persisted()
         _next(self, key, val)
         self._set_attrs_modified()
 
     @plumb
     def __delitem__(_next, self, key):
+        self._copy_persisted()
         _next(self, key)
         self._set_attrs_modified()
 
@@ -141,6 +180,66 @@ class LDAPAttributesBehavior(Behavior):
             if ldap_node.parent:
                 ldap_node.parent._modified_children.add(ldap_node.name)
 
+    @default
+    def _set_persisted(self):
+        # remember current values as persisted values. They are copied not
+        # before the first modification, since most loaded attributes never
+        # get modified.
+        self._persisted = None
+        self._persisted_current = True
+
+    @default
+    def _copy_persisted(self):
+        # copy persisted values if the current values are about to be
+        # modified. Lists are copied as they might get modified in place.
+        if not self._persisted_current:
+            return
+        self._persisted_current = False
+        self._persisted = dict([
+            (key, list(value) if isinstance(value, list) else value)
+            for key, value in self.items()
+        ])
+
+    @default
+    def _persisted_values(self):
+        # return mapping of attribute values as persisted in the directory
+        # or None if not loaded.
+        if self._persisted_current:
+            return self.storage
+        return self._persisted
+
+    @default
+    def _apply_values(self, name, added=(), deleted=()):
+        # apply values added to respective deleted from attribute ``name``
+        # in the directory to loaded and persisted values without changing
+        # the modified state
+        for storage in (self.storage, self._persisted):
+            if storage is None:
+                continue
+            value = self._changed_values(
+                name,
+                storage.get(name, list()),
+                added,
+                deleted
+            )
+            if value is None:
+                storage.pop(name, None)
+            else:
+                storage[name] = value
+
+    @default
+    def _changed_values(self, name, value, added, deleted):
+        # return ``value`` with values ``added`` and ``deleted``. ``None``
+        # if no value is left.
+        value = value if isinstance(value, list) else [value]
+        value = [v for v in value if v not in deleted]
+        value += [v for v in added if v not in value]
+        if not value:
+            return None
+        if len(value) == 1 and not self.is_multivalued(name):
+            return value[0]
+        return value
+
     @default
     def is_binary(self, name):
         return name in self.parent.root._binary_attributes
@@ -192,6 +291,7 @@ class LDAPStorage(OdictStorage):
         self._modified_children = set()
         self._deleted_children = set()
         self._reload = False
+        self._seed_attrs = None
         self._multivalued_attributes = set()
         self._binary_attributes = set()
         self._page_size = 1000
@@ -211,6 +311,12 @@ class LDAPStorage(OdictStorage):
         # creation related default
         self.child_factory = LDAPNode
         self.child_defaults = None
+        # attribute list of the one level search when iterating. If set,
+        # children are created from the search result, see ``load_children``
+        self.child_attrlist = None
+        # flag whether directory is searched for existing entries when
+        # setting children, see ``bulk_add``
+        self._skip_existence_check = False
 
     @finalize
     def __getitem__(self, key):
@@ -219,22 +325,16 @@ class LDAPStorage(OdictStorage):
         try:
             return self.storage[key]
         except KeyError:
-            val = self.child_factory()
-            val.__name__ = key
-            val.__parent__ = self
+            val = self._new_child(key)
             try:
                 res = self.ldap_session.search(
                     scope=BASE,
                     baseDN=val.DN,
                     attrlist=['']  # no need for attrs
                 )
-                # remember DN
-                val._dn = res[0][0]
-                val._ldap_session = self.ldap_session
-                self.storage[key] = val
-                return val
             except (NO_SUCH_OBJECT, INVALID_DN_SYNTAX):
                 raise KeyError(key)
+            return self._store_child(val, res[0][0])
 
     @finalize
     def __setitem__(self, key, val):
@@ -247,13 +347,7 @@ class LDAPStorage(OdictStorage):
         val.__parent__ = self
         val._dn = self.child_dn(key)
         val._ldap_session = self.ldap_session
-        try:
-            self.ldap_session.search(
-                scope=BASE,
-                baseDN=val.DN,
-                attrlist=['']  # no need for attrs
-            )
-        except (NO_SUCH_OBJECT, INVALID_DN_SYNTAX):
+        if self._skip_existence_check or not self._entry_exists(val.DN):
             # the value is not yet in the directory
             val._action = ACTION_ADD
             val.changed = True
@@ -292,33 +386,7 @@ class LDAPStorage(OdictStorage):
 
     @finalize
     def __iter__(self):
-        if self.name is None:
-            return
-        cookie = ''
-        while True:
-            try:
-                res = self.ldap_session.search(
-                    scope=ONELEVEL,
-                    baseDN=self.DN,
-                    attrlist=[''],
-                    page_size=self._page_size,
-                    cookie=cookie
-                )
-            except NO_SUCH_OBJECT:
-                # happens if not persisted yet
-                res = list()
-            if isinstance(res, tuple):
-                res, cookie = res
-            for dn, _ in res:
-                key = ensure_text(explode_dn(dn)[0])
-                # do not yield if node is supposed to be deleted
-                if key not in self._deleted_children:
-                    yield key
-            if not cookie:
-                break
-        # also yield keys of children not persisted yet.
-        for key in self._added_children:
-            yield key
+        return self._iter_children(self.child_attrlist)
 
     @finalize
     def __call__(self):
@@ -334,9 +402,13 @@ class LDAPStorage(OdictStorage):
                 self.parent._deleted_children.remove(self.name)
                 self._ldap_delete()
             try:
-                self.nodespaces['__attrs__'].changed = False
+                attrs = self.nodespaces['__attrs__']
             except KeyError:
                 pass
+            else:
+                attrs.changed = False
+                if self._action != ACTION_DELETE:
+                    attrs._set_persisted()
             self.changed = False
             self._action = None
         deleted = [self[key] for key in self._deleted_children]
@@ -458,34 +530,416 @@ class LDAPStorage(OdictStorage):
     @default
     def node_by_dn(self, dn, strict=False):
         """Return node from tree by DN.
+
+        Existence of all not yet loaded nodes on the path is checked with one
+        pipelined request.
         """
-        root = node = self.root
-        base_dn = root.name
-        if not dn.endswith(base_dn):
-            raise ValueError(
-                u'Invalid DN "{0}" for given base DN "{1}"'.format(dn, base_dn))
-        dn = dn[:len(dn) - len(base_dn)].strip(',')
-        for rdn in reversed(explode_dn(dn)):
-            try:
-                node = node[rdn]
-            except KeyError:
+        node = self.root
+        rdns = self._rdns_from_root(dn)
+        # skip nodes already loaded
+        index = 0
+        for rdn in rdns:
+            if rdn not in node.storage:
+                break
+            node = node.storage[rdn]
+            index += 1
+        missing = rdns[index:]
+        if not missing:
+            return node
+        dns = list()
+        child_dn = node.DN
+        for rdn in missing:
+            child_dn = u','.join([rdn, child_dn])
+            dns.append(child_dn)
+        results = node.ldap_session.search_many([dict(
+            scope=BASE,
+            baseDN=child_dn,
+            attrlist=['']  # no need for attrs
+        ) for child_dn in dns], return_errors=True)
+        for rdn, res in zip(missing, results):
+            if isinstance(res, (NO_SUCH_OBJECT, INVALID_DN_SYNTAX)) \
+                    or not res:
                 if strict:
                     raise ValueError(
                         u'Tree contains no node by given DN. '
                         u'Failed at RDN {}'.format(rdn)
                     )
                 return None
+            if isinstance(res, Exception):
+                raise res
+            if rdn in node.storage:
+                # loaded in the meantime or added but not persisted yet
+                node = node.storage[rdn]
+                continue
+            node = node._store_child(node._new_child(rdn), res[0][0])
         return node
 
+    @default
+    def load_children(self, attrlist=None):
+        """Load children with one paged one level search and return them.
+
+        Children not loaded yet are created from the search result instead of
+        searching each of them by DN. If ``attrlist`` is ``['*']``, which is
+        the default, the returned attributes are used as loaded attributes of
+        children whose attributes are not loaded yet, thus accessing them
+        does not search again.
+
+        Set ``child_attrlist`` to do so whenever the node gets iterated.
+        """
+        if attrlist is None:
+            attrlist = ['*']
+        return [
+            self.storage[key] for key in self._iter_children(attrlist)
+        ]
+
+    @default
+    def _iter_children(self, attrlist):
+        # generator yielding child keys. If ``attrlist`` is given, it is used
+        # for the one level search and children are created from the result.
+        if self.name is None:
+            return
+
+        def fetch(cookie):
+            try:
+                res = self.ldap_session.search(
+                    scope=ONELEVEL,
+                    baseDN=self.DN,
+                    attrlist=attrlist or [''],  # no need for attrs
+                    page_size=self._page_size,
+                    cookie=cookie or ''
+                )
+            except NO_SUCH_OBJECT:
+                # happens if not persisted yet
+                res = list()
+            if isinstance(res, tuple):
+                return res
+            return res, None
+        prefetch = getattr(self.ldap_session._props, 'page_prefetch', 0)
+        if prefetch:
+            pages = prefetch_pages(
+                fetch,
+                depth=prefetch,
+                abandon=self.ldap_session.abandon_paged
+            )
+        else:
+            pages = self._fetch_pages(fetch)
+        seed = list(attrlist or []) == ['*']
+        for res in pages:
+            for dn, attrs in res:
+                key = ensure_text(explode_dn(dn)[0])
+                # do not yield if node is supposed to be deleted
+                if key in self._deleted_children:
+                    continue
+                if attrlist:
+                    self._child_from_entry(key, dn, attrs if seed else None)
+                yield key
+        # also yield keys of children not persisted yet.
+        for key in self._added_children:
+            yield key
+
+    @default
+    def _child_from_entry(self, key, dn, attrs=None):
+        # return child node for search result entry. Node gets created if not
+        # loaded yet. ``attrs`` are used as loaded attributes if the node has
+        # not loaded attributes yet.
+        try:
+            val = self.storage[key]
+        except KeyError:
+            val = self._store_child(self._new_child(key), dn)
+        if attrs is not None:
+            val._use_attrs(attrs)
+        return val
+
+    @default
+    def _use_attrs(self, attrs):
+        # use ``attrs`` returned by a search as loaded attributes if
+        # attributes are not loaded yet. They get set on first access.
+        if not self.changed and '__attrs__' not in self.nodespaces:
+            self._seed_attrs = attrs
+
+    @default
+    def bulk_add(self, children, check_existence=False, window=ADD_WINDOW,
+                 timeout=None):
+        """Add children and write them immediately.
+
+        Other than setting children one by one and calling the node, the
+        directory is not searched for each child whether it exists already,
+        and the adds are pipelined, see ``LDAPSession.add_many``. Children
+        failing to be added are removed again and reported instead of
+        aborting. Children of the added children are written on next call.
+
+        :param children: Iterable of ``(key, node)`` tuples.
+        :param check_existence: Flag whether to search for existing entries
+            first. Existing ones are reported with ``ldap.ALREADY_EXISTS``
+            and not added. The searches are pipelined as well.
+        :param window: Maximum number of adds waiting for their result.
+        :param timeout: Seconds each add may wait for its result.
+        :return: ``LDAPBulkResult`` instance.
+        """
+        result = LDAPBulkResult()
+        children = [(ensure_text(key), val) for key, val in children]
+        if check_existence:
+            existing = self._existing_children(
+                [key for key, val in children],
+                window
+            )
+            for key in existing:
+                result.errors[key] = ALREADY_EXISTS({
+                    'desc': u'Already exists',
+                    'matched': self.child_dn(key)
+                })
+            children = [
+                (key, val) for key, val in children if key not in existing
+            ]
+        self._skip_existence_check = True
+        try:
+            for key, val in children:
+                self[key] = val
+        finally:
+            self._skip_existence_check = False
+        keys = [key for key, val in children]
+        errors = self.ldap_session.add_many(
+            [(self.storage[key].DN, self.storage[key]._ldap_entry())
+             for key in keys],
+            window=window,
+            timeout=timeout
+        )
+        for key, error in zip(keys, errors):
+            self._added_children.remove(key)
+            if error is not None:
+                del self.storage[key]
+                result.errors[key] = error
+                continue
+            child = self.storage[key]
+            attrs = child.attrs
+            attrs.changed = False
+            attrs._set_persisted()
+            child._action = None
+            child.changed = False
+            result.added.append(key)
+        self.changed = False
+        return result
+
+    @default
+    def _entry_exists(self, dn):
+        # check whether entry at ``dn`` exists in the directory
+        try:
+            self.ldap_session.search(
+                scope=BASE,
+                baseDN=dn,
+                attrlist=['']  # no need for attrs
+            )
+        except (NO_SUCH_OBJECT, INVALID_DN_SYNTAX):
+            return False
+        return True
+
+    @default
+    def _existing_children(self, keys, window):
+        # return set of ``keys`` of existing child entries. Searched with
+        # pipelined searches in chunks of ``window``.
+        existing = set()
+        for start in range(0, len(keys), window):
+            chunk = keys[start:start + window]
+            results = self.ldap_session.search_many([dict(
+                scope=BASE,
+                baseDN=self.child_dn(key),
+                attrlist=['']  # no need for attrs
+            ) for key in chunk], return_errors=True)
+            for key, res in zip(chunk, results):
+                if isinstance(res, (NO_SUCH_OBJECT, INVALID_DN_SYNTAX)):
+                    continue
+                if isinstance(res, Exception):
+                    raise res
+                existing.add(key)
+        return existing
+
+    @default
+    def add_values(self, name, values):
+        """Add ``values`` to attribute ``name`` of the directory entry.
+
+        Unlike setting the attribute on ``attrs``, the attribute values are
+        neither loaded nor written as a whole, which matters for attributes
+        with many values like group members. Values already present are
+        skipped. Values are written immediately if the entry exists.
+        """
+        self._modify_values(MOD_ADD, name, values)
+
+    @default
+    def delete_values(self, name, values):
+        """Delete ``values`` from attribute ``name`` of the directory entry.
+
+        See ``add_values``. Values not present are skipped.
+        """
+        self._modify_values(MOD_DELETE, name, values)
+
+    @default
+    def _modify_values(self, op, name, values):
+        binary = self.root._binary_attributes
+        if name not in binary:
+            values = [decode(value) for value in values]
+        values = list(odict.fromkeys(values))
+        if not values:
+            return
+        if self._action == ACTION_ADD:
+            # entry not persisted yet
+            attrs = self.attrs
+            added, deleted = (values, ()) if op == MOD_ADD else ((), values)
+            value = attrs._changed_values(
+                name,
+                attrs.get(name, list()),
+                added,
+                deleted
+            )
+            if value is not None:
+                attrs[name] = value
+            elif name in attrs:
+                del attrs[name]
+            return
+        present = self._present_values(name, values)
+        if op == MOD_ADD:
+            values = [value for value in values if value not in present]
+        else:
+            values = [value for value in values if value in present]
+        if not values:
+            return
+        self.ldap_session.modify(self.DN, [(
+            op,
+            name,
+            values if name in binary else encode(values)
+        )])
+        attrs = self.nodespaces.get('__attrs__')
+        if attrs is None:
+            return
+        if op == MOD_ADD:
+            attrs._apply_values(name, added=values)
+        else:
+            attrs._apply_values(name, deleted=values)
+
+    @default
+    def _present_values(self, name, values):
+        # return values of attribute ``name`` present in the directory entry.
+        # Checked by the server with one pipelined search per value, thus
+        # the attribute values are not read. Cached results might be stale,
+        # which makes the modification fail, thus they are bypassed.
+        results = self.ldap_session.search_many([dict(
+            queryFilter=equality_filter(name, value),
+            scope=BASE,
+            baseDN=self.DN,
+            attrlist=[''],  # no need for attrs
+            force_reload=True
+        ) for value in values])
+        return set([value for value, res in zip(values, results) if res])
+
+    @default
+    def _rdns_from_root(self, dn):
+        # RDNs of ``dn`` starting below root node
+        base_dn = self.root.name
+        if not dn.endswith(base_dn):
+            raise ValueError(
+                u'Invalid DN "{0}" for given base DN "{1}"'.format(dn, base_dn))
+        dn = dn[:len(dn) - len(base_dn)].strip(',')
+        return [ensure_text(rdn) for rdn in reversed(explode_dn(dn))]
+
+    @default
+    def _node_from_search(self, dn, attrs=None):
+        # return node for DN returned by a search. The DN is trusted, thus
+        # nodes on the path not loaded yet are created without checking
+        # their existence. ``attrs`` are used as loaded attributes if given.
+        node = self.root
+        rdns = self._rdns_from_root(dn)
+        if not rdns:
+            if attrs is not None:
+                node._use_attrs(attrs)
+            return node
+        for rdn in rdns[:-1]:
+            node = node._child_from_entry(rdn, node.child_dn(rdn))
+        return node._child_from_entry(rdns[-1], dn, attrs)
+
+    @default
+    def _new_child(self, key):
+        # create child node for key. Node is not hooked to storage yet.
+        val = self.child_factory()
+        val.__name__ = key
+        val.__parent__ = self
+        return val
+
+    @default
+    def _store_child(self, val, dn):
+        # hook child node created by ``_new_child`` to storage.
+        # remember DN
+        val._dn = dn
+        val._ldap_session = self.ldap_session
+        self.storage[val.name] = val
+        return val
+
     @default
     @debug
     def search(self, queryFilter=None, criteria=None, attrlist=None,
                relation=None, relation_node=None, exact_match=False,
                or_search=False, or_keys=None, or_values=None,
                page_size=None, cookie=None, get_nodes=False):
-        attrset = set(attrlist or [])
-        attrset.discard('dn')
-        attrset.discard('rdn')
+        matches = self._search_matches(
+            queryFilter=queryFilter,
+            criteria=criteria,
+            attrlist=attrlist,
+            relation=relation,
+            relation_node=relation_node,
+            or_search=or_search,
+            or_keys=or_keys,
+            or_values=or_values,
+            page_size=page_size,
+            cookie=cookie
+        )
+        return self._search_result(
+            matches,
+            attrlist,
+            exact_match=exact_match,
+            get_nodes=get_nodes,
+            cookie=cookie
+        )
+
+    @default
+    def _search_matches(self, queryFilter=None, criteria=None, attrlist=None,
+                        relation=None, relation_node=None, or_search=False,
+                        or_keys=None, or_values=None, page_size=None,
+                        cookie=None):
+        # perform the backend search and return the raw LDAP search result.
+        # Does not touch the node tree, thus safe to be called from another
+        # thread.
+        _filter = self._search_filter(
+            queryFilter=queryFilter,
+            criteria=criteria,
+            relation=relation,
+            relation_node=relation_node,
+            or_search=or_search,
+            or_keys=or_keys,
+            or_values=or_values
+        )
+        logger.debug("LDAP search with filter: \n{0}".format(_filter))
+        return self.ldap_session.search(
+            str(_filter),
+            self.search_scope,
+            baseDN=self.DN,
+            force_reload=self._reload,
+            attrlist=self._search_attrlist(attrlist),
+            page_size=page_size,
+            cookie=cookie
+        )
+
+    @default
+    def async_search(self, **kw):
+        """Coroutine searching the directory without blocking the event loop.
+
+        Accepts the keyword arguments of ``search`` except ``get_nodes``.
+        Requires Python 3.
+        """
+        from node.ext.ldap.aio import node_search
+        return node_search(self, **kw)
+
+    @default
+    def _search_filter(self, queryFilter=None, criteria=None, relation=None,
+                       relation_node=None, or_search=False, or_keys=None,
+                       or_values=None):
         # Create queryFilter from all filter definitions
         # filter for this search ANDed with the default filters defined on self
         search_filter = LDAPFilter(queryFilter)
@@ -509,17 +963,20 @@ class LDAPStorage(OdictStorage):
                 _filter &= relation
             else:
                 _filter &= LDAPRelationFilter(relation_node, relation)
-        # perform the backend search
-        logger.debug("LDAP search with filter: \n{0}".format(_filter))
-        matches = self.ldap_session.search(
-            str(_filter),
-            self.search_scope,
-            baseDN=self.DN,
-            force_reload=self._reload,
-            attrlist=list(attrset),
-            page_size=page_size,
-            cookie=cookie
-        )
+        return _filter
+
+    @default
+    def _search_attrlist(self, attrlist):
+        # LDAP attrlist for search. ``dn`` and ``rdn`` are computed from result
+        attrset = set(attrlist or [])
+        attrset.discard('dn')
+        attrset.discard('rdn')
+        return list(attrset)
+
+    @default
+    def _search_result(self, matches, attrlist, exact_match=False,
+                       get_nodes=False, cookie=None):
+        # create search result from LDAP search result
         if type(matches) is tuple:
             matches, cookie = matches
         # check exact match
@@ -528,55 +985,193 @@ class LDAPStorage(OdictStorage):
         if exact_match and len(matches) == 0:
             raise ValueError(u"Exact match asked but result length is zero")
         # extract key and desired attributes
-        res = []
-        for dn, attrs in matches:
-            dn = decode(dn)
-            if attrlist is not None:
-                resattr = dict()
-                for k, v in six.iteritems(attrs):
-                    if k in attrlist:
-                        # Check binary binary attribute directly from root
-                        # data to avoid initing attrs for a simple search.
-                        if k in self.root._binary_attributes:
-                            resattr[decode(k)] = v
-                        else:
-                            resattr[decode(k)] = decode(v)
-                if 'dn' in attrlist:
-                    resattr[u'dn'] = dn
-                if 'rdn' in attrlist:
-                    rdn = explode_dn(dn)[0]
-                    resattr[u'rdn'] = decode(rdn)
-                if get_nodes:
-                    res.append((self.node_by_dn(dn, strict=True), resattr))
-                else:
-                    res.append((dn, resattr))
-            else:
-                if get_nodes:
-                    res.append(self.node_by_dn(dn, strict=True))
-                else:
-                    res.append(dn)
+        res = [
+            self._search_result_item(dn, attrs, attrlist, get_nodes=get_nodes)
+            for dn, attrs in matches
+        ]
         if cookie is not None:
             return (res, cookie)
         return res
 
     @default
-    def batched_search(self, page_size=None, search_func=None, **kw):
+    def _search_result_item(self, dn, attrs, attrlist, get_nodes=False):
+        # create search result item from LDAP search result entry
+        dn = decode(dn)
+        if get_nodes:
+            # all attributes are returned if none but ``dn`` and ``rdn`` or
+            # all are requested
+            if set(attrlist or []).issubset(['dn', 'rdn', '*']):
+                node = self._node_from_search(dn, attrs)
+            else:
+                node = self._node_from_search(dn)
+        if attrlist is not None:
+            resattr = dict()
+            for k, v in six.iteritems(attrs):
+                if k in attrlist:
+                    # Check binary binary attribute directly from root
+                    # data to avoid initing attrs for a simple search.
+                    if k in self.root._binary_attributes:
+                        resattr[decode(k)] = v
+                    else:
+                        resattr[decode(k)] = decode(v)
+            if 'dn' in attrlist:
+                resattr[u'dn'] = dn
+            if 'rdn' in attrlist:
+                rdn = explode_dn(dn)[0]
+                resattr[u'rdn'] = decode(rdn)
+            if get_nodes:
+                return (node, resattr)
+            return (dn, resattr)
+        if get_nodes:
+            return node
+        return dn
+
+    @default
+    def batched_search(self, page_size=None, search_func=None, stream=False,
+                       prefetch=None, **kw):
         """Search generator function which does paging for us.
+
+        If ``stream`` is True, items are yielded as soon as they arrive from
+        the server instead of after the whole page has been read. Streamed
+        results are not cached and ``exact_match`` is not supported.
+
+        If ``prefetch`` is > 0, up to this number of following pages are
+        fetched in a background thread while the current page is consumed.
+        Defaults to ``page_prefetch`` of props. Prefetching is not supported
+        for streamed results. The background thread only fetches the raw
+        search results, nodes are created by the iterating thread. Thus
+        custom ``search_func`` can't be prefetched with ``get_nodes``.
         """
         if page_size is None:
             page_size = self.ldap_session._props.page_size
+        if stream:
+            if search_func is not None:
+                raise ValueError(u"Custom search_func can't be streamed")
+            if kw.get('exact_match'):
+                raise ValueError(u"Exact match can't be streamed")
+            if prefetch:
+                raise ValueError(u"Streamed results can't be prefetched")
+        if prefetch is None:
+            prefetch = getattr(self.ldap_session._props, 'page_prefetch', 0)
+        if prefetch and search_func is not None and kw.get('get_nodes'):
+            raise ValueError(
+                u"Nodes of custom search_func can't be prefetched"
+            )
+        kw['page_size'] = page_size
+        if stream:
+            cookie = None
+            try:
+                while True:
+                    kw['cookie'] = cookie
+                    with self._search_stream(**kw) as results:
+                        for dn, attrs in results:
+                            yield self._search_result_item(
+                                dn,
+                                attrs,
+                                kw.get('attrlist'),
+                                get_nodes=kw.get('get_nodes', False)
+                            )
+                    cookie = results.cookie
+                    if not cookie:
+                        break
+            finally:
+                self.ldap_session.abandon_paged(cookie)
+            return
+
+        if prefetch and search_func is None:
+            # the search result is converted by this thread, since creating
+            # nodes modifies the tree
+            search_kw = dict(kw)
+            attrlist = search_kw.get('attrlist')
+            exact_match = search_kw.pop('exact_match', False)
+            get_nodes = search_kw.pop('get_nodes', False)
+
+            def fetch(cookie):
+                matches = self._search_matches(cookie=cookie, **search_kw)
+                if isinstance(matches, tuple):
+                    return matches
+                return matches, None
+            pages = prefetch_pages(
+                fetch,
+                depth=prefetch,
+                abandon=self.ldap_session.abandon_paged
+            )
+            for matches in pages:
+                for item in self._search_result(
+                    matches,
+                    attrlist,
+                    exact_match=exact_match,
+                    get_nodes=get_nodes
+                ):
+                    yield item
+            return
         if search_func is None:
             search_func = self.search
-        matches = []
-        cookie = None
-        kw['page_size'] = page_size
-        while True:
-            kw['cookie'] = cookie
-            matches, cookie = search_func(**kw)
+
+        def fetch(cookie):
+            return search_func(cookie=cookie, **kw)
+        if prefetch:
+            pages = prefetch_pages(
+                fetch,
+                depth=prefetch,
+                abandon=self.ldap_session.abandon_paged
+            )
+        else:
+            pages = self._fetch_pages(fetch)
+        for matches in pages:
             for item in matches:
                 yield item
-            if not cookie:
-                break
+
+    @default
+    def _fetch_pages(self, fetch):
+        # generator yielding pages of a paged search one after another.
+        # see ``node.ext.ldap.base.prefetch_pages`` for ``fetch``.
+        # The connection of a search abandoned before its last page is
+        # released.
+        cookie = None
+        try:
+            while True:
+                page, cookie = fetch(cookie)
+                yield page
+                if not cookie:
+                    break
+        finally:
+            self.ldap_session.abandon_paged(cookie)
+
+    @default
+    def _search_stream(self, queryFilter=None, criteria=None, attrlist=None,
+                       relation=None, relation_node=None, exact_match=False,
+                       or_search=False, or_keys=None, or_values=None,
+                       page_size=None, cookie=None, get_nodes=False):
+        # return ``LDAPSearchStream`` for search arguments
+        _filter = self._search_filter(
+            queryFilter=queryFilter,
+            criteria=criteria,
+            relation=relation,
+            relation_node=relation_node,
+            or_search=or_search,
+            or_keys=or_keys,
+            or_values=or_values
+        )
+        logger.debug("LDAP stream search with filter: \n{0}".format(_filter))
+        return self.ldap_session.search_stream(
+            str(_filter),
+            self.search_scope,
+            baseDN=self.DN,
+            attrlist=self._search_attrlist(attrlist),
+            page_size=page_size,
+            cookie=cookie
+        )
+
+    @default
+    def async_batched_search(self, page_size=None, **kw):
+        """Asynchronous search generator which does paging for us.
+
+        Accepts the keyword arguments of ``async_search``. Use with
+        ``async for``. Requires Python 3.
+        """
+        from node.ext.ldap.aio import node_batched_search
+        return node_batched_search(self, page_size=page_size, **kw)
 
     @default
     def invalidate(self, key=None):
@@ -629,18 +1224,26 @@ class LDAPStorage(OdictStorage):
     @default
     def _ldap_add(self):
         # adds self to the ldap directory.
+        self.ldap_session.add(self.DN, self._ldap_entry())
+
+    @default
+    def _ldap_entry(self):
+        # return encoded attributes of self for adding to the ldap directory.
         attrs = {}
         for key, value in self.attrs.items():
             if not self.attrs.is_binary(key):
                 value = encode(value)
             attrs[key] = value
-        self.ldap_session.add(self.DN, attrs)
+        return attrs
 
     @default
     def _ldap_modify(self):
         # modifies attributs of self on the ldap directory.
         modlist = list()
-        orgin = self.attributes_factory(name='__attrs__', parent=self)
+        # diff against values persisted when loading attributes
+        orgin = self.attrs._persisted_values()
+        if orgin is None:
+            orgin = self.attributes_factory(name='__attrs__', parent=self)
         for key in orgin:
             # MOD_DELETE
             if key not in self.attrs:
@@ -654,6 +1257,9 @@ class LDAPStorage(OdictStorage):
             if key not in orgin:
                 moddef = (MOD_ADD, key, value)
                 modlist.append(moddef)
+            # MOD_DELETE and MOD_ADD of changed values
+            elif self.attrs.is_multivalued(key):
+                modlist += self._values_modlist(key, orgin[key], value)
             # MOD_REPLACE
             elif self.attrs[key] != orgin[key]:
                 moddef = (MOD_REPLACE, key, value)
@@ -661,6 +1267,26 @@ class LDAPStorage(OdictStorage):
         if modlist:
             self.ldap_session.modify(self.DN, modlist)
 
+    @default
+    def _values_modlist(self, key, orgin, value):
+        # modlist deleting and adding changed values of multi valued
+        # attribute ``key``. ``value`` is encoded already.
+        orgin = orgin if isinstance(orgin, list) else [orgin]
+        if not self.attrs.is_binary(key):
+            orgin = encode(orgin)
+        value = value if isinstance(value, list) else [value]
+        orgin_set = set(orgin)
+        value_set = set(value)
+        modlist = list()
+        deleted = [v for v in orgin if v not in value_set]
+        if deleted:
+            modlist.append((MOD_DELETE, key, deleted))
+        # values set twice must be added once
+        added = [v for v in odict.fromkeys(value) if v not in orgin_set]
+        if added:
+            modlist.append((MOD_ADD, key, added))
+        return modlist
+
     @default
     def _ldap_delete(self):
         # delete self from the ldap-directory.
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""asyncio counterparts of the LDAP session, node and users search and
+authentication API.
+
+Operations are sent with the asynchronous python-ldap API and results are
+collected by polling with a zero timeout, thus many operations can be pending
+on one connection without blocking the event loop or using a thread per
+operation.
+
+This module requires Python 3.5 or later.
+"""
+from collections import deque
+from node.ext.ldap.base import LDAPCommunicator
+from node.ext.ldap.base import LDAPConnector
+from node.ext.ldap.base import ensure_text
+from node.ext.ldap.base import normalize_dn
+from node.ext.ldap.base import paged_search_controls
+from node.ext.ldap.base import paged_search_cookie
+from node.ext.ldap.base import search_continues
+from node.ext.ldap.scope import BASE
+import asyncio
+import ldap
+import logging
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+# initial and maximum delay in seconds between polls for pending results
+POLL_DELAY_MIN = 0.0005
+POLL_DELAY_MAX = 0.02
+
+
+async def poll_result(con, msgid, poll_interval=POLL_DELAY_MAX):
+    """Wait for the result of message ``msgid`` on connection ``con``
+    without blocking the event loop.
+
+    :return: Tuple containing ``(rtype, rdata, rctrls)``.
+    """
+    delay = POLL_DELAY_MIN
+    try:
+        while True:
+            rtype, rdata, rmsgid, rctrls = con.result3(msgid, 1, 0)
+            if rtype is not None:
+                return rtype, rdata, rctrls
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, poll_interval)
+    except asyncio.CancelledError:
+        con.abandon(msgid)
+        raise
+
+
+class ResultDispatcher(object):
+    """Collect results for all pending messages of a connection with one
+    polling task and hand them to the waiting coroutines.
+    """
+
+    def __init__(self, con, poll_interval=POLL_DELAY_MAX):
+        self.con = con
+        self.poll_interval = poll_interval
+        self._pending = dict()
+        self._poller = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def result(self, msgid):
+        """Wait for the result of message ``msgid``.
+
+        :return: Tuple containing ``(rtype, rdata, rctrls)``.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending[msgid] = future
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if self._pending.pop(msgid, None) is not None:
+                self.con.abandon(msgid)
+            raise
+
+    def fail(self, exc):
+        """Fail all pending messages with ``exc``.
+        """
+        pending = list(self._pending.values())
+        self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _poll(self):
+        delay = POLL_DELAY_MIN
+        while self._pending:
+            try:
+                rtype, rdata, rmsgid, rctrls = self.con.result3(
+                    ldap.RES_ANY,
+                    1,
+                    0
+                )
+            except ldap.LDAPError as e:
+                info = e.args[0] if e.args and isinstance(e.args[0], dict) \
+                    else dict()
+                future = self._pending.pop(info.get('msgid'), None)
+                if future is None:
+                    # error can not be assigned to a pending message
+                    self.fail(e)
+                elif not future.done():
+                    future.set_exception(e)
+                continue
+            if rtype is None:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.poll_interval)
+                continue
+            delay = POLL_DELAY_MIN
+            future = self._pending.pop(rmsgid, None)
+            if future is not None and not future.done():
+                future.set_result((rtype, rdata, rctrls))
+            # give waiting coroutines a chance to proceed
+            await asyncio.sleep(0)
+
+
+class AsyncLDAPSession(object):
+    """asyncio counterpart of ``node.ext.ldap.LDAPSession``.
+
+    All operations of a session are multiplexed over one connection. Search
+    results are cached the same way as ``LDAPSession`` does.
+    """
+
+    def __init__(self, props, poll_interval=POLL_DELAY_MAX):
+        """Initialize async LDAP session.
+
+        :param props: ``LDAPProps`` instance.
+        :param poll_interval: Maximum delay in seconds between polls for
+            pending results.
+        """
+        self._props = props
+        self._connector = LDAPConnector(props=props)
+        self._communicator = LDAPCommunicator(self._connector)
+        self.poll_interval = poll_interval
+        self.baseDN = ''
+        self._dispatcher = None
+        self._connect_lock = None
+        self._auth_cons = list()
+        self._auth_semaphore = None
+
+    async def ensure_connection(self):
+        """Connect and bind if not connected yet.
+        """
+        if self._dispatcher is not None:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._dispatcher is not None:
+                return
+            connector = self._connector
+            # STARTTLS blocks until the handshake completed
+            loop = asyncio.get_event_loop()
+            con = await loop.run_in_executor(None, connector.auth_connect)
+            try:
+                msgid = con.simple_bind(connector._bindDN, connector._bindPW)
+                await poll_result(con, msgid, self.poll_interval)
+            except BaseException:
+                self._close(con)
+                raise
+            self._dispatcher = ResultDispatcher(con, self.poll_interval)
+
+    async def search(self, queryFilter='(objectClass=*)', scope=BASE,
+                     baseDN=None, force_reload=False, attrlist=None,
+                     attrsonly=0, page_size=None, cookie=None):
+        """Search the directory. See ``LDAPSession.search``.
+        """
+        if not queryFilter:
+            queryFilter = '(objectClass=*)'
+        if baseDN is None:
+            baseDN = self.baseDN
+            if not baseDN:
+                raise ValueError(u"baseDN unset.")
+        if page_size and cookie is None:
+            cookie = ''
+        serverctrls = paged_search_controls(page_size, cookie)
+        communicator = self._communicator
+        paged = bool(page_size)
+        # cached results and negative cache are shared with synchronous
+        # searches of the communicator, thus they are accessed the same way
+        negative = None
+        if communicator._connector._negative_cache_timeout and not paged:
+            search_id = communicator._search_id(
+                queryFilter,
+                scope,
+                baseDN,
+                attrlist,
+                attrsonly
+            )
+            negative = communicator._negative_cache()
+            known, error = (False, None) if force_reload \
+                else negative.get(search_id)
+            if known:
+                if error is not None:
+                    raise error.__class__(*error.args)
+                return []
+        key = None
+        # see ``LDAPCommunicator.search`` for caching of paged results
+        if communicator._cache and not (paged and cookie):
+            key = communicator.search_key(
+                queryFilter,
+                scope,
+                baseDN,
+                attrlist,
+                attrsonly,
+                page_size,
+                cookie
+            )
+            stats = communicator._search_stats()
+            base = normalize_dn(baseDN)
+            started = time.time()
+            res, stale = communicator._cache_get(key, force_reload, paged)
+            # stale results are searched again right away
+            if res is not None and not stale:
+                stats.hit('search', base, time.time() - started)
+                return self._search_result(res, page_size)
+            started = time.time()
+        await self.ensure_connection()
+        if type(attrlist) in (list, tuple):
+            attrlist = [str(_) for _ in attrlist]
+        dispatcher = self._dispatcher
+        try:
+            msgid = dispatcher.con.search_ext(
+                baseDN,
+                scope,
+                queryFilter,
+                attrlist,
+                attrsonly,
+                serverctrls=serverctrls
+            )
+        except ldap.SERVER_DOWN:
+            self._reset()
+            raise
+        except ldap.LDAPError as e:
+            logger.warn(str(e))
+            return []
+        try:
+            rtype, results, rctrls = await dispatcher.result(msgid)
+        except ldap.SERVER_DOWN:
+            self._reset()
+            raise
+        except ldap.NO_SUCH_OBJECT as e:
+            if negative is not None:
+                negative.set(
+                    search_id,
+                    normalize_dn(baseDN),
+                    communicator._connector._negative_cache_timeout,
+                    error=e
+                )
+            raise
+        if negative is not None and results:
+            negative.forget(search_id)
+        elif negative is not None:
+            negative.set(
+                search_id,
+                normalize_dn(baseDN),
+                communicator._connector._negative_cache_timeout
+            )
+        next_cookie = paged_search_cookie(rctrls)
+        if next_cookie is not None:
+            res = (results, next_cookie)
+        else:
+            res = results
+        if key is not None:
+            stats.miss('search', base, time.time() - started)
+            if not search_continues(res):
+                communicator._cache_set(key, res, paged)
+        return self._search_result(res, page_size)
+
+    async def authenticate(self, dn, pw):
+        """Verify credentials, but don't rebind the session to that user.
+
+        Binds are done on separate connections, at most ``auth_pool_size``
+        of props at once, or 10 if unset. Connections are reused.
+        """
+        if self._auth_semaphore is None:
+            self._auth_semaphore = asyncio.Semaphore(
+                self._connector._auth_pool_size or 10
+            )
+        async with self._auth_semaphore:
+            if self._auth_cons:
+                con = self._auth_cons.pop()
+            else:
+                loop = asyncio.get_event_loop()
+                con = await loop.run_in_executor(
+                    None,
+                    self._connector.auth_connect
+                )
+            try:
+                msgid = con.simple_bind(dn, pw)
+                await poll_result(con, msgid, self.poll_interval)
+            except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM):
+                self._auth_cons.append(con)
+                return False
+            except BaseException:
+                self._close(con)
+                raise
+            self._auth_cons.append(con)
+            return True
+
+    def unbind(self):
+        """Close all connections of this session.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.fail(ldap.SERVER_DOWN({
+                'desc': u'Session closed'
+            }))
+            self._close(self._dispatcher.con)
+            self._dispatcher = None
+        while self._auth_cons:
+            self._close(self._auth_cons.pop())
+        self._connect_lock = None
+        self._auth_semaphore = None
+
+    def _reset(self):
+        # forget broken connection, next operation reconnects.
+        dispatcher = self._dispatcher
+        self._dispatcher = None
+        if dispatcher is not None:
+            dispatcher.fail(ldap.SERVER_DOWN({
+                'desc': u"Can't contact LDAP server"
+            }))
+            self._close(dispatcher.con)
+
+    def _search_result(self, res, page_size):
+        if page_size:
+            res, cookie = res
+        # ActiveDirectory returns entries with dn None, which can be ignored
+        res = [x for x in res if x[0] is not None]
+        if page_size:
+            return res, cookie
+        return res
+
+    def _close(self, con):
+        try:
+            con.unbind_s()
+        except Exception as e:
+            logger.debug(u'Failed to close LDAP connection: {}'.format(e))
+
+
+def async_session(session):
+    """Return ``AsyncLDAPSession`` for given ``LDAPSession``. It gets created
+    on first access and shares props and base DN with ``session``.
+    """
+    asession = getattr(session, '_async_session', None)
+    if asession is None:
+        asession = session._async_session = AsyncLDAPSession(session._props)
+    asession.baseDN = session.baseDN
+    return asession
+
+
+async def node_search(node, queryFilter=None, criteria=None, attrlist=None,
+                      relation=None, relation_node=None, exact_match=False,
+                      or_search=False, or_keys=None, or_values=None,
+                      page_size=None, cookie=None):
+    """Async counterpart of ``LDAPNode.search``. Returning nodes is not
+    supported.
+    """
+    _filter = node._search_filter(
+        queryFilter=queryFilter,
+        criteria=criteria,
+        relation=relation,
+        relation_node=relation_node,
+        or_search=or_search,
+        or_keys=or_keys,
+        or_values=or_values
+    )
+    logger.debug("LDAP async search with filter: \n{0}".format(_filter))
+    matches = await async_session(node.ldap_session).search(
+        str(_filter),
+        node.search_scope,
+        baseDN=node.DN,
+        force_reload=node._reload,
+        attrlist=node._search_attrlist(attrlist),
+        page_size=page_size,
+        cookie=cookie
+    )
+    return node._search_result(
+        matches,
+        attrlist,
+        exact_match=exact_match,
+        cookie=cookie
+    )
+
+
+class NodeBatchedSearch(object):
+    """Async iterator over the results of a paged node search.
+
+    Implemented as class since async generators require Python 3.6.
+    """
+
+    def __init__(self, node, page_size, kw):
+        self._node = node
+        self._kw = kw
+        self._kw['page_size'] = page_size
+        self._items = deque()
+        self._cookie = None
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self._items:
+                return self._items.popleft()
+            if self._exhausted:
+                raise StopAsyncIteration
+            self._kw['cookie'] = self._cookie
+            matches, self._cookie = await node_search(self._node, **self._kw)
+            self._items.extend(matches)
+            self._exhausted = not self._cookie
+
+
+def node_batched_search(node, page_size=None, **kw):
+    """Async counterpart of ``LDAPNode.batched_search``.
+
+    :return: ``NodeBatchedSearch`` instance to be used with ``async for``.
+    """
+    if page_size is None:
+        page_size = node.ldap_session._props.page_size
+    return NodeBatchedSearch(node, page_size, kw)
+
+
+async def users_id_for_login(users, login):
+    """Async counterpart of ``LDAPUsers.id_for_login``.
+    """
+    if not users._login_attr:
+        return ensure_text(login)
+    criteria = {users._login_attr: login}
+    attrlist = [users._key_attr]
+    res = await node_search(
+        users.context,
+        criteria=criteria,
+        attrlist=attrlist
+    )
+    if not res:
+        return ensure_text(login)
+    if len(res) > 1:  # pragma: no cover
+        msg = u'More than one principal with login "{0}" found.'
+        logger.warning(msg.format(login))
+    return ensure_text(res[0][1][users._key_attr][0])
+
+
+async def users_authenticate(users, login=None, pw=None):
+    """Async counterpart of ``LDAPUsers.authenticate``.
+    """
+    user_id = await users_id_for_login(users, login)
+    criteria = {users._key_attr: user_id}
+    attrlist = ['dn']
+    if users.expiresAttr:
+        attrlist.append(users.expiresAttr)
+    try:
+        res = await node_search(
+            users.context,
+            criteria=criteria,
+            attrlist=attrlist
+        )
+    except ldap.NO_SUCH_OBJECT:  # pragma: no cover
+        return False
+    authorized = users._authenticate_entry(user_id, res)
+    if authorized is not True:
+        return authorized
+    user_dn = res[0][1]['dn']
+    session = async_session(users.context.ldap_session)
+    authenticated = await session.authenticate(user_dn, pw)
+    return authenticated and user_id or False
@@ -1,18 +1,53 @@
 # -*- coding: utf-8 -*-
 from bda.cache import ICacheManager
 from bda.cache.interfaces import INullCacheProvider
+from collections import deque
+from contextlib import contextmanager
+from ldap.dn import explode_dn
+from node.ext.ldap.breaker import FAILURES
+from node.ext.ldap.breaker import get_breaker
+from node.ext.ldap.cache import GENERATION_KEY_PREFIX
+from node.ext.ldap.cache import get_negative_cache
 from node.ext.ldap.cache import nullcacheProviderFactory
+from node.ext.ldap.flight import FlightTimeout
+from node.ext.ldap.flight import get_flights
 from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.pool import get_pool
 from node.ext.ldap.properties import LDAPProps
+from node.ext.ldap.replica import get_replicas
+from node.ext.ldap.scope import BASE
+from node.ext.ldap.scope import ONELEVEL
+from node.ext.ldap.scope import SUBTREE
+from node.ext.ldap.stats import get_cache_stats
 from zope.component import queryUtility
 import hashlib
 import ldap
 import logging
 import six
+import threading
+import time
+import uuid
 
 
 logger = logging.getLogger('node.ext.ldap')
 
+# keys of stale cached searches currently refreshed in the background
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+# default number of adds of ``LDAPCommunicator.add_many`` waiting for their
+# result at once
+ADD_WINDOW = 100
+
+# default number of searches of ``LDAPCommunicator.search_many`` waiting for
+# their result at once
+SEARCH_WINDOW = 100
+
+# maximum number of parent DNs of written entries a communicator remembers
+# for the read your writes window. Beyond, they are collapsed to their common
+# parent.
+WRITTEN_MAX = 100
+
 
 def testLDAPConnectivity(server=None, port=None, props=None):
     """Function to test the availability of the LDAP Server.
@@ -58,12 +93,258 @@ def cache_key(parts):
     return u'-'.join([dec(p) for p in parts])
 
 
+def paged_search_controls(page_size, cookie):
+    """Return server controls list for a search.
+
+    :param page_size: Number of items per page, when doing pagination.
+    :param cookie: Cookie returned by previous search with pagination.
+    """
+    if page_size:
+        if cookie is None:
+            cookie = ''
+        return [ldap.controls.libldap.SimplePagedResultsControl(
+            criticality=True, size=page_size, cookie=cookie)]
+    if cookie:
+        raise ValueError('cookie passed without page_size')
+    return []
+
+
+def paged_search_cookie(rctrls):
+    """Return paging cookie from search result controls or None if search was
+    not paged.
+    """
+    ctype = ldap.controls.libldap.SimplePagedResultsControl.controlType
+    pctrls = [c for c in rctrls if c.controlType == ctype]
+    if pctrls:
+        return pctrls[0].cookie
+    return None
+
+
+class LDAPOperationTimeout(ldap.TIMEOUT):
+    """Raised if an LDAP operation did not complete before its deadline.
+
+    The pending operation has been abandoned if possible.
+    """
+
+
+class FailedSearchResult(list):
+    """Empty result of a search which could not be sent to the server.
+
+    Neither cached nor remembered in the negative cache, since it does not
+    tell anything about the directory.
+    """
+
+
+def operation_deadline(timeout):
+    """Return absolute deadline for an operation starting now or ``None`` if
+    ``timeout`` is ``None``.
+
+    :param timeout: Seconds the operation may take.
+    """
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+
+def remaining_timeout(deadline, limit=None):
+    """Return seconds left until ``deadline``, but not more than ``limit``.
+
+    If ``deadline`` is ``None``, ``limit`` is returned.
+    """
+    if deadline is None:
+        return limit
+    remaining = max(deadline - time.time(), 0)
+    if limit is not None:
+        remaining = min(remaining, limit)
+    return remaining
+
+
+def wait_result(con, msgid, deadline=None, all=1, abandon=True):
+    """Wait for result of message ``msgid`` on connection ``con``.
+
+    :param con: ``ldap.ldapobject.LDAPObject`` instance.
+    :param msgid: Message id of the pending operation.
+    :param deadline: Absolute time as returned by ``operation_deadline`` until
+        the result is expected. ``None`` means wait forever.
+    :param all: Passed to ``result3``. If 0, results of searches are returned
+        entry by entry.
+    :param abandon: Flag whether to abandon the operation if deadline has been
+        exceeded. Binds can not be abandoned.
+    :raise LDAPOperationTimeout: If deadline has been exceeded.
+    :return: Tuple containing ``(rtype, rdata, rmsgid, rctrls)``.
+    """
+    if deadline is None:
+        return con.result3(msgid, all)
+    remaining = deadline - time.time()
+    if remaining > 0:
+        try:
+            return con.result3(msgid, all, remaining)
+        except ldap.TIMEOUT:
+            pass
+    if abandon:
+        try:
+            con.abandon(msgid)
+        except ldap.LDAPError as e:  # pragma: no cover
+            logger.debug(u'Failed to abandon LDAP operation: {}'.format(e))
+    raise LDAPOperationTimeout({
+        'desc': u'LDAP operation timed out',
+        'info': u'No result for message {} before deadline'.format(msgid),
+        'msgid': msgid
+    })
+
+
+def simple_bind(con, dn, pw, deadline=None):
+    """Bind connection ``con`` with ``dn`` and ``pw``.
+
+    If ``deadline`` is exceeded, ``LDAPOperationTimeout`` is raised and the
+    connection must not be used any more.
+    """
+    if deadline is None:
+        con.simple_bind_s(dn, pw)
+        return
+    wait_result(con, con.simple_bind(dn, pw), deadline, abandon=False)
+    # ``ReconnectLDAPObject`` only remembers synchronous binds. Remember it
+    # explicitly, otherwise reconnected connections are anonymous.
+    store_last_bind = getattr(con, '_store_last_bind', None)
+    if store_last_bind is not None:
+        store_last_bind(con.simple_bind_s, dn, pw)
+
+
+def prefetch_pages(fetch, depth=1, abandon=None):
+    """Generator yielding the pages of a paged search, while following pages
+    are fetched by a background thread.
+
+    The next page is requested as soon as the cookie of the previous page is
+    known, thus the server builds the next page while the caller processes
+    the current one.
+
+    :param fetch: Callable getting passed the paging cookie, ``None`` for the
+        first page, and returning ``(page, cookie)``.
+    :param depth: Maximum number of fetched pages waiting to be consumed.
+    :param abandon: Optional callable getting passed the cookie of the last
+        page fetched if the generator is closed before all pages have been
+        fetched. Gets called in the thread which fetched the pages.
+    """
+    if depth < 1:
+        raise ValueError(u'Prefetch depth must be >= 1')
+    pages = six.moves.queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # return False if consumer has gone away
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except six.moves.queue.Full:
+                continue
+        return False
+
+    def produce():
+        cookie = None
+        try:
+            while True:
+                page, cookie = fetch(cookie)
+                if not put((page, None)):
+                    return
+                if not cookie:
+                    break
+        except Exception as e:
+            put((None, e))
+            return
+        finally:
+            if cookie and abandon is not None:
+                abandon(cookie)
+        # end of result marker
+        put((None, None))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            page, error = pages.get()
+            if error is not None:
+                raise error
+            if page is None:
+                break
+            yield page
+    finally:
+        stop.set()
+
+
+def search_continues(res):
+    """Check whether search result ``res`` is a page followed by further
+    pages.
+
+    The cookie of such a page is only valid on the connection of the search,
+    thus the page must not be cached.
+    """
+    return isinstance(res, tuple) and bool(res[1])
+
+
 def ensure_text(value):
     if value and not isinstance(value, six.text_type):
         value = value.decode('utf-8')
     return value
 
 
+def normalize_dn(dn):
+    """Return ``dn`` lowercased and without whitespace around its RDNs for
+    comparison.
+    """
+    dn = ensure_text(dn) or u''
+    try:
+        rdns = explode_dn(dn)
+    except ldap.DECODING_ERROR:
+        return dn.lower()
+    return u','.join([rdn.strip().lower() for rdn in rdns])
+
+
+def parent_dn(dn):
+    """Return parent of normalized ``dn`` or ``dn`` itself if it has no
+    parent.
+    """
+    try:
+        rdns = explode_dn(dn)
+    except ldap.DECODING_ERROR:
+        return dn
+    if len(rdns) < 2:
+        return dn
+    return u','.join(rdns[1:])
+
+
+def common_dn(dns):
+    """Return the normalized DN all normalized ``dns`` equal or are located
+    below. Empty string if they have no common RDN.
+    """
+    common = None
+    for dn in dns:
+        try:
+            rdns = explode_dn(dn)
+        except ldap.DECODING_ERROR:
+            return u''
+        if common is None:
+            common = rdns
+            continue
+        size = 0
+        for rdn_1, rdn_2 in zip(reversed(common), reversed(rdns)):
+            if rdn_1 != rdn_2:
+                break
+            size += 1
+        common = common[len(common) - size:]
+        if not common:
+            break
+    return u','.join(common or [])
+
+
+def dn_within(dn, base):
+    """Check whether normalized ``dn`` equals or is located below normalized
+    ``base``.
+    """
+    return dn == base or dn.endswith(u',' + base)
+
+
 def ensure_bytes(value):
     if value and isinstance(value, six.text_type):
         value = value.encode('utf-8')
@@ -92,42 +373,231 @@ class LDAPConnector(object):
         :param props: ``LDAPServerProperties`` instance.
         """
         self.protocol = ldap.VERSION3
+        self._props = props
         self._uri = props.uri
         self._bindDN = props.user
         self._bindPW = props.password
         self._cache = props.cache
         self._cachetimeout = props.timeout
+        self._cache_soft_timeout = getattr(props, 'cache_soft_timeout', None)
+        self._single_flight = getattr(props, 'single_flight', False)
+        self._negative_cache_timeout = getattr(
+            props,
+            'negative_cache_timeout',
+            0
+        )
+        self._negative_cache_size = getattr(
+            props,
+            'negative_cache_size',
+            10000
+        )
         self._start_tls = props.start_tls
         self._ignore_cert = props.ignore_cert
         self._tls_cacert_file = props.tls_cacertfile
         self._retry_max = props.retry_max
         self._retry_delay = props.retry_delay
+        self._pool_size = getattr(props, 'pool_size', 0)
+        self._pool_min_size = getattr(props, 'pool_min_size', 0)
+        self._pool_timeout = getattr(props, 'pool_timeout', 10.)
+        self._pool_idle_timeout = getattr(props, 'pool_idle_timeout', 300.)
+        self._pool_check_interval = getattr(props, 'pool_check_interval', 30.)
+        self._auth_pool_size = getattr(props, 'auth_pool_size', 0)
+        self._auth_pool_timeout = getattr(props, 'auth_pool_timeout', 10.)
+        self._operation_timeout = getattr(props, 'operation_timeout', None)
+        self._breaker_threshold = getattr(props, 'breaker_threshold', 0)
+        self._breaker_reset_timeout = getattr(
+            props,
+            'breaker_reset_timeout',
+            1.
+        )
+        self._breaker_max_reset_timeout = getattr(
+            props,
+            'breaker_max_reset_timeout',
+            60.
+        )
+        self._breaker_fail_fast = getattr(props, 'breaker_fail_fast', True)
+        self._read_uris = list(getattr(props, 'read_uris', None) or [])
+        self._replica_probe_interval = getattr(
+            props,
+            'replica_probe_interval',
+            10.
+        )
+        self._read_your_writes_window = getattr(
+            props,
+            'read_your_writes_window',
+            5.
+        )
+        self._is_replica = False
 
-    def bind(self):
-        """Bind to Server and return the Connection Object.
+    def connect(self, timeout=None):
+        """Create a new connection bound to server and return it.
+
+        :param timeout: Seconds connecting and binding may take. Defaults to
+            ``operation_timeout`` of props.
         """
+        if timeout is None:
+            timeout = self._operation_timeout
+        deadline = operation_deadline(timeout)
         if self._ignore_cert:  # pragma: no cover
             ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
         elif self._tls_cacert_file:  # pragma: no cover
             ldap.set_option(ldap.OPT_X_TLS_CACERTFILE, self._tls_cacert_file)
-        self._con = ldap.ldapobject.ReconnectLDAPObject(
+        retry_max = self._retry_max
+        if self._breaker_threshold and self._breaker_fail_fast:
+            # circuit breaker takes care of retrying, do not block in
+            # reconnect loop
+            retry_max = 1
+        con = ldap.ldapobject.ReconnectLDAPObject(
             self._uri,
             bytes_mode=False,
             bytes_strictness='silent',
-            retry_max=self._retry_max,
+            retry_max=retry_max,
             retry_delay=self._retry_delay
         )
         # Turning referrals off since they cause problems with MS Active
         # Directory More info: https://www.python-ldap.org/faq.html#usage
-        self._con.set_option(ldap.OPT_REFERRALS, 0)
-        self._con.protocol_version = self.protocol
+        con.set_option(ldap.OPT_REFERRALS, 0)
+        con.protocol_version = self.protocol
+        if timeout is not None:
+            con.set_option(ldap.OPT_NETWORK_TIMEOUT, timeout)
         if self._start_tls:  # pragma: no cover
             # ignore in tests for now. nevertheless provide a test environment
             # for TLS and SSL later
-            self._con.start_tls_s()
-        self._con.simple_bind_s(self._bindDN, self._bindPW)
+            con.start_tls_s()
+        try:
+            simple_bind(con, self._bindDN, self._bindPW, deadline)
+        except LDAPOperationTimeout:
+            # connection with pending bind is unusable
+            try:
+                con.unbind_s()
+            except ldap.LDAPError:  # pragma: no cover
+                pass
+            raise
+        return con
+
+    def bind(self, timeout=None):
+        """Bind to Server and return the Connection Object.
+
+        :param timeout: Seconds connecting and binding may take. Defaults to
+            ``operation_timeout`` of props.
+        """
+        self._con = self.connect(timeout=timeout)
         return self._con
 
+    def auth_connect(self):
+        """Create a new unbound connection used for verifying credentials and
+        return it.
+        """
+        if self._ignore_cert:  # pragma: no cover
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+        elif self._tls_cacert_file:  # pragma: no cover
+            ldap.set_option(ldap.OPT_X_TLS_CACERTFILE, self._tls_cacert_file)
+        con = ldap.initialize(
+            self._uri,
+            bytes_mode=False,
+            bytes_strictness='silent'
+        )
+        # Turning referrals off since they cause problems with MS Active
+        # Directory More info: https://www.python-ldap.org/faq.html#usage
+        con.set_option(ldap.OPT_REFERRALS, 0)
+        con.protocol_version = self.protocol
+        if self._operation_timeout is not None:
+            con.set_option(ldap.OPT_NETWORK_TIMEOUT, self._operation_timeout)
+        if self._start_tls:  # pragma: no cover
+            con.start_tls_s()
+        return con
+
+    def auth_pool(self):
+        """Return the process wide authentication connection pool for this
+        connector or None if authentication pooling is disabled.
+
+        Connections of this pool get rebound for each credentials check.
+        """
+        if not self._auth_pool_size:
+            return None
+        key = md5digest(cache_key(['auth', self._uri]))
+        return get_pool(
+            key,
+            self.auth_connect,
+            max_size=self._auth_pool_size,
+            timeout=self._auth_pool_timeout,
+            idle_timeout=self._pool_idle_timeout,
+            check_interval=self._pool_check_interval
+        )
+
+    def breaker(self):
+        """Return the process wide circuit breaker for the server URI or None
+        if circuit breaking is disabled.
+        """
+        if not self._breaker_threshold:
+            return None
+        return get_breaker(
+            self._uri,
+            failure_threshold=self._breaker_threshold,
+            reset_timeout=self._breaker_reset_timeout,
+            max_reset_timeout=self._breaker_max_reset_timeout,
+            fail_fast=self._breaker_fail_fast
+        )
+
+    def replica(self, uri):
+        """Return connector for the read replica at ``uri`` using the same
+        credentials and settings as this connector.
+
+        Results are not cached by the replica connector, caching is done by
+        the communicator routing the searches.
+        """
+        connector = LDAPConnector(props=self._props)
+        connector._uri = uri
+        connector._cache = False
+        connector._read_uris = []
+        connector._is_replica = True
+        return connector
+
+    def replicas(self):
+        """Return the process wide ``node.ext.ldap.replica.ReplicaSet`` of the
+        read replicas or None if no read replicas are configured.
+        """
+        if not self._read_uris:
+            return None
+        return get_replicas(
+            u' '.join(self._read_uris),
+            self._read_uris,
+            self.probe,
+            probe_interval=self._replica_probe_interval
+        )
+
+    def probe(self, uri):
+        """Health probe of the server at ``uri``.
+
+        :return: Seconds a whoami request took.
+        """
+        con = self.replica(uri).connect(timeout=self._replica_probe_interval)
+        try:
+            start = time.time()
+            con.whoami_s()
+            return time.time() - start
+        finally:
+            try:
+                con.unbind_s()
+            except ldap.LDAPError:  # pragma: no cover
+                pass
+
+    def pool(self):
+        """Return the process wide connection pool for this connector.
+
+        Connectors with same URI and credentials share one pool.
+        """
+        key = md5digest(cache_key([self._uri, self._bindDN, self._bindPW]))
+        return get_pool(
+            key,
+            self.connect,
+            min_size=self._pool_min_size,
+            max_size=self._pool_size,
+            timeout=self._pool_timeout,
+            idle_timeout=self._pool_idle_timeout,
+            check_interval=self._pool_check_interval
+        )
+
     def unbind(self):
         """Unbind from Server.
         """
@@ -141,6 +611,17 @@ class LDAPCommunicator(object):
 
     It provides methods to search, add, modify and delete entries in the
     directory.
+
+    If connector defines a pool size, operations borrow a connection from
+    the connection pool shared by all communicators using the same server and
+    credentials instead of using one dedicated connection.
+
+    If connector defines read replicas, searches are routed to the healthy
+    replica with the lowest latency, falling back to the next replica and
+    finally the provider if a replica is unavailable. Writes are always sent
+    to the provider. Searches touching an entry written by this communicator
+    are sent to the provider as well until the read your writes window has
+    passed, thus they never return data not replicated yet.
     """
 
     def __init__(self, connector):
@@ -151,6 +632,18 @@ class LDAPCommunicator(object):
         self.baseDN = ''
         self._connector = connector
         self._con = None
+        self._pool = None
+        # connections pinned to pending paged searches, since paging cookies
+        # are only valid on the connection they have been issued on.
+        self._paged = dict()
+        self._paged_lock = threading.Lock()
+        # communicators of read replicas by URI and the ones pending paged
+        # searches have been routed to.
+        self._replicas = dict()
+        self._paged_readers = dict()
+        # normalized parent DNs of entries written recently by expiry time
+        self._written = dict()
+        self._written_lock = threading.Lock()
         self._cache = None
         if connector._cache:
             cachefactory = queryUtility(ICacheProviderFactory)
@@ -174,20 +667,54 @@ class LDAPCommunicator(object):
                     )
                 )
 
-    def bind(self):
+    @property
+    def bound(self):
+        """Flag whether communicator is bound.
+        """
+        return self._con is not None or self._pool is not None
+
+    def bind(self, timeout=None):
         """Bind to LDAP Server.
+
+        In pooled mode, the connection pool gets looked up and connections are
+        bound on demand.
+
+        :param timeout: Seconds connecting and binding may take. Defaults to
+            ``operation_timeout`` of props.
         """
-        self._con = self._connector.bind()
+        if self._connector._pool_size:
+            self._pool = self._connector.pool()
+        else:
+            with self._guard():
+                self._con = self._connector.bind(timeout=timeout)
 
     def unbind(self):
         """Unbind from LDAP Server.
+
+        In pooled mode, pinned connections are returned to the pool, which
+        stays open for other communicators.
         """
-        self._connector.unbind()
+        with self._paged_lock:
+            readers = list(self._replicas.values())
+            self._replicas.clear()
+            self._paged_readers.clear()
+        for reader in readers:
+            reader.unbind()
+        if self._pool is not None:
+            with self._paged_lock:
+                paged = list(self._paged.values())
+                self._paged.clear()
+            for con, _ in paged:
+                self._pool.release(con)
+            self._pool = None
+            return
+        if self._con is not None:
+            self._connector.unbind()
         self._con = None
 
     def search(self, queryFilter, scope, baseDN=None,
                force_reload=False, attrlist=None, attrsonly=0,
-               page_size=None, cookie=None):
+               page_size=None, cookie=None, timeout=None):
         """Search the directory.
 
         :param queryFilter: LDAP query filter
@@ -200,77 +727,707 @@ class LDAPCommunicator(object):
         :param page_size: Number of items per page, when doing pagination.
         :param cookie: Cookie string returned by previous search with
             pagination.
+        :param timeout: Seconds the search may take. If exceeded, search gets
+            abandoned and ``LDAPOperationTimeout`` is raised. Defaults to
+            ``operation_timeout`` of props.
         """
         if baseDN is None:
             baseDN = self.baseDN
             if not baseDN:
                 raise ValueError(u"baseDN unset.")
-        if page_size:
-            if cookie is None:
-                cookie = ''
-            pagedresults = ldap.controls.libldap.SimplePagedResultsControl(
-                criticality=True, size=page_size, cookie=cookie)
-            serverctrls = [pagedresults]
-        else:
-            if cookie:
-                raise ValueError('cookie passed without page_size')
-            serverctrls = []
+        if page_size and cookie is None:
+            cookie = ''
+        serverctrls = paged_search_controls(page_size, cookie)
+        deadline = self._deadline(timeout)
 
         def _search(baseDN, scope, queryFilter,
                     attrlist, attrsonly, serverctrls):
-            # we have to do async search to also retrieve server controls
-            # in case we do pagination of results
-            if type(attrlist) in (list, tuple):
-                attrlist = [str(_) for _ in attrlist]
-            try:
-                msgid = self._con.search_ext(
+            def operation(reader):
+                return reader._perform_search(
                     baseDN,
                     scope,
                     queryFilter,
                     attrlist,
                     attrsonly,
-                    serverctrls=serverctrls
+                    serverctrls,
+                    cookie,
+                    deadline
                 )
-            except ldap.LDAPError as e:
-                logger.warn(str(e))
+            reader, res = self._route(
+                operation,
+                cookie=cookie,
+                base_dns=[baseDN]
+            )
+            if isinstance(res, tuple):
+                self._pin_reader(res[1], reader)
+            return res
+        if not page_size and (
+            self._connector._negative_cache_timeout
+            or self._connector._single_flight
+        ):
+            search_id = self._search_id(
+                queryFilter,
+                scope,
+                baseDN,
+                attrlist,
+                attrsonly
+            )
+        if self._connector._negative_cache_timeout and not page_size:
+            negative = self._negative_cache()
+            # reloaded searches get remembered again
+            known, error = (False, None) if force_reload \
+                else negative.get(search_id)
+            if known:
+                if error is not None:
+                    raise error.__class__(*error.args)
                 return []
-            rtype, results, rmsgid, rctrls = self._con.result3(msgid)
-            ctype = ldap.controls.libldap.SimplePagedResultsControl.controlType
-            pctrls = [c for c in rctrls if c.controlType == ctype]
-            if pctrls:
-                return results, pctrls[0].cookie
-            else:
-                return results
+            _search = self._remember_negative(_search, negative, search_id)
+        if self._connector._single_flight and not page_size:
+            _search = self._coalesce(_search, deadline, search_id)
         args = [baseDN, scope, queryFilter, attrlist, attrsonly, serverctrls]
-        if self._cache:
-            key_items = [
-                self._connector._bindDN,
-                baseDN,
-                sorted(attrlist or []),
-                attrsonly,
+        paged = bool(page_size)
+        # following pages are bound to the connection of the first page by
+        # their cookie, thus they are never served from cache
+        if self._cache and not (paged and cookie):
+            key = self.search_key(
                 queryFilter,
                 scope,
+                baseDN,
+                attrlist,
+                attrsonly,
                 page_size,
                 cookie
-            ]
-            return self._cache.getData(
-                _search,
-                md5digest(cache_key(key_items)),
-                force_reload,
-                args
             )
+            stats = self._search_stats()
+            base = normalize_dn(baseDN)
+            started = time.time()
+            res, stale = self._cache_get(key, force_reload, paged)
+            if res is not None:
+                stats.hit('search', base, time.time() - started, stale)
+                if stale:
+                    self._revalidate(key, _search, args)
+                return res
+            started = time.time()
+            res = _search(*args)
+            stats.miss('search', base, time.time() - started)
+            if not search_continues(res) \
+                    and not isinstance(res, FailedSearchResult):
+                self._cache_set(key, res, paged)
+            return res
         return _search(*args)
 
-    def add(self, dn, data):
+    def search_stream(self, queryFilter, scope, baseDN=None, attrlist=None,
+                      attrsonly=0, page_size=None, cookie=None, timeout=None):
+        """Search the directory and read result entries one by one as they
+        arrive from the server instead of waiting for the complete result.
+
+        Streamed results are never cached. The connection is occupied until
+        the returned stream has been consumed or closed.
+
+        :param queryFilter: LDAP query filter
+        :param scope: LDAP search scope
+        :param baseDN: Search base. Defaults to ``self.baseDN``
+        :param attrlist: LDAP attrlist to query.
+        :param attrsonly: Flag whether to return only attribute names, without
+            corresponding values.
+        :param page_size: Number of items per page, when doing pagination.
+        :param cookie: Cookie string returned by previous search with
+            pagination.
+        :param timeout: Seconds reading the complete result may take.
+            Defaults to ``operation_timeout`` of props.
+        :return: ``LDAPSearchStream`` instance.
+        """
+        if baseDN is None:
+            baseDN = self.baseDN
+            if not baseDN:
+                raise ValueError(u"baseDN unset.")
+        if page_size and cookie is None:
+            cookie = ''
+        serverctrls = paged_search_controls(page_size, cookie)
+        if type(attrlist) in (list, tuple):
+            attrlist = [str(_) for _ in attrlist]
+        deadline = self._deadline(timeout)
+
+        def operation(reader):
+            return reader._stream_search(
+                baseDN,
+                scope,
+                queryFilter,
+                attrlist,
+                attrsonly,
+                serverctrls,
+                cookie,
+                deadline,
+                origin=self
+            )
+        return self._route(
+            operation,
+            cookie=cookie,
+            measure=False,
+            base_dns=[baseDN]
+        )[1]
+
+    def abandon_paged(self, cookie):
+        """Abandon a paged search of the current thread before all pages have
+        been read.
+
+        The connection pinned to ``cookie`` is released immediately instead
+        of after ``pool_idle_timeout``.
+
+        :param cookie: Cookie returned by the last page read.
+        """
+        if not cookie:
+            return
+        key = (threading.current_thread().ident, cookie)
+        with self._paged_lock:
+            reader = self._paged_readers.pop(key, (self, None))[0]
+            pinned = self._paged.pop(key, None)
+        if reader is not self:
+            reader.abandon_paged(cookie)
+        if pinned is not None and self._pool is not None:
+            # the server forgets the paged search state of the connection
+            # with the next paged search sent over it
+            self._pool.release(pinned[0])
+
+    def search_key(self, queryFilter, scope, baseDN, attrlist=None,
+                   attrsonly=0, page_size=None, cookie=None):
+        """Return the cache key for a search.
+
+        Key considers bind DN, thus results are never shared between
+        different bind users. If cache is enabled, key contains the current
+        generation of the search base and scope, which changes when an entry
+        in scope gets written. See ``invalidate``.
+        """
+        key_items = [
+            self._connector._bindDN,
+            baseDN,
+            sorted(attrlist or []),
+            attrsonly,
+            queryFilter,
+            scope,
+            page_size,
+            cookie
+        ]
+        if self._cache:
+            if self._connector._cache_soft_timeout:
+                # cached values contain the time they get stale
+                key_items.append('soft')
+            key_items.append(self._generation(scope, baseDN))
+        return md5digest(cache_key(key_items))
+
+    def invalidate(self, dn):
+        """Invalidate cached searches which might contain the entry at ``dn``.
+
+        Gets called after each write. Affects BASE searches for ``dn``,
+        ONELEVEL searches for its parent and SUBTREE searches for ``dn`` and
+        all its ancestors. Since generations are stored in the cache itself,
+        other processes sharing the cache are affected as well.
+
+        Searches remembered in the negative cache of this process with ``dn``
+        or one of its ancestors as search base are forgotten.
+        """
+        dn = normalize_dn(dn)
+        try:
+            rdns = explode_dn(dn)
+        except ldap.DECODING_ERROR:
+            rdns = [dn]
+        if self._connector._negative_cache_timeout:
+            self._negative_cache().invalidate([dn] + [
+                u','.join(rdns[index:]) for index in range(1, len(rdns) + 1)
+            ])
+        if not self._cache:
+            return
+        keys = [
+            self._generation_key(BASE, dn),
+            self._generation_key(SUBTREE, dn)
+        ]
+        for index in range(1, len(rdns) + 1):
+            ancestor = u','.join(rdns[index:])
+            if index == 1:
+                keys.append(self._generation_key(ONELEVEL, ancestor))
+            keys.append(self._generation_key(SUBTREE, ancestor))
+        for key in keys:
+            self._cache.rem(key)
+
+    def cache_stats(self):
+        """Return dict containing statistics of cached searches.
+
+        Counters and latency histograms of cache lookups and of searches
+        sent to the server on cache misses are shared by all communicators
+        of the process using the same server URI. See
+        ``node.ext.ldap.stats.CacheStats``. If the cache provider supports
+        it, its own stats are contained as ``provider``.
+        """
+        stats = self._search_stats().stats()
+        provider = getattr(self._cache, 'cache', None)
+        stats['provider'] = None
+        if hasattr(provider, 'stats'):
+            stats['provider'] = provider.stats()
+        return stats
+
+    def reset_cache_stats(self):
+        """Reset statistics of cached searches and of the cache provider.
+        """
+        self._search_stats().reset()
+        provider = getattr(self._cache, 'cache', None)
+        if hasattr(provider, 'reset_stats'):
+            provider.reset_stats()
+
+    def _search_stats(self):
+        return get_cache_stats(self._connector._uri)
+
+    def _search_id(self, queryFilter, scope, baseDN, attrlist, attrsonly):
+        # key identifying equal searches sent to the server. Unlike
+        # ``search_key`` it contains the server URI, but no generation.
+        return md5digest(cache_key([
+            self._connector._uri,
+            self._connector._bindDN,
+            normalize_dn(baseDN),
+            sorted(attrlist or []),
+            attrsonly,
+            queryFilter,
+            scope
+        ]))
+
+    def _coalesce(self, func, deadline, key):
+        # wrap search function ``func``. Of concurrent equal searches in this
+        # process only one is sent to the server, the others wait for its
+        # result.
+        def coalesced(*args):
+            try:
+                return get_flights().do(
+                    key,
+                    func,
+                    args,
+                    timeout=remaining_timeout(deadline)
+                )
+            except FlightTimeout as e:
+                raise LDAPOperationTimeout(*e.args)
+        return coalesced
+
+    def _negative_cache(self):
+        connector = self._connector
+        return get_negative_cache(
+            connector._uri,
+            max_entries=connector._negative_cache_size
+        )
+
+    def _remember_negative(self, func, negative, key):
+        # wrap search function ``func``. Searches failing with
+        # ``ldap.NO_SUCH_OBJECT`` or without result are remembered in
+        # negative cache. Searches which could not be sent are not, searches
+        # with result are forgotten, e.g. when reloaded.
+        timeout = self._connector._negative_cache_timeout
+
+        def remembering(baseDN, *args):
+            try:
+                res = func(baseDN, *args)
+            except ldap.NO_SUCH_OBJECT as e:
+                negative.set(key, normalize_dn(baseDN), timeout, error=e)
+                raise
+            if isinstance(res, FailedSearchResult):
+                return res
+            if res:
+                negative.forget(key)
+            else:
+                negative.set(key, normalize_dn(baseDN), timeout)
+            return res
+        return remembering
+
+    def _cache_get(self, key, force_reload=False, paged=False):
+        # return cached search result and flag whether it is stale. Paged
+        # results never get stale.
+        res = self._cache.get(key, force_reload)
+        if res is None or not self._connector._cache_soft_timeout or paged:
+            return res, False
+        stale_at, res = res
+        return res, stale_at <= time.time()
+
+    def _cache_set(self, key, res, paged=False):
+        soft_timeout = self._connector._cache_soft_timeout
+        if soft_timeout and not paged:
+            res = (time.time() + soft_timeout, res)
+        self._cache.set(key, res)
+
+    def _revalidate(self, key, func, args):
+        # refresh stale cached search result in background. Only one refresh
+        # per key runs at a time in this process.
+        with _revalidating_lock:
+            if key in _revalidating:
+                return
+            _revalidating.add(key)
+
+        def revalidate():
+            try:
+                res = func(*args)
+                if not isinstance(res, FailedSearchResult):
+                    self._cache_set(key, res)
+            except Exception as e:
+                logger.warning(
+                    u'Refreshing stale search result failed: {}'.format(e)
+                )
+            finally:
+                with _revalidating_lock:
+                    _revalidating.discard(key)
+        thread = threading.Thread(target=revalidate)
+        thread.daemon = True
+        thread.start()
+
+    def _generation(self, scope, dn):
+        # return the generation of searches with ``scope`` below ``dn``. A
+        # new random generation is created if none exists, thus cached
+        # searches of evicted generations are never used again.
+        key = self._generation_key(scope, normalize_dn(dn))
+        generation = self._cache.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self._cache.set(key, generation)
+        return generation
+
+    def _generation_key(self, scope, dn):
+        return GENERATION_KEY_PREFIX + md5digest(cache_key([scope, dn]))
+
+    def search_many(self, requests, return_errors=False, timeout=None,
+                    window=SEARCH_WINDOW):
+        """Perform several searches at once.
+
+        Searches are sent over one connection without waiting for the result
+        of the previous one, at most ``window`` searches are pending at once.
+        Thus the round trips overlap instead of adding up. Results are cached
+        the same way as ``search`` does. Pagination is not supported.
+
+        :param requests: List of dicts containing keyword arguments for
+            ``search``. ``queryFilter`` and ``scope`` are required.
+        :param return_errors: If True, ``ldap.LDAPError`` instances raised by
+            individual searches are returned in place of their result.
+            Otherwise the first error gets raised after all results have
+            been read.
+        :param timeout: Seconds all searches together may take. Searches
+            without result when exceeded get abandoned and fail with
+            ``LDAPOperationTimeout``. Defaults to ``operation_timeout`` of
+            props.
+        :return: List of search results in order of ``requests``.
+        """
+        deadline = self._deadline(timeout)
+        results = [None] * len(requests)
+        errors = [None] * len(requests)
+        misses = list()
+        if self._cache:
+            stats = self._search_stats()
+        for index, request in enumerate(requests):
+            request = dict(request)
+            if request.get('page_size') or request.get('cookie'):
+                raise ValueError(u'Pagination not supported by search_many')
+            queryFilter = request['queryFilter']
+            scope = request['scope']
+            baseDN = request.get('baseDN')
+            if baseDN is None:
+                baseDN = self.baseDN
+                if not baseDN:
+                    raise ValueError(u"baseDN unset.")
+            attrlist = request.get('attrlist')
+            attrsonly = request.get('attrsonly', 0)
+            key = None
+            if self._cache:
+                key = self.search_key(
+                    queryFilter,
+                    scope,
+                    baseDN,
+                    attrlist,
+                    attrsonly
+                )
+                # stale results are searched again with the misses
+                started = time.time()
+                res, stale = self._cache_get(
+                    key,
+                    request.get('force_reload', False)
+                )
+                if res is not None and not stale:
+                    stats.hit(
+                        'search_many',
+                        normalize_dn(baseDN),
+                        time.time() - started
+                    )
+                    results[index] = res
+                    continue
+            if type(attrlist) in (list, tuple):
+                attrlist = [str(_) for _ in attrlist]
+            misses.append(
+                (index, key, (baseDN, scope, queryFilter, attrlist, attrsonly))
+            )
+        if not misses:
+            return results
+
+        def operation(reader):
+            for index, key, args in misses:
+                # reset errors of replica failed before
+                errors[index] = None
+            with reader._guard():
+                reader._search_many(
+                    misses,
+                    results,
+                    errors,
+                    deadline,
+                    max(window, 1),
+                    self._cache_set
+                )
+        started = time.time()
+        self._route(
+            operation,
+            base_dns=[args[0] for index, key, args in misses]
+        )
+        if self._cache:
+            # searches are sent at once, thus each miss gets accounted the
+            # average duration
+            duration = (time.time() - started) / len(misses)
+            for index, key, args in misses:
+                stats.miss('search_many', normalize_dn(args[0]), duration)
+        for index, error in enumerate(errors):
+            if error is None:
+                continue
+            if not return_errors:
+                raise error
+            results[index] = error
+        return results
+
+    def _search_many(self, misses, results, errors, deadline, window,
+                     store=None):
+        # send searches not answered by cache over one connection and write
+        # their results respective errors to ``results`` and ``errors``. At
+        # most ``window`` searches are waiting for their result at once.
+        pending = deque()
+
+        def read():
+            index, key, msgid = pending.popleft()
+            try:
+                rtype, res, rmsgid, rctrls = wait_result(con, msgid, deadline)
+            except ldap.SERVER_DOWN:
+                raise
+            except ldap.LDAPError as e:
+                errors[index] = e
+                return
+            results[index] = res
+            if key is not None:
+                store(key, res)
+
+        con = self._acquire(deadline=deadline)
+        try:
+            for index, key, args in misses:
+                try:
+                    msgid = con.search_ext(*args)
+                except ldap.SERVER_DOWN:
+                    raise
+                except ldap.LDAPError as e:
+                    if self._connector._is_replica \
+                            and isinstance(e, FAILURES):
+                        # fall back to another server
+                        raise
+                    logger.warn(str(e))
+                    results[index] = []
+                    continue
+                pending.append((index, key, msgid))
+                if len(pending) >= window:
+                    read()
+            while pending:
+                read()
+        except ldap.SERVER_DOWN:
+            self._release(con, discard=True)
+            raise
+        except Exception:
+            for index, key, msgid in pending:
+                con.abandon(msgid)
+            self._release(con)
+            raise
+        self._release(con)
+
+    def _perform_search(self, baseDN, scope, queryFilter, attrlist, attrsonly,
+                        serverctrls, cookie, deadline):
+        # we have to do async search to also retrieve server controls
+        # in case we do pagination of results
+        with self._guard():
+            if type(attrlist) in (list, tuple):
+                attrlist = [str(_) for _ in attrlist]
+            con = self._acquire(cookie, deadline=deadline)
+            try:
+                try:
+                    msgid = con.search_ext(
+                        baseDN,
+                        scope,
+                        queryFilter,
+                        attrlist,
+                        attrsonly,
+                        serverctrls=serverctrls
+                    )
+                except ldap.LDAPError as e:
+                    if self._connector._is_replica \
+                            and isinstance(e, FAILURES):
+                        # connection released below, caller falls back to
+                        # another server
+                        raise
+                    logger.warn(str(e))
+                    self._release(
+                        con,
+                        discard=isinstance(e, ldap.SERVER_DOWN)
+                    )
+                    self._failed(e)
+                    return FailedSearchResult()
+                rtype, results, rmsgid, rctrls = wait_result(
+                    con,
+                    msgid,
+                    deadline
+                )
+            except ldap.SERVER_DOWN:
+                self._release(con, discard=True)
+                raise
+            except Exception:
+                self._release(con)
+                raise
+            next_cookie = paged_search_cookie(rctrls)
+            self._release(con, cookie=next_cookie)
+            if next_cookie is not None:
+                return results, next_cookie
+            return results
+
+    def _stream_search(self, baseDN, scope, queryFilter, attrlist, attrsonly,
+                       serverctrls, cookie, deadline, origin=None):
+        # send search and return ``LDAPSearchStream`` reading the result.
+        with self._guard():
+            con = self._acquire(cookie, deadline=deadline)
+            try:
+                msgid = con.search_ext(
+                    baseDN,
+                    scope,
+                    queryFilter,
+                    attrlist,
+                    attrsonly,
+                    serverctrls=serverctrls
+                )
+            except ldap.LDAPError as e:
+                self._release(con, discard=isinstance(e, ldap.SERVER_DOWN))
+                if self._connector._is_replica and isinstance(e, FAILURES):
+                    # caller falls back to another server
+                    raise
+                logger.warn(str(e))
+                self._failed(e)
+                return LDAPSearchStream(self, None, None)
+            except Exception:
+                self._release(con)
+                raise
+        return LDAPSearchStream(
+            self,
+            con,
+            msgid,
+            deadline=deadline,
+            origin=origin
+        )
+
+    def add(self, dn, data, timeout=None):
         """Insert an entry into directory.
 
         :param dn: Adding DN
         :param data: Dict containing key/value pairs of entry attributes
+        :param timeout: Seconds the operation may take. Defaults to
+            ``operation_timeout`` of props.
         """
         attributes = [(k, v) for k, v in data.items()]
-        self._con.add_s(dn, attributes)
+        deadline = self._deadline(timeout)
+        with self._connection(deadline, dn=dn) as con:
+            if deadline is None:
+                con.add_s(dn, attributes)
+            else:
+                wait_result(con, con.add_ext(dn, attributes), deadline)
+
+    def add_many(self, entries, window=ADD_WINDOW, timeout=None):
+        """Insert several entries into directory.
+
+        Adds are sent over one connection without waiting for the result of
+        the previous one, at most ``window`` adds are pending at once. Thus
+        the round trips overlap instead of adding up. An add failing does not
+        abort the others. If the connection gets lost, all adds pending or
+        not sent yet fail with ``ldap.SERVER_DOWN``. Pending adds might have
+        been applied anyway.
+
+        :param entries: Iterable of ``(dn, data)`` tuples. ``data`` is a dict
+            containing key/value pairs of entry attributes.
+        :param window: Maximum number of adds waiting for their result.
+        :param timeout: Seconds each add may wait for its result. Defaults to
+            ``operation_timeout`` of props.
+        :return: List containing ``None`` for each entry added respective the
+            ``ldap.LDAPError`` it failed with, in order of ``entries``.
+        """
+        errors = list()
+        written = list()
+        with self._guard():
+            con = self._acquire()
+            try:
+                self._add_many(
+                    con,
+                    iter(entries),
+                    max(window, 1),
+                    timeout,
+                    errors,
+                    written
+                )
+            finally:
+                # failed or timed out adds might have been applied anyway
+                for dn in written:
+                    self._wrote(dn)
+                    self.invalidate(dn)
+                if written and self._connector._single_flight:
+                    # searches in progress might miss the writes
+                    get_flights().forget()
+        return errors
+
+    def _add_many(self, con, entries, window, timeout, errors, written):
+        # send adds of ``entries`` over ``con`` and write their errors to
+        # ``errors``. DNs of adds sent are written to ``written``. Releases
+        # ``con``.
+        pending = deque()
+
+        def read():
+            index, msgid, deadline = pending.popleft()
+            try:
+                wait_result(con, msgid, deadline)
+            except ldap.LDAPError as e:
+                errors[index] = e
+                if isinstance(e, ldap.SERVER_DOWN):
+                    raise
+
+        try:
+            for dn, data in entries:
+                errors.append(None)
+                written.append(dn)
+                attributes = [(k, v) for k, v in data.items()]
+                deadline = self._deadline(timeout)
+                try:
+                    msgid = con.add_ext(dn, attributes)
+                except ldap.LDAPError as e:
+                    errors[-1] = e
+                    if isinstance(e, ldap.SERVER_DOWN):
+                        raise
+                    continue
+                pending.append((len(errors) - 1, msgid, deadline))
+                if len(pending) >= window:
+                    read()
+            while pending:
+                read()
+        except ldap.SERVER_DOWN as e:
+            self._release(con, discard=True)
+            self._failed(e)
+            for index, msgid, deadline in pending:
+                errors[index] = e
+            # entries not sent yet
+            for dn, data in entries:
+                errors.append(e)
+            return
+        except Exception:
+            for index, msgid, deadline in pending:
+                con.abandon(msgid)
+            self._release(con)
+            raise
+        self._release(con)
 
-    def modify(self, dn, modlist):
+    def modify(self, dn, modlist, timeout=None):
         """Modify an existing entry in the directory.
 
         Takes the DN of the entry and the modlist, which is a list of tuples
@@ -279,17 +1436,337 @@ class LDAPCommunicator(object):
         gives the name of the field to modify, and the third gives the new
         value for the field (for MOD_ADD and MOD_REPLACE).
         """
-        self._con.modify_s(dn, modlist)
+        deadline = self._deadline(timeout)
+        with self._connection(deadline, dn=dn) as con:
+            if deadline is None:
+                con.modify_s(dn, modlist)
+            else:
+                wait_result(con, con.modify_ext(dn, modlist), deadline)
 
-    def delete(self, deleteDN):
+    def delete(self, deleteDN, timeout=None):
         """Delete an entry from the directory.
 
         Take the DN to delete from the directory as argument.
         """
-        self._con.delete_s(deleteDN)
+        deadline = self._deadline(timeout)
+        with self._connection(deadline, dn=deleteDN) as con:
+            if deadline is None:
+                con.delete_s(deleteDN)
+            else:
+                wait_result(con, con.delete_ext(deleteDN), deadline)
+
+    def passwd(self, userdn, oldpw, newpw, timeout=None):
+        deadline = self._deadline(timeout)
+        dn = userdn or self._connector._bindDN
+        with self._connection(deadline, dn=dn) as con:
+            if deadline is None:
+                con.passwd_s(userdn, oldpw, newpw)
+            else:
+                wait_result(con, con.passwd(userdn, oldpw, newpw), deadline)
+
+    def _route(self, operation, cookie=None, measure=True, base_dns=None):
+        # perform read ``operation``, a callable getting passed the
+        # communicator to use, and return ``(communicator, result)``. Read
+        # replicas are tried by latency. If a replica is unavailable, the next
+        # one is tried and finally the provider. Paged searches are continued
+        # on the server they have been started on. Searches below or above
+        # ``base_dns`` written recently are sent to the provider.
+        replicas = self._connector.replicas()
+        if replicas is None:
+            return self, operation(self)
+        if not cookie and self._touches_written(base_dns):
+            return self, operation(self)
+        for reader in self._readers(replicas, cookie):
+            if reader is self:
+                return self, operation(self)
+            uri = reader._connector._uri
+            start = time.time()
+            try:
+                result = operation(reader)
+            except LDAPOperationTimeout:
+                # replica is slow, no time left for trying another one
+                replicas.succeeded(uri, time.time() - start)
+                raise
+            except FAILURES as e:
+                replicas.failed(uri, e)
+                if cookie:
+                    raise
+                continue
+            replicas.succeeded(uri, time.time() - start if measure else None)
+            return reader, result
+
+    def _readers(self, replicas, cookie=None):
+        # return communicators to try for a read operation in order.
+        key = (threading.current_thread().ident, cookie)
+        with self._paged_lock:
+            if cookie:
+                return [self._paged_readers.pop(key, (self, None))[0]]
+            readers = list()
+            for uri in replicas.select():
+                reader = self._replicas.get(uri)
+                if reader is None:
+                    connector = self._connector.replica(uri)
+                    reader = self._replicas[uri] = LDAPCommunicator(connector)
+                    if self._pool is not None:
+                        # only looks up the connection pool of the replica,
+                        # non pooled connections are bound on demand.
+                        reader.bind()
+                readers.append(reader)
+        readers.append(self)
+        return readers
+
+    def _pin_reader(self, cookie, reader):
+        # remember the communicator a paged search has been routed to.
+        if not cookie or reader is self:
+            return
+        now = time.time()
+        idle_timeout = self._connector._pool_idle_timeout
+        with self._paged_lock:
+            if idle_timeout is not None:
+                # forget abandoned paged searches
+                limit = now - idle_timeout
+                for key, (_, used) in list(self._paged_readers.items()):
+                    if used <= limit:
+                        del self._paged_readers[key]
+            key = (threading.current_thread().ident, cookie)
+            self._paged_readers[key] = (reader, now)
 
-    def passwd(self, userdn, oldpw, newpw):
-        self._con.passwd_s(userdn, oldpw, newpw)
+    def _wrote(self, dn):
+        # remember ``dn`` has been written for the read your writes window.
+        window = self._connector._read_your_writes_window
+        if not window or not self._connector._read_uris:
+            return
+        # the parent is remembered, which keeps one DN per container for bulk
+        # writes. Searches touching siblings of the entry are affected too.
+        parent = parent_dn(normalize_dn(dn))
+        expires = time.time() + window
+        with self._written_lock:
+            written = self._written
+            written[parent] = expires
+            if len(written) > WRITTEN_MAX:
+                common = common_dn(written)
+                written.clear()
+                written[common] = expires
+
+    def _touches_written(self, base_dns):
+        # check whether a search with one of ``base_dns`` might return an
+        # entry written within the read your writes window.
+        if not base_dns or not self._written:
+            return False
+        base_dns = [normalize_dn(base_dn) for base_dn in base_dns]
+        now = time.time()
+        with self._written_lock:
+            for dn, expires in list(self._written.items()):
+                if expires <= now:
+                    del self._written[dn]
+                    continue
+                if not dn:
+                    # writes without common parent
+                    return True
+                for base_dn in base_dns:
+                    # searches below a deleted or renamed subtree are
+                    # affected as well
+                    if dn_within(dn, base_dn) or dn_within(base_dn, dn):
+                        return True
+        return False
+
+    @contextmanager
+    def _guard(self):
+        # context manager guarding an operation by the circuit breaker of the
+        # server if enabled.
+        breaker = self._connector.breaker()
+        if breaker is None:
+            yield
+            return
+        # an expired deadline proves a slow operation, not an unavailable
+        # server
+        with breaker.guard(aborts=(LDAPOperationTimeout,)):
+            yield
+
+    def _failed(self, error):
+        # record failure of the server with the circuit breaker if enabled
+        # and ``error`` indicates the server is unavailable.
+        breaker = self._connector.breaker()
+        if breaker is None or isinstance(error, LDAPOperationTimeout):
+            return
+        if isinstance(error, FAILURES):
+            breaker.failed(error)
+
+    def _deadline(self, timeout):
+        # deadline for an operation starting now. Operations with deadline
+        # are sent asynchronously and do not pass the retry loop of
+        # ``ReconnectLDAPObject``, which would block for ``retry_delay``.
+        if timeout is None:
+            timeout = self._connector._operation_timeout
+        return operation_deadline(timeout)
+
+    def _acquire(self, cookie=None, deadline=None):
+        # return connection to use for next operation. If cookie given, the
+        # connection the paged search has been started on is returned.
+        if self._pool is None:
+            if self._con is None:
+                # connection has been discarded
+                self._con = self._connector.bind()
+            return self._con
+        expired = list()
+        con = None
+        with self._paged_lock:
+            if cookie:
+                key = (threading.current_thread().ident, cookie)
+                pinned = self._paged.pop(key, None)
+                if pinned is not None:
+                    con = pinned[0]
+            idle_timeout = self._pool.idle_timeout
+            if idle_timeout is not None:
+                # abandoned paged searches
+                limit = time.time() - idle_timeout
+                for key, (pcon, last_used) in list(self._paged.items()):
+                    if last_used <= limit:
+                        expired.append(pcon)
+                        del self._paged[key]
+        for pcon in expired:
+            self._pool.release(pcon)
+        if con is None:
+            con = self._pool.acquire(
+                timeout=remaining_timeout(deadline, self._pool.timeout)
+            )
+        return con
+
+    def _release(self, con, cookie=None, discard=False):
+        # return connection to pool. If cookie given, pin connection to
+        # cookie for subsequent paged searches.
+        if self._pool is None:
+            if discard and con is self._con:
+                # broken connection gets replaced on next operation
+                self._con = None
+                try:
+                    con.unbind_s()
+                except ldap.LDAPError as e:
+                    logger.debug(
+                        u'Failed to close LDAP connection: {}'.format(e)
+                    )
+            return
+        if cookie and not discard:
+            key = (threading.current_thread().ident, cookie)
+            with self._paged_lock:
+                self._paged[key] = (con, time.time())
+            return
+        self._pool.release(con, discard=discard)
+
+    @contextmanager
+    def _connection(self, deadline=None, dn=None):
+        # context manager providing the connection to use for one write
+        # operation on ``dn``.
+        with self._guard():
+            con = self._acquire(deadline=deadline)
+            try:
+                yield con
+            except ldap.SERVER_DOWN:
+                self._release(con, discard=True)
+                raise
+            except Exception:
+                self._release(con)
+                raise
+            finally:
+                # failed or timed out writes might have been applied anyway
+                if dn is not None:
+                    self._wrote(dn)
+                    self.invalidate(dn)
+                    if self._connector._single_flight:
+                        # searches in progress might miss the write
+                        get_flights().forget()
+            self._release(con)
+
+
+class LDAPSearchStream(object):
+    """Iterable search result returned by ``LDAPCommunicator.search_stream``.
+
+    Yields ``(dn, attrs)`` tuples as they arrive from the server. Entries with
+    dn ``None``, i.e. search references, are skipped. Iteration is possible
+    once. After the stream has been consumed completely, ``cookie`` contains
+    the paging cookie returned by the server, or ``None`` if search was not
+    paged.
+    """
+
+    def __init__(self, communicator, con, msgid, deadline=None, origin=None):
+        """Initialize search stream.
+
+        :param communicator: ``LDAPCommunicator`` instance.
+        :param con: Connection the search has been sent on. ``None`` results
+            in an empty stream.
+        :param msgid: Message id of the search.
+        :param deadline: Absolute time until the search must be read
+            completely. See ``operation_deadline``.
+        :param origin: Communicator which routed the search to the read
+            replica of ``communicator``. Subsequent pages are routed to the
+            same replica.
+        """
+        self.cookie = None
+        self._communicator = communicator
+        self._origin = origin
+        self._con = con
+        self._msgid = msgid
+        self._deadline = deadline
+
+    def __iter__(self):
+        con = self._con
+        if con is None:
+            return
+        try:
+            while True:
+                try:
+                    rtype, rdata, rmsgid, rctrls = wait_result(
+                        con,
+                        self._msgid,
+                        self._deadline,
+                        all=0
+                    )
+                except ldap.SERVER_DOWN as e:
+                    self._release(discard=True)
+                    self._communicator._failed(e)
+                    raise
+                except ldap.LDAPError as e:
+                    self._release()
+                    self._communicator._failed(e)
+                    raise
+                if rtype == ldap.RES_SEARCH_RESULT:
+                    self.cookie = paged_search_cookie(rctrls)
+                    self._release(cookie=self.cookie)
+                    if self._origin is not None:
+                        self._origin._pin_reader(
+                            self.cookie,
+                            self._communicator
+                        )
+                    return
+                for dn, attrs in rdata:
+                    if dn is not None:
+                        yield dn, attrs
+        finally:
+            # iteration stopped before search completed
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        """Abandon search if not read completely and release connection.
+        """
+        con = self._con
+        if con is None:
+            return
+        try:
+            con.abandon(self._msgid)
+        except ldap.LDAPError as e:  # pragma: no cover
+            logger.debug(u'Failed to abandon LDAP search: {}'.format(e))
+        self._release()
+
+    def _release(self, cookie=None, discard=False):
+        con = self._con
+        self._con = None
+        self._communicator._release(con, cookie=cookie, discard=discard)
 
 
 def main():
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from node.ext.ldap.pool import PoolTimeout
+import ldap
+import logging
+import random
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# errors considered as failure of the server. All other errors prove the
+# server is reachable.
+FAILURES = (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.TIMEOUT)
+
+
+class CircuitOpen(ldap.SERVER_DOWN):
+    """Raised if an operation is rejected because the circuit breaker of the
+    server is open.
+    """
+
+
+class CircuitBreaker(object):
+    """Thread safe circuit breaker for one LDAP server.
+
+    The circuit is closed as long as operations succeed. After
+    ``failure_threshold`` consecutive failures, it opens and operations are
+    rejected with ``CircuitOpen`` until the reset delay has passed. Then it
+    gets half-open and one trial operation is let through. If the trial
+    succeeds, the circuit closes, otherwise it opens again with the reset
+    delay multiplied by ``backoff_factor``, up to ``max_reset_timeout``.
+    Reset delays are randomized by ``jitter`` to avoid all clients retrying
+    at the same time.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=1.,
+                 max_reset_timeout=60., backoff_factor=2., jitter=0.5,
+                 fail_fast=True):
+        """Initialize circuit breaker.
+
+        :param name: Name of the breaker, usually the server URI.
+        :param failure_threshold: Number of consecutive failures opening the
+            circuit.
+        :param reset_timeout: Seconds until the first trial after the circuit
+            opened.
+        :param max_reset_timeout: Maximum seconds between trials.
+        :param backoff_factor: Factor the reset delay gets multiplied with
+            after each failed trial.
+        :param jitter: Fraction by which reset delays get randomly shortened.
+            Must be between 0 and 1.
+        :param fail_fast: Flag whether to reject operations immediately while
+            the circuit is open. If False, operations wait for the next trial
+            once and get rejected if the circuit is still open afterwards.
+        """
+        if failure_threshold < 1:
+            raise ValueError(u'failure_threshold must be >= 1')
+        if not 0 <= jitter <= 1:
+            raise ValueError(u'jitter must be between 0 and 1')
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.fail_fast = fail_fast
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._init_state()
+
+    @property
+    def state(self):
+        """Current state. One of ``CLOSED``, ``OPEN`` or ``HALF_OPEN``.
+        """
+        return self._state
+
+    def allow(self):
+        """Check whether an operation may be performed.
+
+        Must be followed by a call to either ``succeeded`` or ``failed``.
+
+        :raise CircuitOpen: If the circuit is open.
+        """
+        with self._cond:
+            waited = False
+            while True:
+                if self._state == CLOSED:
+                    return
+                now = time.time()
+                if self._state == OPEN and now >= self._retry_at:
+                    self._change_state(HALF_OPEN)
+                    return
+                if self.fail_fast or waited:
+                    self._rejected += 1
+                    raise CircuitOpen({
+                        'desc': u"Can't contact LDAP server",
+                        'info': u'Circuit breaker of {} is {}'.format(
+                            self.name,
+                            self._state
+                        )
+                    })
+                if self._state == OPEN:
+                    self._cond.wait(self._retry_at - now)
+                else:
+                    # wait for pending trial
+                    self._cond.wait(self._delay)
+                waited = True
+
+    def succeeded(self):
+        """Record successful operation.
+        """
+        with self._cond:
+            self._successes += 1
+            self._failures = 0
+            if self._state != CLOSED:
+                self._delay = self.reset_timeout
+                self._retry_at = None
+                self._change_state(CLOSED)
+                logger.info(
+                    u'Circuit breaker of {} closed'.format(self.name)
+                )
+
+    def failed(self, error=None):
+        """Record failed operation.
+
+        :param error: Exception the operation failed with.
+        """
+        if getattr(self._local, 'depth', 0):
+            # failure of guarded operation recorded explicitly
+            self._local.failed = True
+        with self._cond:
+            self._failures += 1
+            self._total_failures += 1
+            self._last_error = str(error) if error is not None else None
+            if self._state == HALF_OPEN:
+                self._delay = min(
+                    self._delay * self.backoff_factor,
+                    self.max_reset_timeout
+                )
+                self._open()
+            elif self._state == CLOSED \
+                    and self._failures >= self.failure_threshold:
+                self._open()
+
+    def aborted(self):
+        """Record operation which ended without proving whether the server
+        is available or not. Another trial is allowed immediately if the
+        circuit is half-open.
+        """
+        with self._cond:
+            if self._state == HALF_OPEN:
+                self._retry_at = time.time()
+                self._change_state(OPEN)
+
+    @contextmanager
+    def guard(self, aborts=()):
+        """Context manager calling ``allow`` before and recording the outcome
+        of the wrapped operation afterwards.
+
+        Nested guards in the same thread are passed through, thus only the
+        outermost operation is recorded.
+
+        :param aborts: Tuple of exception classes recorded as aborted
+            operation even if contained in ``FAILURES``.
+        """
+        if getattr(self._local, 'depth', 0):
+            yield
+            return
+        self.allow()
+        self._local.depth = 1
+        self._local.failed = False
+        try:
+            yield
+        except aborts:
+            self.aborted()
+            raise
+        except FAILURES as e:
+            self.failed(e)
+            raise
+        except PoolTimeout:
+            self.aborted()
+            raise
+        except ldap.LDAPError:
+            # the server answered
+            if not self._local.failed:
+                self.succeeded()
+            raise
+        except BaseException:
+            self.aborted()
+            raise
+        else:
+            if not self._local.failed:
+                self.succeeded()
+        finally:
+            self._local.depth = 0
+
+    def stats(self):
+        """Return dict containing state and counters of this breaker.
+        """
+        with self._cond:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'failures': self._failures,
+                'total_failures': self._total_failures,
+                'successes': self._successes,
+                'rejected': self._rejected,
+                'opened': self._opened,
+                'reset_delay': self._delay,
+                'retry_at': self._retry_at,
+                'last_change': self._last_change,
+                'last_error': self._last_error,
+            }
+
+    def reset(self):
+        """Close circuit and reset counters.
+        """
+        with self._cond:
+            self._init_state()
+            self._cond.notify_all()
+
+    def _init_state(self):
+        self._state = CLOSED
+        self._failures = 0
+        self._total_failures = 0
+        self._successes = 0
+        self._rejected = 0
+        self._opened = 0
+        self._delay = self.reset_timeout
+        self._retry_at = None
+        self._last_change = time.time()
+        self._last_error = None
+
+    def _open(self):
+        # needs to be called with acquired lock.
+        delay = self._delay * (1 - self.jitter * random.random())
+        self._retry_at = time.time() + delay
+        self._opened += 1
+        self._change_state(OPEN)
+        logger.warning(
+            u'Circuit breaker of {} opened, next trial in {:.2f}s: {}'.format(
+                self.name,
+                delay,
+                self._last_error
+            )
+        )
+
+    def _change_state(self, state):
+        # needs to be called with acquired lock.
+        self._state = state
+        self._last_change = time.time()
+        self._cond.notify_all()
+
+
+_breakers = dict()
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **kw):
+    """Return process wide circuit breaker registered by ``name``.
+
+    Breaker gets created with keyword arguments ``kw`` if not exists yet.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **kw)
+        return breaker
+
+
+def breaker_stats():
+    """Return dict containing stats of all registered circuit breakers by
+    name.
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return dict([(breaker.name, breaker.stats()) for breaker in breakers])
+
+
+def reset_breakers():
+    """Forget all registered circuit breakers.
+    """
+    with _breakers_lock:
+        _breakers.clear()
@@ -1,8 +1,49 @@
 # -*- coding: utf-8 -*-
+from bda.cache import ICacheManager
 from bda.cache import Memcached
 from bda.cache import NullCache
+from node.ext.ldap.codec import COMPRESS_THRESHOLD
+from node.ext.ldap.codec import CodecError
+from node.ext.ldap.codec import decode
+from node.ext.ldap.codec import encode
 from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.interfaces import IEncodedCacheProvider
+from node.ext.ldap.interfaces import ILRUCacheProvider
+from node.ext.ldap.interfaces import ITieredCacheProvider
+from six.moves import cPickle as pickle
+from zope.component import adapter
+from zope.component import provideAdapter
 from zope.interface import implementer
+import collections
+import logging
+import six
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+# prefix of keys containing the generation of cached searches. See
+# ``node.ext.ldap.base.LDAPCommunicator.invalidate``.
+GENERATION_KEY_PREFIX = 'generation-'
+
+
+def count_lookup(provider, key, counter):
+    """Increment lookup counter of cache provider.
+
+    Lookups of generations of cached searches are counted separately by the
+    counter prefixed with ``_generation``, e.g. ``_generation_hits`` instead
+    of ``_hits``, thus hits and misses only reflect search results.
+
+    :param provider: Cache provider instance.
+    :param key: Looked up key.
+    :param counter: Attribute name of the counter, e.g. ``_hits``.
+    """
+    if isinstance(key, six.string_types) \
+            and key.startswith(GENERATION_KEY_PREFIX):
+        counter = '_generation' + counter
+    setattr(provider, counter, getattr(provider, counter) + 1)
 
 
 def nullcacheProviderFactory():
@@ -16,10 +57,688 @@ def nullcacheProviderFactory():
 @implementer(ICacheProviderFactory)
 class MemcachedProviderFactory(object):
     """Memcached cache provider factory.
+
+    If ``encoded`` is set, values are stored encoded by
+    ``node.ext.ldap.codec`` instead of pickled.
+    """
+
+    def __init__(self, servers=['127.0.0.1:11211'], encoded=False,
+                 compress_threshold=COMPRESS_THRESHOLD):
+        self.servers = servers
+        self.encoded = encoded
+        self.compress_threshold = compress_threshold
+
+    def __call__(self):
+        cache = Memcached(self.servers)
+        if self.encoded:
+            cache = EncodedCache(cache, self.compress_threshold)
+        return cache
+
+
+@implementer(IEncodedCacheProvider)
+class EncodedCache(object):
+    """Cache provider wrapper storing values encoded.
+
+    Values are encoded by ``node.ext.ldap.codec`` before they are passed to
+    the wrapped cache provider, which results in smaller values than pickle
+    does for search results. Values which cannot be decoded, e.g. written by
+    an incompatible encoding version, are treated as missing.
+    """
+
+    def __init__(self, cache, compress_threshold=COMPRESS_THRESHOLD):
+        """Initialize encoded cache.
+
+        :param cache: Wrapped cache provider.
+        :param compress_threshold: Encoded size in bytes above which values
+            get compressed. ``None`` disables compression.
+        """
+        self.cache = cache
+        self.compress_threshold = compress_threshold
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    @property
+    def timeout(self):
+        return self.cache.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.cache.timeout = timeout
+
+    def reset(self):
+        self.cache.reset()
+
+    def size(self):
+        return self.cache.size()
+
+    def keys(self):
+        return self.cache.keys()
+
+    def values(self):
+        return [value for value in map(self.get, self.keys())
+                if value is not None]
+
+    def stats(self):
+        """Return dict containing counters of hits, misses, lookups of
+        generations, undecodable values, stored values and their total
+        encoded size and the stats of the wrapped cache provider as ``cache``
+        if supported.
+        """
+        with self._lock:
+            stats = {
+                'hits': self._hits,
+                'misses': self._misses,
+                'generation_hits': self._generation_hits,
+                'generation_misses': self._generation_misses,
+                'errors': self._errors,
+                'stored': self._stored,
+                'stored_bytes': self._stored_bytes,
+            }
+        stats['cache'] = _provider_stats(self.cache)
+        return stats
+
+    def reset_stats(self):
+        """Reset counters of this and the wrapped cache provider.
+        """
+        self._reset_counters()
+        _reset_provider_stats(self.cache)
+
+    def _reset_counters(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._generation_hits = 0
+            self._generation_misses = 0
+            self._errors = 0
+            self._stored = 0
+            self._stored_bytes = 0
+
+    def get(self, key, default=None):
+        data = self.cache.get(key)
+        if data is None:
+            with self._lock:
+                count_lookup(self, key, '_misses')
+            return default
+        try:
+            value = decode(data)
+        except CodecError as e:
+            logger.warning(
+                u'Ignoring undecodable cache value {}: {}'.format(key, e)
+            )
+            with self._lock:
+                count_lookup(self, key, '_misses')
+                self._errors += 1
+            return default
+        with self._lock:
+            count_lookup(self, key, '_hits')
+        return value
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, object):
+        self.set(key, object)
+
+    def set(self, key, object, timeout=None):
+        """Store ``object`` encoded by ``key``.
+
+        :param timeout: Seconds until the entry expires. Only supported if
+            wrapped cache provider supports it.
+        """
+        data = encode(object, self.compress_threshold)
+        if timeout is None:
+            self.cache[key] = data
+        else:
+            self.cache.set(key, data, timeout=timeout)
+        with self._lock:
+            self._stored += 1
+            self._stored_bytes += len(data)
+
+    def __delitem__(self, key):
+        del self.cache[key]
+
+
+@implementer(ILRUCacheProvider)
+class LRUCache(object):
+    """Thread safe in-process cache provider.
+
+    Values are stored pickled, thus callers never share mutable cached
+    objects. Cache is bounded by number of entries and by the total size of
+    the pickled values. If a bound is exceeded, the least recently used
+    entries get evicted. Each entry expires after the timeout which was set
+    when it has been stored.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024,
+                 timeout=0):
+        """Initialize LRU cache.
+
+        :param max_entries: Maximum number of entries.
+        :param max_bytes: Maximum total size of pickled values in bytes.
+            Values exceeding this size on their own are not cached.
+        :param timeout: Seconds until entries expire. 0 means never.
+        """
+        if max_entries < 1:
+            raise ValueError(u'max_entries must be >= 1')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # entries as (data, expires) tuples by key. Most recently used
+        # entries are at the end.
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def size(self):
+        return self._bytes
+
+    def stats(self):
+        """Return dict containing number of entries, size of stored values,
+        bounds and counters of hits, misses, lookups of generations,
+        evictions, expired entries and values rejected for their size.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'generation_hits': self._generation_hits,
+                'generation_misses': self._generation_misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'rejected': self._rejected,
+            }
+
+    def reset_stats(self):
+        """Reset counters.
+        """
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._generation_hits = 0
+            self._generation_misses = 0
+            self._evictions = 0
+            self._expirations = 0
+            self._rejected = 0
+
+    def keys(self):
+        now = time.time()
+        with self._lock:
+            return [
+                key for key, (_, expires) in self._entries.items()
+                if not expires or expires > now
+            ]
+
+    def values(self):
+        return [value for value in map(self.get, self.keys())
+                if value is not None]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                count_lookup(self, key, '_misses')
+                return default
+            data, expires = entry
+            if expires and expires <= time.time():
+                self._bytes -= len(data)
+                count_lookup(self, key, '_misses')
+                self._expirations += 1
+                return default
+            # mark as most recently used
+            self._entries[key] = entry
+            count_lookup(self, key, '_hits')
+        return pickle.loads(data)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, object):
+        self.set(key, object)
+
+    def set(self, key, object, timeout=None):
+        """Store ``object`` by ``key``.
+
+        :param timeout: Seconds until the entry expires. Defaults to the
+            timeout of the cache.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        data = pickle.dumps(object, pickle.HIGHEST_PROTOCOL)
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._remove(key)
+            if len(data) > self.max_bytes:
+                self._rejected += 1
+                return
+            self._entries[key] = (data, expires)
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries \
+                    or self._bytes > self.max_bytes:
+                # evict least recently used entry
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        # needs to be called with acquired lock.
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+@implementer(ICacheManager)
+@adapter(ILRUCacheProvider)
+class LRUCacheManager(object):
+    """Cache manager for ``LRUCache``.
+
+    The cache is shared by the communicators, thus the timeout is kept per
+    manager and passed with each entry set.
+    """
+
+    def __init__(self, context):
+        self.cache = context
+        # None means timeout of the cache
+        self.timeout = None
+
+    def setTimeout(self, timeout):
+        self.timeout = timeout
+
+    def getData(self, func, key, force_reload=False, args=[], kwargs={}):
+        ret = self.get(key, force_reload)
+        if ret is None:
+            ret = func(*args, **kwargs)
+            self.set(key, ret)
+        return ret
+
+    def get(self, key, force_reload=False):
+        if force_reload:
+            del self.cache[key]
+            return None
+        return self.cache.get(key, None)
+
+    def set(self, key, item):
+        if self.timeout is None:
+            self.cache[key] = item
+        else:
+            self.cache.set(key, item, timeout=self.timeout)
+
+    def rem(self, key):
+        del self.cache[key]
+
+    def __delitem__(self, key):
+        del self.cache[key]
+
+
+provideAdapter(LRUCacheManager)
+
+
+@implementer(ICacheProviderFactory)
+class LRUCacheProviderFactory(object):
+    """In-process LRU cache provider factory.
+
+    All communicators share one ``LRUCache`` instance.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._cache is None:
+                self._cache = LRUCache(
+                    max_entries=self.max_entries,
+                    max_bytes=self.max_bytes
+                )
+            return self._cache
+
+
+@implementer(ITieredCacheProvider)
+class TieredCache(object):
+    """Two level cache provider.
+
+    A small in-process ``LRUCache`` as first level in front of a shared
+    cache provider, e.g. ``Memcached``, as second level. Values found in the
+    second level get promoted to the first level. Values are written to both
+    levels.
+
+    Generations of cached searches are looked up in the second level, thus
+    invalidation by other processes is noticed. To save round trips, they
+    are kept in the first level for ``generation_timeout`` seconds, which is
+    the maximum time other processes may return outdated results after a
+    write.
+    """
+
+    def __init__(self, l1, l2, generation_timeout=1.):
+        """Initialize tiered cache.
+
+        :param l1: ``LRUCache`` instance.
+        :param l2: Shared cache provider.
+        :param generation_timeout: Seconds generations are kept in ``l1``.
+        """
+        self.l1 = l1
+        self.l2 = l2
+        self.generation_timeout = generation_timeout
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    @property
+    def timeout(self):
+        return self.l2.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.l1.timeout = timeout
+        self.l2.timeout = timeout
+
+    def reset(self):
+        self.l1.reset()
+        self.l2.reset()
+
+    def size(self):
+        return self.l1.size()
+
+    def keys(self):
+        return self.l1.keys()
+
+    def values(self):
+        return self.l1.values()
+
+    def stats(self):
+        """Return dict containing counters of hits per level and misses,
+        both for search results and for lookups of generations, and the stats
+        of both levels as ``l1`` and ``l2`` if supported.
+        """
+        with self._lock:
+            stats = {
+                'l1_hits': self._l1_hits,
+                'l2_hits': self._l2_hits,
+                'misses': self._misses,
+                'generation_l1_hits': self._generation_l1_hits,
+                'generation_l2_hits': self._generation_l2_hits,
+                'generation_misses': self._generation_misses,
+            }
+        stats['l1'] = _provider_stats(self.l1)
+        stats['l2'] = _provider_stats(self.l2)
+        return stats
+
+    def reset_stats(self):
+        """Reset counters of this cache and both levels.
+        """
+        self._reset_counters()
+        _reset_provider_stats(self.l1)
+        _reset_provider_stats(self.l2)
+
+    def _reset_counters(self):
+        with self._lock:
+            self._l1_hits = 0
+            self._l2_hits = 0
+            self._misses = 0
+            self._generation_l1_hits = 0
+            self._generation_l2_hits = 0
+            self._generation_misses = 0
+
+    def get(self, key, default=None):
+        value = self.l1.get(key)
+        if value is not None:
+            with self._lock:
+                count_lookup(self, key, '_l1_hits')
+            return value
+        value = self.l2.get(key)
+        if value is None:
+            with self._lock:
+                count_lookup(self, key, '_misses')
+            return default
+        with self._lock:
+            count_lookup(self, key, '_l2_hits')
+        # promote
+        self.l1.set(key, value, timeout=self._l1_timeout(key))
+        return value
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, object):
+        self.l2[key] = object
+        self.l1.set(key, object, timeout=self._l1_timeout(key))
+
+    def __delitem__(self, key):
+        del self.l2[key]
+        del self.l1[key]
+
+    def _l1_timeout(self, key):
+        if key.startswith(GENERATION_KEY_PREFIX):
+            return self.generation_timeout
+        return None
+
+
+@implementer(ICacheManager)
+@adapter(ITieredCacheProvider)
+class TieredCacheManager(LRUCacheManager):
+    """Cache manager for ``TieredCache``.
+
+    Memcached does not support a timeout per entry, thus the timeout is set
+    on the cache and applies to all communicators sharing it.
+    """
+
+    def setTimeout(self, timeout):
+        self.cache.timeout = timeout
+
+
+provideAdapter(TieredCacheManager)
+
+
+@implementer(ICacheManager)
+@adapter(IEncodedCacheProvider)
+class EncodedCacheManager(LRUCacheManager):
+    """Cache manager for ``EncodedCache``.
+
+    The timeout is set on the cache and applies to all communicators sharing
+    it, since the wrapped cache might not support a timeout per entry.
+    """
+
+    def setTimeout(self, timeout):
+        self.cache.timeout = timeout
+
+
+provideAdapter(EncodedCacheManager)
+
+
+@implementer(ICacheProviderFactory)
+class TieredCacheProviderFactory(object):
+    """Cache provider factory for in-process LRU cache over Memcached.
+
+    All communicators share one ``TieredCache`` instance. If ``encoded`` is
+    set, values are stored in Memcached encoded by ``node.ext.ldap.codec``.
     """
 
-    def __init__(self, servers=['127.0.0.1:11211']):
+    def __init__(self, servers=['127.0.0.1:11211'], max_entries=1000,
+                 max_bytes=16 * 1024 * 1024, generation_timeout=1.,
+                 encoded=False, compress_threshold=COMPRESS_THRESHOLD):
         self.servers = servers
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation_timeout = generation_timeout
+        self.encoded = encoded
+        self.compress_threshold = compress_threshold
+        self._cache = None
+        self._lock = threading.Lock()
 
     def __call__(self):
-        return Memcached(self.servers)
+        with self._lock:
+            if self._cache is None:
+                l2 = Memcached(self.servers)
+                if self.encoded:
+                    l2 = EncodedCache(l2, self.compress_threshold)
+                self._cache = TieredCache(
+                    LRUCache(
+                        max_entries=self.max_entries,
+                        max_bytes=self.max_bytes
+                    ),
+                    l2,
+                    generation_timeout=self.generation_timeout
+                )
+            return self._cache
+
+
+class NegativeCache(object):
+    """Thread safe bounded cache of searches without result.
+
+    Remembers searches which failed with ``ldap.NO_SUCH_OBJECT`` or returned
+    no entries by key for a short time. Entries are indexed by their
+    normalized search base, thus they can be invalidated when an entry at or
+    below the search base gets written. If ``max_entries`` is exceeded, the
+    oldest entries get evicted.
+    """
+
+    def __init__(self, max_entries=10000):
+        """Initialize negative cache.
+
+        :param max_entries: Maximum number of entries.
+        """
+        if max_entries < 1:
+            raise ValueError(u'max_entries must be >= 1')
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # entries as (base, expires, error) tuples by key, oldest first
+        self._entries = collections.OrderedDict()
+        # keys by search base
+        self._bases = dict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Lookup search by ``key``.
+
+        :return: Tuple containing flag whether search is known to have no
+            result and the exception it failed with, if any.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return False, None
+            self._hits += 1
+            return True, entry[2]
+
+    def set(self, key, base, timeout, error=None):
+        """Remember search by ``key`` to have no result.
+
+        :param key: Search key.
+        :param base: Normalized search base.
+        :param timeout: Seconds until the entry expires.
+        :param error: Exception the search failed with, if any.
+        """
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (base, time.time() + timeout, error)
+            self._bases.setdefault(base, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def forget(self, key):
+        """Forget search by ``key``.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, bases):
+        """Forget searches with one of the normalized search ``bases``.
+        """
+        with self._lock:
+            for base in bases:
+                for key in list(self._bases.get(base, [])):
+                    self._remove(key)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._bases.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self):
+        """Return dict containing number of entries, hits and misses.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+    def _remove(self, key):
+        # needs to be called with acquired lock.
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._bases[entry[0]]
+        keys.discard(key)
+        if not keys:
+            del self._bases[entry[0]]
+
+
+_negative_caches = dict()
+_negative_caches_lock = threading.Lock()
+
+
+def get_negative_cache(name, max_entries=10000):
+    """Return process wide negative cache registered by ``name``.
+
+    Negative cache gets created with ``max_entries`` if not exists yet.
+    """
+    with _negative_caches_lock:
+        cache = _negative_caches.get(name)
+        if cache is None:
+            cache = _negative_caches[name] = NegativeCache(max_entries)
+        return cache
+
+
+def negative_cache_stats():
+    """Return dict containing stats of all negative caches by name.
+    """
+    with _negative_caches_lock:
+        items = list(_negative_caches.items())
+    return dict([(name, cache.stats()) for name, cache in items])
+
+
+def reset_negative_caches():
+    """Forget all registered negative caches.
+    """
+    with _negative_caches_lock:
+        _negative_caches.clear()
+
+
+def _provider_stats(cache):
+    # stats of cache provider or None if not supported
+    if hasattr(cache, 'stats'):
+        return cache.stats()
+
+
+def _reset_provider_stats(cache):
+    if hasattr(cache, 'reset_stats'):
+        cache.reset_stats()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Compact binary encoding of cached search results.
+
+Encoded values start with a header containing the format version, flags and
+the number of integers following it. The integers contain value tags, counts
+and the lengths of the byte strings, which follow them concatenated. Search
+results, i.e. lists of ``(dn, {attr: [value, ...]})`` tuples, are written
+with attribute names stored once per value in a name table and referenced by
+index. Tuples, text, bytes, floats and ``None`` are encoded natively, thus
+paged results and stale-while-revalidate entries are covered too. Anything
+else gets pickled. Bodies larger than the compression threshold are
+compressed with zlib if this saves space.
+"""
+from six.moves import cPickle as pickle
+from itertools import islice
+import array
+import six
+import struct
+import sys
+import zlib
+
+
+# format version, increased on incompatible changes
+VERSION = 1
+
+# body size in bytes above which it gets compressed
+COMPRESS_THRESHOLD = 4096
+
+# header flags
+FLAG_ZLIB = 0x01
+FLAG_SHORT = 0x02
+
+# version, flags, number of integers and number of byte strings
+_header = struct.Struct('!BBII')
+_float = struct.Struct('!d')
+
+# value tags
+_RESULTS = 1
+_TUPLE = 2
+_TEXT = 3
+_BYTES = 4
+_FLOAT = 5
+_NONE = 6
+_PICKLE = 7
+
+
+class CodecError(ValueError):
+    """Raised if data cannot be decoded.
+    """
+
+
+def encode(value, compress_threshold=COMPRESS_THRESHOLD):
+    """Encode ``value``.
+
+    :param value: Value to encode.
+    :param compress_threshold: Body size in bytes above which the body gets
+        compressed. ``None`` disables compression.
+    :return: Encoded value as bytes.
+    """
+    names = dict()
+    ints = list()
+    lengths = list()
+    chunks = list()
+    _encode(value, names, ints, lengths, chunks)
+    # name table goes first
+    table = list()
+    for name in sorted(names, key=names.get):
+        table.append(name.encode('utf-8'))
+    ints.insert(0, len(table))
+    lengths = [len(name) for name in table] + lengths
+    flags = 0
+    typecode = 'I'
+    if max(ints + lengths) <= 0xffff:
+        flags |= FLAG_SHORT
+        typecode = 'H'
+    body = b''.join(
+        [_pack(typecode, ints), _pack(typecode, lengths)] + table + chunks
+    )
+    if compress_threshold is not None and len(body) > compress_threshold:
+        compressed = zlib.compress(body, 1)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+    return _header.pack(VERSION, flags, len(ints), len(lengths)) + body
+
+
+def decode(data):
+    """Decode ``data`` created by ``encode``.
+
+    :param data: Encoded value as bytes.
+    :return: Decoded value.
+    :raises CodecError: If ``data`` is not decodable by this version.
+    """
+    try:
+        version, flags, int_count, chunk_count = \
+            _header.unpack_from(data, 0)
+        if version != VERSION:
+            raise CodecError(
+                u'Unsupported encoding version {}'.format(version)
+            )
+        body = data[_header.size:]
+        if flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+        typecode = 'H' if flags & FLAG_SHORT else 'I'
+        ints, pos = _unpack(typecode, body, 0, int_count)
+        lengths, pos = _unpack(typecode, body, pos, chunk_count)
+        offsets = _offsets(lengths, pos)
+        if offsets[-1] != len(body):
+            raise CodecError(u'Invalid encoded data: length mismatch')
+        chunk_iter = iter([
+            body[start:end] for start, end in zip(offsets, offsets[1:])
+        ])
+        next_chunk = _next(chunk_iter)
+        next_int = _next(iter(ints))
+        names = [next_chunk().decode('utf-8') for i in range(next_int())]
+        value = _decode(next_int, chunk_iter, names)
+        if next(chunk_iter, None) is not None:
+            raise CodecError(u'Invalid encoded data: trailing values')
+        return value
+    except CodecError:
+        raise
+    except Exception as e:
+        raise CodecError(u'Invalid encoded data: {!r}'.format(e))
+
+
+def _encode(value, names, ints, lengths, chunks):
+    if value is None:
+        ints.append(_NONE)
+        return
+    if isinstance(value, six.text_type):
+        ints.append(_TEXT)
+        value = value.encode('utf-8')
+    elif isinstance(value, six.binary_type):
+        ints.append(_BYTES)
+    elif isinstance(value, float):
+        ints.append(_FLOAT)
+        value = _float.pack(value)
+    elif isinstance(value, tuple):
+        ints.append(_TUPLE)
+        ints.append(len(value))
+        for item in value:
+            _encode(item, names, ints, lengths, chunks)
+        return
+    elif isinstance(value, list) and _is_results(value):
+        ints.append(_RESULTS)
+        ints.append(len(value))
+        for dn, attrs in value:
+            dn = dn.encode('utf-8')
+            lengths.append(len(dn))
+            chunks.append(dn)
+            ints.append(len(attrs))
+            for name, values in attrs.items():
+                index = names.get(name)
+                if index is None:
+                    index = names[name] = len(names)
+                ints.append(index)
+                ints.append(len(values))
+                lengths.extend([len(item) for item in values])
+                chunks.extend(values)
+        return
+    else:
+        ints.append(_PICKLE)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    lengths.append(len(value))
+    chunks.append(value)
+
+
+def _is_results(value):
+    for entry in value:
+        if type(entry) is not tuple or len(entry) != 2:
+            return False
+        dn, attrs = entry
+        if not isinstance(dn, six.text_type) or type(attrs) is not dict:
+            return False
+        for name, values in attrs.items():
+            if not isinstance(name, six.text_type) \
+                    or type(values) is not list:
+                return False
+            for item in values:
+                if not isinstance(item, six.binary_type):
+                    return False
+    return True
+
+
+def _decode(next_int, chunk_iter, names):
+    tag = next_int()
+    if tag == _RESULTS:
+        return _decode_results(next_int, chunk_iter, names)
+    if tag == _TUPLE:
+        return tuple([
+            _decode(next_int, chunk_iter, names)
+            for i in range(next_int())
+        ])
+    if tag == _NONE:
+        return None
+    value = next(chunk_iter)
+    if tag == _TEXT:
+        return value.decode('utf-8')
+    if tag == _BYTES:
+        return value
+    if tag == _FLOAT:
+        return _float.unpack(value)[0]
+    if tag == _PICKLE:
+        return pickle.loads(value)
+    raise CodecError(u'Unknown value tag {}'.format(tag))
+
+
+def _decode_results(next_int, chunk_iter, names):
+    # hot path. Values of an attribute are consecutive chunks, thus they get
+    # sliced off the chunk iterator at once.
+    next_chunk = _next(chunk_iter)
+    results = list()
+    for i in range(next_int()):
+        dn = next_chunk().decode('utf-8')
+        attrs = dict()
+        for j in range(next_int()):
+            name = names[next_int()]
+            attrs[name] = list(islice(chunk_iter, next_int()))
+        results.append((dn, attrs))
+    return results
+
+
+def _pack(typecode, ints):
+    ints = array.array(typecode, ints)
+    if sys.byteorder != 'little':  # pragma: no cover
+        ints.byteswap()
+    if six.PY2:  # pragma: no cover
+        return ints.tostring()
+    return ints.tobytes()
+
+
+def _unpack(typecode, data, pos, count):
+    ints = array.array(typecode)
+    end = pos + count * ints.itemsize
+    if end > len(data):
+        raise CodecError(u'Invalid encoded data: truncated')
+    if six.PY2:  # pragma: no cover
+        ints.fromstring(data[pos:end])
+    else:
+        ints.frombytes(data[pos:end])
+    if sys.byteorder != 'little':  # pragma: no cover
+        ints.byteswap()
+    return ints, end
+
+
+def _offsets(lengths, pos):
+    # start offsets of byte strings followed by end offset of the last one
+    offsets = [pos]
+    append = offsets.append
+    for length in lengths:
+        pos += length
+        append(pos)
+    return offsets
+
+
+def _next(iterator):
+    if six.PY2:  # pragma: no cover
+        return iterator.next
+    return iterator.__next__
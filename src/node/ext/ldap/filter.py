@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from ldap.filter import escape_filter_chars
 from node.ext.ldap.base import ensure_bytes_py2
 import six
 
@@ -163,3 +164,17 @@ def dict_to_filter(criteria, or_search=False, or_keys=None, or_values=None):
     if _filter is None:
         _filter = LDAPFilter()
     return _filter
+
+
+def equality_filter(attr, value):
+    """Return filter string matching entries with ``value`` of ``attr``.
+
+    Unlike ``LDAPDictFilter``, all special characters of ``value`` including
+    ``*`` are escaped, thus the filter never performs a substring or presence
+    match. If ``value`` is bytes, every byte is escaped, which is binary safe.
+    """
+    if isinstance(value, six.binary_type):
+        value = escape_filter_chars(value.decode('latin-1'), escape_mode=2)
+    else:
+        value = escape_filter_chars(value)
+    return ensure_bytes_py2(u'({0}={1})'.format(attr, value))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import copy
+import ldap
+import threading
+
+
+class FlightTimeout(ldap.TIMEOUT):
+    """Raised if the result of a coalesced call was not available in time.
+    """
+
+
+class Flight(object):
+    """A call in progress other callers wait for.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Thread safe coalescing of concurrent calls.
+
+    Of concurrent calls with equal key only the first one gets executed.
+    Following callers wait for its result instead and get a deep copy of it,
+    thus they never share mutable objects. If the call fails, the exception
+    is raised to all callers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = dict()
+        self._calls = 0
+        self._coalesced = 0
+
+    def do(self, key, func, args=(), timeout=None):
+        """Call ``func`` with ``args`` unless a call with ``key`` is in
+        progress, in which case its result is returned.
+
+        :param key: Key identifying equal calls.
+        :param func: Callable to execute.
+        :param args: Positional arguments for ``func``.
+        :param timeout: Seconds to wait for the result of a call in progress.
+            If exceeded, ``FlightTimeout`` is raised. Defaults to wait until
+            the call is done.
+        :return: Result of ``func``.
+        """
+        leader = False
+        with self._lock:
+            self._calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+            else:
+                flight = self._flights[key] = Flight()
+                leader = True
+        if not leader:
+            return self._wait(key, flight, timeout)
+        try:
+            flight.result = func(*args)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+    def forget(self):
+        """Let following calls start new flights.
+
+        Calls in progress continue and still return their result to the
+        callers already waiting. Used after writes, thus searches started
+        afterwards never get results read before.
+        """
+        with self._lock:
+            self._flights.clear()
+
+    def stats(self):
+        """Return dict containing number of calls, number of calls which
+        waited for a call in progress and number of calls in progress.
+        """
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._flights),
+            }
+
+    def reset(self):
+        """Reset counters.
+        """
+        with self._lock:
+            self._calls = 0
+            self._coalesced = 0
+
+    def _wait(self, key, flight, timeout):
+        if not flight.event.wait(timeout):
+            raise FlightTimeout({
+                'desc': 'Timeout',
+                'info': 'Call {} in progress did not finish in time'.format(
+                    key
+                )
+            })
+        if flight.error is not None:
+            raise flight.error
+        return copy.deepcopy(flight.result)
+
+
+_flights = SingleFlight()
+
+
+def get_flights():
+    """Return process wide ``SingleFlight`` instance.
+    """
+    return _flights
+
+
+def flight_stats():
+    """Return stats of process wide ``SingleFlight`` instance.
+    """
+    return _flights.stats()
+
+
+def reset_flights():
+    """Forget calls in progress and reset counters of process wide
+    ``SingleFlight`` instance.
+    """
+    _flights.forget()
+    _flights.reset()
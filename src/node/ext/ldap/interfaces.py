@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from bda.cache.interfaces import ICacheProvider
 from node.interfaces import INodeAddedEvent
 from node.interfaces import INodeCreatedEvent
 from node.interfaces import INodeDetachedEvent
@@ -19,6 +20,27 @@ class ICacheProviderFactory(Interface):
         """
 
 
+class ILRUCacheProvider(ICacheProvider):
+    """Marker for in-process LRU cache provider.
+    """
+
+
+class ITieredCacheProvider(ICacheProvider):
+    """Marker for two level cache provider.
+    """
+
+
+class IEncodedCacheProvider(ICacheProvider):
+    """Marker for cache provider storing values encoded by
+    ``node.ext.ldap.codec``.
+    """
+
+
+class ISharedMemoryCacheProvider(ICacheProvider):
+    """Marker for cache provider shared by processes of one host.
+    """
+
+
 class ILDAPProps(Interface):
     """LDAP properties configuration interface.
     """
@@ -58,6 +80,83 @@ class ILDAPProps(Interface):
 
     page_size = Attribute('Page size for LDAP queries.')
 
+    page_prefetch = Attribute(
+        'Number of pages fetched ahead when iterating paged results, '
+        '0 disables'
+    )
+
+    pool_size = Attribute('Maximum number of pooled connections, 0 disables')
+
+    pool_min_size = Attribute('Minimum number of pooled connections')
+
+    pool_timeout = Attribute('Pool checkout timeout in seconds')
+
+    pool_idle_timeout = Attribute('Pool idle connection timeout in seconds')
+
+    pool_check_interval = Attribute(
+        'Idle time in seconds after which pooled connections are health '
+        'checked on checkout'
+    )
+
+    auth_pool_size = Attribute(
+        'Maximum number of pooled authentication connections, 0 disables'
+    )
+
+    auth_pool_timeout = Attribute(
+        'Authentication pool checkout timeout in seconds'
+    )
+
+    operation_timeout = Attribute(
+        'Default deadline for LDAP operations in seconds, None disables'
+    )
+
+    breaker_threshold = Attribute(
+        'Number of consecutive failures opening the circuit breaker, '
+        '0 disables'
+    )
+
+    breaker_reset_timeout = Attribute(
+        'Seconds until an open circuit breaker lets a trial pass'
+    )
+
+    breaker_max_reset_timeout = Attribute(
+        'Maximum seconds between circuit breaker trials'
+    )
+
+    breaker_fail_fast = Attribute(
+        'Flag whether to reject operations immediately if circuit breaker '
+        'is open'
+    )
+
+    read_uris = Attribute(
+        'List of read replica URIs. Writes are sent to ``uri``'
+    )
+
+    replica_probe_interval = Attribute(
+        'Seconds between health probes of read replicas'
+    )
+
+    read_your_writes_window = Attribute(
+        'Seconds searches touching written entries are sent to ``uri``'
+    )
+
+    cache_soft_timeout = Attribute(
+        'Seconds after which cached search results get refreshed in the '
+        'background, None disables'
+    )
+
+    single_flight = Attribute(
+        'Flag whether concurrent equal searches are sent to the server once'
+    )
+
+    negative_cache_timeout = Attribute(
+        'Seconds searches without result are remembered, 0 disables'
+    )
+
+    negative_cache_size = Attribute(
+        'Maximum number of searches remembered in negative cache'
+    )
+
 
 class ILDAPPrincipalsConfig(Interface):
     """LDAP principals configuration interface.
@@ -144,12 +243,56 @@ class ILDAPStorage(IStorage):
         'on ``__setitem__`` if not present yet.'
     )
 
+    child_attrlist = Attribute(
+        'Attribute list of the one level search when iterating. If set, '
+        'children are created from the search result.'
+    )
+
     def child_dn(key):
         """Return child DN for ``key``.
 
         :param key: Child key.
         """
 
+    def load_children(attrlist=None):
+        """Load children with one paged one level search and return them.
+
+        :param attrlist: Attributes to search. If ``['*']``, which is the
+            default, the returned attributes are used as loaded attributes of
+            the children.
+        """
+
+    def bulk_add(children, check_existence=False, window=100, timeout=None):
+        """Add children and write them immediately with pipelined adds.
+
+        The directory is not searched for existing entries by default.
+        Children failing to be added are removed again and reported.
+
+        :param children: Iterable of ``(key, node)`` tuples.
+        :param check_existence: Flag whether to search for existing entries
+            first. Existing ones are not added but reported.
+        :param window: Maximum number of adds waiting for their result.
+        :param timeout: Seconds each add may wait for its result.
+        :return: ``node.ext.ldap._node.LDAPBulkResult`` instance.
+        """
+
+    def add_values(name, values):
+        """Add values to attribute of the directory entry without loading or
+        rewriting existing values. Values already present are skipped.
+
+        :param name: Attribute name.
+        :param values: List of values to add.
+        """
+
+    def delete_values(name, values):
+        """Delete values from attribute of the directory entry without
+        loading or rewriting remaining values. Values not present are
+        skipped.
+
+        :param name: Attribute name.
+        :param values: List of values to delete.
+        """
+
     def search(queryFilter=None, criteria=None, attrlist=None,
                relation=None, relation_node=None, exact_match=False,
                or_search=False, or_keys=None, or_values=None,
@@ -195,6 +338,8 @@ class ILDAPStorage(IStorage):
         :param page_size: LDAP pagination search size.
         :param cookie: LDAP pagination search cookie.
         :param get_nodes: Flag whether to return LDAP nodes in search result.
+            Nodes are created from the returned DNs without searching them
+            or the nodes on their path.
         :return result: If no page size defined, return value is the result,
             otherwise a tuple containing (cookie, result).
         """
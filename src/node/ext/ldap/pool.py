@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+import collections
+import ldap
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+class PoolTimeout(ldap.LDAPError):
+    """Raised if no connection could be checked out of a pool in time.
+    """
+
+
+def check_connection(con):
+    """Default connection health check.
+
+    :param con: ``ldap.ldapobject.LDAPObject`` instance.
+    """
+    con.whoami_s()
+
+
+class LDAPConnectionPool(object):
+    """Thread safe pool of LDAP connections.
+
+    Connections are created on demand by calling ``factory`` until
+    ``max_size`` connections exist. Idle connections exceeding ``min_size``
+    get closed after ``idle_timeout`` seconds. Connections which have been
+    idle for at least ``check_interval`` seconds are health checked before
+    they are handed out again.
+    """
+
+    def __init__(self, factory, min_size=0, max_size=10, timeout=10.,
+                 idle_timeout=300., check_interval=30., check=None):
+        """Initialize connection pool.
+
+        :param factory: Callable returning a new ready to use connection.
+        :param min_size: Number of connections kept open even if idle.
+        :param max_size: Maximum number of connections.
+        :param timeout: Seconds to wait for a free connection on checkout.
+            ``None`` means wait forever.
+        :param idle_timeout: Seconds after which idle connections exceeding
+            ``min_size`` get closed.
+        :param check_interval: Seconds a connection may be idle before it gets
+            health checked on checkout. ``None`` disables health checks.
+        :param check: Health check callable getting passed the connection.
+            Must raise ``ldap.LDAPError`` if connection is unusable. Defaults
+            to ``check_connection``.
+        """
+        if max_size < 1:
+            raise ValueError(u'max_size must be >= 1')
+        if min_size > max_size:
+            raise ValueError(u'min_size must not exceed max_size')
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.check = check if check is not None else check_connection
+        self._cond = threading.Condition(threading.Lock())
+        # idle connections as list of (con, last_used) tuples. Most recently
+        # used connections are at the right side.
+        self._idle = collections.deque()
+        # number of existing connections, including checked out ones and the
+        # ones currently being created
+        self._size = 0
+
+    @property
+    def size(self):
+        """Number of existing connections.
+        """
+        return self._size
+
+    @property
+    def idle(self):
+        """Number of idle connections.
+        """
+        return len(self._idle)
+
+    def acquire(self, timeout=None):
+        """Check out a connection.
+
+        :param timeout: Seconds to wait for a free connection. Defaults to
+            ``self.timeout``.
+        :return: Connection object.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            con, last_used = self._checkout(deadline)
+            if con is None:
+                # slot reserved, create new connection
+                return self._create()
+            if self.check_interval is not None \
+                    and time.time() - last_used >= self.check_interval:
+                try:
+                    self.check(con)
+                except ldap.LDAPError as e:
+                    logger.debug(
+                        u'Discard pooled LDAP connection: {}'.format(e)
+                    )
+                    self.release(con, discard=True)
+                    continue
+            return con
+
+    def release(self, con, discard=False):
+        """Return a checked out connection to the pool.
+
+        :param con: Connection object obtained by ``acquire``.
+        :param discard: Flag whether to close the connection instead of
+            reusing it. Pass if the connection is known to be broken.
+        """
+        if discard:
+            self._close(con)
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((con, time.time()))
+            expired = self._expired()
+            self._cond.notify()
+        for con in expired:
+            self._close(con)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager checking out a connection and returning it after
+        use. Connection gets discarded if ``ldap.SERVER_DOWN`` is raised.
+        """
+        con = self.acquire(timeout=timeout)
+        try:
+            yield con
+        except ldap.SERVER_DOWN:
+            self.release(con, discard=True)
+            raise
+        except Exception:
+            self.release(con)
+            raise
+        self.release(con)
+
+    def reap(self):
+        """Close idle connections exceeding ``min_size`` which were not used
+        within ``idle_timeout``.
+        """
+        with self._cond:
+            expired = self._expired()
+            if expired:
+                self._cond.notify_all()
+        for con in expired:
+            self._close(con)
+
+    def close(self):
+        """Close all idle connections. Connections checked out at this time
+        get closed when released.
+        """
+        with self._cond:
+            idle = [con for con, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for con in idle:
+            self._close(con)
+        self.min_size = 0
+        self.idle_timeout = 0
+
+    def _checkout(self, deadline):
+        # return (con, last_used) of an idle connection, or (None, None) if a
+        # slot has been reserved for creating a new connection.
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout({
+                        'desc': u'No LDAP connection available',
+                        'info': u'Pool exhausted, {} connections in use'.format(
+                            self._size
+                        )
+                    })
+                self._cond.wait(remaining)
+
+    def _create(self):
+        try:
+            return self.factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _expired(self):
+        # needs to be called with acquired lock. Remove and return expired
+        # idle connections, least recently used first.
+        expired = list()
+        if self.idle_timeout is None:
+            return expired
+        limit = time.time() - self.idle_timeout
+        while self._idle \
+                and self._size > self.min_size \
+                and self._idle[0][1] <= limit:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _close(self, con):
+        try:
+            con.unbind_s()
+        except Exception as e:
+            logger.debug(u'Failed to close LDAP connection: {}'.format(e))
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory, **kw):
+    """Return process wide connection pool registered by ``key``.
+
+    Pool gets created with ``factory`` and keyword arguments ``kw`` if not
+    exists yet.
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = LDAPConnectionPool(factory, **kw)
+        return pool
+
+
+def close_pools():
+    """Close and forget all registered connection pools.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
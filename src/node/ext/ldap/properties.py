@@ -55,7 +55,27 @@ class LDAPServerProperties(object):
         retry_delay=10.0,
         multivalued_attributes=MULTIVALUED_DEFAULTS,
         binary_attributes=BINARY_DEFAULTS,
-        page_size=1000
+        page_size=1000,
+        page_prefetch=0,
+        pool_size=0,
+        pool_min_size=0,
+        pool_timeout=10.,
+        pool_idle_timeout=300.,
+        pool_check_interval=30.,
+        auth_pool_size=0,
+        auth_pool_timeout=10.,
+        operation_timeout=None,
+        breaker_threshold=0,
+        breaker_reset_timeout=1.,
+        breaker_max_reset_timeout=60.,
+        breaker_fail_fast=True,
+        read_uris=None,
+        replica_probe_interval=10.,
+        read_your_writes_window=5.,
+        cache_soft_timeout=None,
+        single_flight=False,
+        negative_cache_timeout=0,
+        negative_cache_size=10000
     ):
         """Take the connection properties as arguments.
 
@@ -100,6 +120,74 @@ class LDAPServerProperties(object):
             Number of objects requested at once.
             In iterations after this number of objects a new search query is
             sent for the next batch using returned the LDAP cookie.
+        :param page_prefetch: Number of pages fetched ahead in a background
+            thread while iterating paged search results of ``LDAPNode``.
+            Defaults to 0, which means no prefetching.
+        :param pool_size: Maximum number of pooled connections. If > 0,
+            sessions borrow connections from a process wide connection pool
+            shared by all sessions with same URI and credentials. Defaults to
+            0, which means no pooling.
+        :param pool_min_size: Number of pooled connections kept open even if
+            idle. Defaults to 0.
+        :param pool_timeout: Seconds to wait for a free pooled connection
+            before ``node.ext.ldap.pool.PoolTimeout`` is raised. ``None``
+            means wait forever. Defaults to 10.
+        :param pool_idle_timeout: Seconds after which idle pooled connections
+            exceeding ``pool_min_size`` get closed. Defaults to 300.
+        :param pool_check_interval: Seconds a pooled connection may be idle
+            before it gets health checked on checkout. Defaults to 30.
+        :param auth_pool_size: Maximum number of pooled connections used for
+            verifying credentials in ``LDAPSession.authenticate``. Pooled
+            connections get rebound for each check. Defaults to 0, which means
+            a new connection is created for each check.
+        :param auth_pool_timeout: Seconds to wait for a free pooled
+            authentication connection. Defaults to 10.
+        :param operation_timeout: Default deadline in seconds for connecting,
+            searching, authenticating and writing. On expiry the pending
+            operation gets abandoned and
+            ``node.ext.ldap.base.LDAPOperationTimeout`` is raised. Defaults
+            to ``None``, which means wait forever.
+        :param breaker_threshold: Number of consecutive failures to contact
+            the server after which the process wide circuit breaker for the
+            URI opens and operations are rejected with
+            ``node.ext.ldap.breaker.CircuitOpen``. Defaults to 0, which
+            disables circuit breaking.
+        :param breaker_reset_timeout: Seconds after which an open circuit
+            breaker lets a trial operation pass. Doubled after each failed
+            trial. Defaults to 1.
+        :param breaker_max_reset_timeout: Maximum seconds between trial
+            operations. Defaults to 60.
+        :param breaker_fail_fast: Flag whether operations are rejected
+            immediately while the circuit breaker is open. If False, they
+            wait for the next trial once. If True, connections are not
+            retried with ``retry_max`` and ``retry_delay``. Defaults to True.
+        :param read_uris: List of URIs of read replicas. If given, searches
+            are sent to the healthy replica with the lowest latency, while
+            writes and credential checks are sent to the server at ``uri``.
+            Defaults to ``None``, which means all operations are sent to
+            ``uri``.
+        :param replica_probe_interval: Seconds between health probes of read
+            replicas. Probes run in a background thread. Defaults to 10.
+        :param read_your_writes_window: Seconds searches of a session touching
+            an entry written by the session are sent to the server at ``uri``
+            instead of a read replica, which might not have replicated the
+            change yet. Defaults to 5. 0 disables.
+        :param cache_soft_timeout: Seconds after which cached search results
+            are considered stale. Stale results are returned immediately
+            while one background search refreshes them. ``timeout`` still
+            defines when results expire entirely. Defaults to None, which
+            disables stale while revalidate.
+        :param single_flight: Flag whether concurrent equal searches of the
+            process are coalesced. Only the first one is sent to the server,
+            the others wait for its result. Paged searches are not
+            coalesced. Defaults to False.
+        :param negative_cache_timeout: Seconds searches failing with
+            ``ldap.NO_SUCH_OBJECT`` or without result are remembered in a
+            process wide negative cache and not sent to the server again.
+            Writes of the process forget the affected searches. Defaults to
+            0, which disables the negative cache.
+        :param negative_cache_size: Maximum number of searches remembered in
+            the negative cache of a server. Defaults to 10000.
         """
         if uri is None:
             # old school
@@ -122,6 +210,26 @@ class LDAPServerProperties(object):
         self.multivalued_attributes = multivalued_attributes
         self.binary_attributes = binary_attributes
         self.page_size = page_size
+        self.page_prefetch = page_prefetch
+        self.pool_size = pool_size
+        self.pool_min_size = pool_min_size
+        self.pool_timeout = pool_timeout
+        self.pool_idle_timeout = pool_idle_timeout
+        self.pool_check_interval = pool_check_interval
+        self.auth_pool_size = auth_pool_size
+        self.auth_pool_timeout = auth_pool_timeout
+        self.operation_timeout = operation_timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.breaker_max_reset_timeout = breaker_max_reset_timeout
+        self.breaker_fail_fast = breaker_fail_fast
+        self.read_uris = read_uris
+        self.replica_probe_interval = replica_probe_interval
+        self.read_your_writes_window = read_your_writes_window
+        self.cache_soft_timeout = cache_soft_timeout
+        self.single_flight = single_flight
+        self.negative_cache_timeout = negative_cache_timeout
+        self.negative_cache_size = negative_cache_size
 
 
 # B/C
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import ldap
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+class ReplicaSet(object):
+    """Thread safe health and latency registry of read replicas.
+
+    Latency of each replica is tracked as exponentially weighted moving
+    average of the durations of operations and health probes. A replica
+    which failed is considered unhealthy until a health probe succeeds.
+    Probes run in a background thread once ``probe_interval`` seconds have
+    passed since the last probe of a replica.
+    """
+
+    def __init__(self, uris, probe, probe_interval=10., decay=0.3):
+        """Initialize replica set.
+
+        :param uris: List of replica URIs.
+        :param probe: Callable getting passed a replica URI. Must raise
+            ``ldap.LDAPError`` if the replica is unavailable, otherwise
+            return the measured latency in seconds.
+        :param probe_interval: Seconds between health probes of a replica.
+            ``None`` disables probes, failed replicas are not used any more
+            then.
+        :param decay: Weight of a new latency sample in the moving average.
+            Must be between 0 and 1.
+        """
+        if not uris:
+            raise ValueError(u'At least one replica URI required')
+        if not 0 < decay <= 1:
+            raise ValueError(u'decay must be between 0 and 1')
+        self.uris = list(uris)
+        self.probe_interval = probe_interval
+        self.decay = decay
+        self._probe = probe
+        self._lock = threading.Lock()
+        now = time.time()
+        self._replicas = dict([(uri, {
+            'healthy': True,
+            'latency': None,
+            'requests': 0,
+            'failures': 0,
+            'probing': False,
+            'last_probe': now,
+            'last_error': None,
+        }) for uri in self.uris])
+
+    def select(self):
+        """Return healthy replica URIs, lowest latency first.
+
+        Replicas without measured latency come first, thus each replica gets
+        used at least once. Due health probes are started in the background.
+        """
+        due = list()
+        with self._lock:
+            now = time.time()
+            healthy = list()
+            for uri in self.uris:
+                replica = self._replicas[uri]
+                if self.probe_interval is not None \
+                        and not replica['probing'] \
+                        and now - replica['last_probe'] >= self.probe_interval:
+                    replica['probing'] = True
+                    due.append(uri)
+                if replica['healthy']:
+                    healthy.append(uri)
+        for uri in due:
+            thread = threading.Thread(target=self.probe, args=(uri,))
+            thread.daemon = True
+            thread.start()
+        return sorted(
+            healthy,
+            key=lambda uri: self._replicas[uri]['latency'] or 0.
+        )
+
+    def succeeded(self, uri, latency=None):
+        """Record successful operation on replica.
+
+        :param uri: Replica URI.
+        :param latency: Duration of the operation in seconds. If given, it
+            is added to the moving average latency of the replica.
+        """
+        with self._lock:
+            replica = self._replicas[uri]
+            replica['requests'] += 1
+            replica['healthy'] = True
+            if latency is not None:
+                self._measured(replica, latency)
+
+    def failed(self, uri, error=None):
+        """Record failed operation on replica. Replica is considered unhealthy
+        until the next successful health probe.
+
+        :param uri: Replica URI.
+        :param error: Exception the operation failed with.
+        """
+        with self._lock:
+            replica = self._replicas[uri]
+            replica['requests'] += 1
+            replica['failures'] += 1
+            replica['last_error'] = str(error) if error is not None else None
+            if replica['healthy']:
+                logger.warning(
+                    u'Read replica {} unavailable: {}'.format(uri, error)
+                )
+            replica['healthy'] = False
+
+    def probe(self, uri):
+        """Check health and measure latency of replica.
+
+        :param uri: Replica URI.
+        :return: Flag whether replica is healthy.
+        """
+        try:
+            latency = self._probe(uri)
+        except ldap.LDAPError as e:
+            with self._lock:
+                replica = self._replicas[uri]
+                replica['probing'] = False
+                replica['last_probe'] = time.time()
+                replica['last_error'] = str(e)
+                replica['healthy'] = False
+            logger.debug(u'Probe of read replica {} failed: {}'.format(uri, e))
+            return False
+        with self._lock:
+            replica = self._replicas[uri]
+            replica['probing'] = False
+            replica['last_probe'] = time.time()
+            if not replica['healthy']:
+                logger.info(u'Read replica {} available again'.format(uri))
+            replica['healthy'] = True
+            self._measured(replica, latency)
+        return True
+
+    def stats(self):
+        """Return dict containing health and latency of replicas by URI.
+        """
+        with self._lock:
+            return dict([(uri, {
+                'healthy': replica['healthy'],
+                'latency': replica['latency'],
+                'requests': replica['requests'],
+                'failures': replica['failures'],
+                'last_probe': replica['last_probe'],
+                'last_error': replica['last_error'],
+            }) for uri, replica in self._replicas.items()])
+
+    def _measured(self, replica, latency):
+        # needs to be called with acquired lock.
+        if replica['latency'] is None:
+            replica['latency'] = latency
+        else:
+            replica['latency'] += self.decay * (latency - replica['latency'])
+
+
+_replica_sets = dict()
+_replica_sets_lock = threading.Lock()
+
+
+def get_replicas(name, uris, probe, **kw):
+    """Return process wide replica set registered by ``name``.
+
+    Replica set gets created with ``uris``, ``probe`` and keyword arguments
+    ``kw`` if not exists yet.
+    """
+    with _replica_sets_lock:
+        replicas = _replica_sets.get(name)
+        if replicas is None:
+            replicas = _replica_sets[name] = ReplicaSet(uris, probe, **kw)
+        return replicas
+
+
+def replica_stats():
+    """Return dict containing stats of all registered replica sets by name.
+    """
+    with _replica_sets_lock:
+        items = list(_replica_sets.items())
+    return dict([(name, replicas.stats()) for name, replicas in items])
+
+
+def reset_replicas():
+    """Forget all registered replica sets.
+    """
+    with _replica_sets_lock:
+        _replica_sets.clear()
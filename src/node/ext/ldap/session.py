@@ -3,6 +3,12 @@ from node.ext.ldap import BASE
 from node.ext.ldap import LDAPCommunicator
 from node.ext.ldap import LDAPConnector
 from node.ext.ldap import testLDAPConnectivity
+from node.ext.ldap.base import ADD_WINDOW
+from node.ext.ldap.base import LDAPOperationTimeout
+from node.ext.ldap.base import operation_deadline
+from node.ext.ldap.base import remaining_timeout
+from node.ext.ldap.base import SEARCH_WINDOW
+from node.ext.ldap.base import simple_bind
 import ldap
 
 
@@ -36,12 +42,12 @@ class LDAPSession(object):
     def ensure_connection(self):
         """If LDAP directory is down, bind again and retry given function.
         """
-        if self._communicator._con is None:
+        if not self._communicator.bound:
             self._communicator.bind()
 
     def search(self, queryFilter='(objectClass=*)', scope=BASE, baseDN=None,
                force_reload=False, attrlist=None, attrsonly=0,
-               page_size=None, cookie=None):
+               page_size=None, cookie=None, timeout=None):
         if not queryFilter:
             # It makes no sense to really pass these to LDAP, therefore, we
             # interpret them as "don't filter" which in LDAP terms is
@@ -56,7 +62,8 @@ class LDAPSession(object):
             attrlist,
             attrsonly,
             page_size,
-            cookie
+            cookie,
+            timeout=timeout
         )
         if page_size:
             res, cookie = res
@@ -66,26 +73,142 @@ class LDAPSession(object):
             return res, cookie
         return res
 
-    def add(self, dn, data):
+    def search_stream(self, queryFilter='(objectClass=*)', scope=BASE,
+                      baseDN=None, attrlist=None, attrsonly=0,
+                      page_size=None, cookie=None, timeout=None):
+        """Search the directory and yield entries as they arrive.
+
+        Results are not cached. See
+        ``node.ext.ldap.base.LDAPCommunicator.search_stream``.
+
+        :return: ``LDAPSearchStream`` instance. Iterate it to get
+            ``(dn, attrs)`` tuples. After iteration, the paging cookie is
+            available as ``cookie`` attribute.
+        """
+        # see ``search`` for empty query filter handling
+        if not queryFilter:
+            queryFilter = '(objectClass=*)'
         self.ensure_connection()
-        self._communicator.add(dn, data)
+        return self._communicator.search_stream(
+            queryFilter,
+            scope,
+            baseDN,
+            attrlist,
+            attrsonly,
+            page_size,
+            cookie,
+            timeout=timeout
+        )
+
+    def abandon_paged(self, cookie):
+        """Abandon a paged search of the current thread before all pages have
+        been read. See
+        ``node.ext.ldap.base.LDAPCommunicator.abandon_paged``.
+        """
+        self._communicator.abandon_paged(cookie)
+
+    def search_many(self, requests, return_errors=False, timeout=None,
+                    window=SEARCH_WINDOW):
+        """Perform several searches at once with overlapping round trips.
 
-    def authenticate(self, dn, pw):
-        """Verify credentials, but don't rebind the session to that user
+        :param requests: List of dicts containing keyword arguments of
+            ``search``. Pagination is not supported.
+        :param return_errors: Flag whether to return errors of individual
+            searches in place of their result instead of raising.
+        :param timeout: Seconds all searches together may take.
+        :param window: Maximum number of searches waiting for their result.
+        :return: List of search results in order of ``requests``.
         """
-        # Let's bypass connector/communicator until they are sorted out
-        if self._props.ignore_cert:  # pragma: no cover
-            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-        con = ldap.initialize(
-            self._props.uri,
-            bytes_mode=False,
-            bytes_strictness='silent'
+        normalized = list()
+        for request in requests:
+            request = dict(request)
+            # see ``search`` for empty query filter handling
+            if not request.get('queryFilter'):
+                request['queryFilter'] = '(objectClass=*)'
+            request.setdefault('scope', BASE)
+            normalized.append(request)
+        self.ensure_connection()
+        results = self._communicator.search_many(
+            normalized,
+            return_errors=return_errors,
+            timeout=timeout,
+            window=window
         )
-        # Turning referrals off since they cause problems with MS Active
-        # Directory More info: https://www.python-ldap.org/faq.html#usage
-        con.set_option(ldap.OPT_REFERRALS, 0)
+        # ActiveDirectory returns entries with dn None, which can be ignored
+        return [
+            res if isinstance(res, Exception)
+            else [x for x in res if x[0] is not None]
+            for res in results
+        ]
+
+    def add(self, dn, data, timeout=None):
+        self.ensure_connection()
+        self._communicator.add(dn, data, timeout=timeout)
+
+    def add_many(self, entries, window=ADD_WINDOW, timeout=None):
+        """Insert several entries with overlapping round trips.
+
+        :param entries: Iterable of ``(dn, data)`` tuples.
+        :param window: Maximum number of adds waiting for their result.
+        :param timeout: Seconds each add may wait for its result.
+        :return: List containing ``None`` respective the ``ldap.LDAPError``
+            for each entry in order of ``entries``. See
+            ``LDAPCommunicator.add_many``.
+        """
+        self.ensure_connection()
+        return self._communicator.add_many(
+            entries,
+            window=window,
+            timeout=timeout
+        )
+
+    def authenticate(self, dn, pw, timeout=None):
+        """Verify credentials, but don't rebind the session to that user.
+
+        If ``auth_pool_size`` is set on props, a connection from the
+        authentication connection pool gets rebound and returned afterwards,
+        otherwise a new connection is created and closed again.
+
+        :param timeout: Seconds the check may take. If exceeded,
+            ``node.ext.ldap.base.LDAPOperationTimeout`` is raised. Defaults
+            to ``operation_timeout`` of props.
+        """
+        with self._communicator._guard():
+            return self._authenticate(dn, pw, timeout)
+
+    def _authenticate(self, dn, pw, timeout):
+        connector = self._communicator._connector
+        if timeout is None:
+            timeout = connector._operation_timeout
+        deadline = operation_deadline(timeout)
+        pool = connector.auth_pool()
+        if pool is not None:
+            con = pool.acquire(
+                timeout=remaining_timeout(deadline, pool.timeout)
+            )
+            try:
+                res = self._verify_credentials(con, dn, pw, deadline)
+            except (ldap.SERVER_DOWN, LDAPOperationTimeout):
+                # binds can not be abandoned, connection is unusable
+                pool.release(con, discard=True)
+                raise
+            except Exception:
+                pool.release(con)
+                raise
+            pool.release(con)
+            return res
+        con = connector.auth_connect()
         try:
-            con.simple_bind_s(dn, pw)
+            return self._verify_credentials(con, dn, pw, deadline)
+        finally:
+            try:
+                con.unbind_s()
+            except ldap.LDAPError:  # pragma: no cover
+                pass
+
+    def _verify_credentials(self, con, dn, pw, deadline=None):
+        try:
+            simple_bind(con, dn, pw, deadline)
         except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM):
             # The UNWILLING_TO_PERFORM event might be thrown, if you query a
             # local user named ``admin``, but the LDAP server is configured to
@@ -95,7 +218,7 @@ class LDAPSession(object):
         else:
             return True
 
-    def modify(self, dn, data, replace=False):
+    def modify(self, dn, data, replace=False, timeout=None):
         """Modify an existing entry in the directory.
 
         :param dn: Modification DN
@@ -104,17 +227,25 @@ class LDAPSession(object):
             dictionary representing the entry or parts of the entry.
             XXX: dicts not yet
         :param replace: If set to True, replace entry at DN entirely with data.
+        :param timeout: Seconds the operation may take. Defaults to
+            ``operation_timeout`` of props.
         """
         self.ensure_connection()
-        result = self._communicator.modify(dn, data)
+        result = self._communicator.modify(dn, data, timeout=timeout)
         return result
 
-    def delete(self, dn):
-        self._communicator.delete(dn)
+    def delete(self, dn, timeout=None):
+        self.ensure_connection()
+        self._communicator.delete(dn, timeout=timeout)
 
-    def passwd(self, userdn, oldpw, newpw):
+    def passwd(self, userdn, oldpw, newpw, timeout=None):
         self.ensure_connection()
-        result = self._communicator.passwd(userdn, oldpw, newpw)
+        result = self._communicator.passwd(
+            userdn,
+            oldpw,
+            newpw,
+            timeout=timeout
+        )
         return result
 
     def unbind(self):
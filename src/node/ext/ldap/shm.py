@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""Cache provider sharing search results between processes of one host.
+
+POSIX only.
+"""
+from bda.cache import ICacheManager
+from node.ext.ldap.cache import LRUCacheManager
+from node.ext.ldap.cache import count_lookup
+from node.ext.ldap.codec import COMPRESS_THRESHOLD
+from node.ext.ldap.codec import CodecError
+from node.ext.ldap.codec import decode
+from node.ext.ldap.codec import encode
+from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.interfaces import ISharedMemoryCacheProvider
+from zope.component import adapter
+from zope.component import provideAdapter
+from zope.interface import implementer
+import contextlib
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+# file magic and layout version, increased on incompatible changes
+MAGIC = b'NELDAPSC'
+LAYOUT_VERSION = 1
+
+# maximum length of keys in bytes
+MAX_KEY_LENGTH = 250
+
+# magic, layout version, number of sets, slots per set and slot size
+_file_header = struct.Struct('!8sHIII')
+# key length, data length, expires, last used and checksum
+_slot_header = struct.Struct('!HIddI')
+
+
+@implementer(ISharedMemoryCacheProvider)
+class SharedMemoryCache(object):
+    """Cache provider backed by a memory mapped file.
+
+    All processes mapping the same file share the cached values. The file
+    consists of a header followed by ``max_entries`` slots of ``slot_size``
+    bytes, grouped into sets of ``ways`` slots. A key is stored in one of
+    the slots of the set its hash points to. If all of them are used, the
+    least recently used one gets evicted. Values are stored encoded by
+    ``node.ext.ldap.codec``. Values not fitting into a slot are not cached.
+
+    Concurrent access is serialized per set with POSIX record locks, which
+    the system releases if a process dies. Slots are checksummed and written
+    invalidated first, thus slots left half written by a crashed process are
+    treated as empty. If the file header is missing or invalid, e.g.
+    because a process crashed while initializing the file, the file gets
+    initialized again.
+    """
+
+    def __init__(self, path, max_entries=10000, slot_size=64 * 1024, ways=8,
+                 timeout=0, compress_threshold=COMPRESS_THRESHOLD):
+        """Initialize shared memory cache.
+
+        :param path: Path of the file to map. Preferably on a memory backed
+            file system like ``/dev/shm``. Gets created if not exists.
+        :param max_entries: Maximum number of entries. Rounded up to a
+            multiple of ``ways``.
+        :param slot_size: Size of a slot in bytes. Values larger than a slot
+            including key and slot header are not cached.
+        :param ways: Number of slots per set.
+        :param timeout: Seconds until entries expire. 0 means never.
+        :param compress_threshold: Encoded size in bytes above which values
+            get compressed. ``None`` disables compression.
+        :raises ValueError: If the file has been initialized with a
+            different layout.
+        """
+        if max_entries < 1:
+            raise ValueError(u'max_entries must be >= 1')
+        if ways < 1:
+            raise ValueError(u'ways must be >= 1')
+        if slot_size <= _slot_header.size:
+            raise ValueError(
+                u'slot_size must be > {}'.format(_slot_header.size)
+            )
+        self.path = path
+        self.sets = (max_entries + ways - 1) // ways
+        self.ways = ways
+        self.slot_size = slot_size
+        self.timeout = timeout
+        self.compress_threshold = compress_threshold
+        self._size = _file_header.size + self.sets * ways * slot_size
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self._map = None
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._init_file()
+        except Exception:
+            if self._map is not None:
+                self._map.close()
+            os.close(self._fd)
+            raise
+
+    def close(self):
+        """Unmap and close the file.
+        """
+        with self._lock:
+            self._map.close()
+            os.close(self._fd)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def stats(self):
+        """Return dict containing number of entries, size of stored values
+        and counters of hits, misses, lookups of generations, evictions,
+        expired entries, corrupted slots and values rejected for their size.
+
+        Counters are per process. Entries and size are read from the file,
+        which requires to lock all sets one after another.
+        """
+        with self._lock:
+            stats = {
+                'hits': self._hits,
+                'misses': self._misses,
+                'generation_hits': self._generation_hits,
+                'generation_misses': self._generation_misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'corrupted': self._corrupted,
+                'rejected': self._rejected,
+            }
+        stats['entries'] = len(self)
+        stats['bytes'] = self.size()
+        return stats
+
+    def reset_stats(self):
+        """Reset counters of this process.
+        """
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._generation_hits = 0
+            self._generation_misses = 0
+            self._evictions = 0
+            self._expirations = 0
+            self._corrupted = 0
+            self._rejected = 0
+
+    def reset(self):
+        for index in range(self.sets):
+            with self._locked(index):
+                for offset in self._slots(index):
+                    self._clear(offset)
+
+    def size(self):
+        """Return total size of stored values in bytes.
+        """
+        size = 0
+        for index in range(self.sets):
+            with self._locked(index):
+                for offset in self._slots(index):
+                    key_length, length, expires = self._header(offset)[:3]
+                    if key_length and not self._expired(expires):
+                        size += length
+        return size
+
+    def keys(self):
+        keys = list()
+        for index in range(self.sets):
+            with self._locked(index):
+                for offset in self._slots(index):
+                    key_length, length, expires = self._header(offset)[:3]
+                    if key_length and not self._expired(expires):
+                        start = offset + _slot_header.size
+                        keys.append(
+                            self._map[start:start + key_length].decode('utf-8')
+                        )
+        return keys
+
+    def values(self):
+        return [value for value in map(self.get, self.keys())
+                if value is not None]
+
+    def get(self, key, default=None):
+        name = key
+        key = self._key(key)
+        index = self._set(key)
+        with self._locked(index):
+            offset = self._find(index, key)
+            if offset is None:
+                count_lookup(self, name, '_misses')
+                return default
+            key_length, length, expires, used, checksum = \
+                self._header(offset)
+            if self._expired(expires):
+                self._clear(offset)
+                count_lookup(self, name, '_misses')
+                self._expirations += 1
+                return default
+            start = offset + _slot_header.size + key_length
+            data = self._map[start:start + length]
+            if _slot_header.size + key_length + length > self.slot_size \
+                    or self._checksum(key, data) != checksum:
+                # left half written by a crashed process
+                self._clear(offset)
+                count_lookup(self, name, '_misses')
+                self._corrupted += 1
+                return default
+            # mark as most recently used
+            self._map[offset:offset + _slot_header.size] = \
+                _slot_header.pack(key_length, length, expires, time.time(),
+                                  checksum)
+        try:
+            value = decode(data)
+        except CodecError as e:
+            logger.warning(
+                u'Ignoring undecodable cache value {}: {}'.format(key, e)
+            )
+            with self._lock:
+                count_lookup(self, name, '_misses')
+                self._corrupted += 1
+            return default
+        with self._lock:
+            count_lookup(self, name, '_hits')
+        return value
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, object):
+        self.set(key, object)
+
+    def set(self, key, object, timeout=None):
+        """Store ``object`` by ``key``.
+
+        :param timeout: Seconds until the entry expires. Defaults to the
+            timeout of the cache.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        key = self._key(key)
+        data = encode(object, self.compress_threshold)
+        expires = time.time() + timeout if timeout else 0.
+        fits = _slot_header.size + len(key) + len(data) <= self.slot_size
+        index = self._set(key)
+        with self._locked(index):
+            offset = self._find(index, key)
+            if not fits:
+                if offset is not None:
+                    self._clear(offset)
+                self._rejected += 1
+                return
+            if offset is None:
+                offset = self._victim(index)
+                victim = self._header(offset)
+                if victim[0] and not self._expired(victim[2]):
+                    self._evictions += 1
+            # invalidate slot before writing, thus it is never read half
+            # written
+            self._clear(offset)
+            start = offset + _slot_header.size
+            self._map[start:start + len(key)] = key
+            start += len(key)
+            self._map[start:start + len(data)] = data
+            self._map[offset:offset + _slot_header.size] = \
+                _slot_header.pack(len(key), len(data), expires, time.time(),
+                                  self._checksum(key, data))
+
+    def __delitem__(self, key):
+        key = self._key(key)
+        index = self._set(key)
+        with self._locked(index):
+            offset = self._find(index, key)
+            if offset is not None:
+                self._clear(offset)
+
+    def _init_file(self):
+        # map file and initialize it if header is invalid
+        layout = (MAGIC, LAYOUT_VERSION, self.sets, self.ways, self.slot_size)
+        with self._locked(None):
+            stat = os.fstat(self._fd)
+            header = None
+            if stat.st_size >= _file_header.size:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                header = _file_header.unpack(
+                    os.read(self._fd, _file_header.size)
+                )
+                if header[:2] == layout[:2] and header != layout:
+                    raise ValueError(
+                        u'Shared memory cache {} has different '
+                        u'layout'.format(self.path)
+                    )
+            # never shrink the file, other processes might have it mapped
+            if stat.st_size < self._size:
+                os.ftruncate(self._fd, self._size)
+            self._map = mmap.mmap(self._fd, self._size)
+            if header == layout:
+                return
+            logger.info(
+                u'Initializing shared memory cache {}'.format(self.path)
+            )
+            # header gets written last, thus a crash while initializing
+            # leaves an invalid header
+            self._map[:_file_header.size] = b'\x00' * _file_header.size
+            for index in range(self.sets):
+                for offset in self._slots(index):
+                    self._clear(offset)
+            self._map.flush()
+            self._map[:_file_header.size] = _file_header.pack(*layout)
+            self._map.flush()
+
+    @contextlib.contextmanager
+    def _locked(self, index):
+        # lock set by ``index`` for threads and processes. ``None`` locks
+        # the file header.
+        if index is None:
+            start = 0
+            length = _file_header.size
+        else:
+            length = self.ways * self.slot_size
+            start = _file_header.size + index * length
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _key(self, key):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(
+                u'Key length must be between 1 and {}'.format(MAX_KEY_LENGTH)
+            )
+        return key
+
+    def _set(self, key):
+        # index of set by key. Process independent, unlike ``hash``.
+        return int(hashlib.md5(key).hexdigest()[:8], 16) % self.sets
+
+    def _slots(self, index):
+        start = _file_header.size + index * self.ways * self.slot_size
+        return range(start, start + self.ways * self.slot_size,
+                     self.slot_size)
+
+    def _header(self, offset):
+        return _slot_header.unpack_from(self._map, offset)
+
+    def _find(self, index, key):
+        # offset of slot containing ``key`` in set by ``index`` or None
+        for offset in self._slots(index):
+            key_length = self._header(offset)[0]
+            if key_length != len(key):
+                continue
+            start = offset + _slot_header.size
+            if self._map[start:start + key_length] == key:
+                return offset
+
+    def _victim(self, index):
+        # offset of empty, expired or least recently used slot
+        victim = None
+        victim_used = None
+        for offset in self._slots(index):
+            key_length, length, expires, used = self._header(offset)[:4]
+            if not key_length or self._expired(expires):
+                return offset
+            if victim is None or used < victim_used:
+                victim = offset
+                victim_used = used
+        return victim
+
+    def _clear(self, offset):
+        self._map[offset:offset + _slot_header.size] = \
+            b'\x00' * _slot_header.size
+
+    def _expired(self, expires):
+        return expires and expires <= time.time()
+
+    def _checksum(self, key, data):
+        return zlib.crc32(data, zlib.crc32(key)) & 0xffffffff
+
+
+@implementer(ICacheManager)
+@adapter(ISharedMemoryCacheProvider)
+class SharedMemoryCacheManager(LRUCacheManager):
+    """Cache manager for ``SharedMemoryCache``.
+    """
+
+
+provideAdapter(SharedMemoryCacheManager)
+
+
+@implementer(ICacheProviderFactory)
+class SharedMemoryCacheProviderFactory(object):
+    """Shared memory cache provider factory.
+
+    All communicators of a process share one ``SharedMemoryCache`` instance,
+    all processes of the host using the same ``name`` share the file. The
+    file is created in ``directory``, which defaults to ``/dev/shm`` if
+    exists, otherwise to the temp directory. Its name contains the layout,
+    thus processes configured differently do not share it.
+    """
+
+    def __init__(self, name='default', directory=None, max_entries=10000,
+                 slot_size=64 * 1024, ways=8,
+                 compress_threshold=COMPRESS_THRESHOLD):
+        self.name = name
+        if directory is None:
+            directory = '/dev/shm'
+            if not os.path.isdir(directory):
+                directory = tempfile.gettempdir()
+        self.directory = directory
+        self.max_entries = max_entries
+        self.slot_size = slot_size
+        self.ways = ways
+        self.compress_threshold = compress_threshold
+        self._cache = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(
+            self.directory,
+            'node.ext.ldap-{}-{}-{}-{}-{}'.format(
+                self.name,
+                LAYOUT_VERSION,
+                self.max_entries,
+                self.slot_size,
+                self.ways
+            )
+        )
+
+    def __call__(self):
+        with self._lock:
+            if self._cache is None:
+                self._cache = SharedMemoryCache(
+                    self.path,
+                    max_entries=self.max_entries,
+                    slot_size=self.slot_size,
+                    ways=self.ways,
+                    compress_threshold=self.compress_threshold
+                )
+            return self._cache
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+
+
+# upper bounds of latency histogram buckets in seconds. Last bucket counts
+# all greater values.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.,
+    2.5, 5., 10.
+)
+
+# key of counters aggregating base DNs exceeding ``max_bases``
+OTHER_BASES = '*'
+
+
+class Histogram(object):
+    """Histogram of durations in seconds.
+
+    Not thread safe, callers need to synchronize.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """Initialize histogram.
+
+        :param bounds: Ascending upper bounds of the buckets.
+        """
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def observe(self, value):
+        """Add ``value`` to the bucket it belongs to.
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def stats(self):
+        """Return dict containing number and sum of observed values and the
+        bucket counts as ``(upper_bound, count)`` tuples. Upper bound of the
+        last bucket is ``None``.
+        """
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': list(zip(self.bounds + (None,), self.counts)),
+        }
+
+
+class _Counters(object):
+    # counters and latencies of a group of cached searches
+
+    def __init__(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.hit_latency = Histogram()
+        self.miss_latency = Histogram()
+
+    def hit(self, duration, stale):
+        self.hits += 1
+        if stale:
+            self.stale_hits += 1
+        self.hit_latency.observe(duration)
+
+    def miss(self, duration):
+        self.misses += 1
+        self.miss_latency.observe(duration)
+
+    def stats(self, latencies=True):
+        lookups = self.hits + self.misses
+        miss_latency = self.miss_latency
+        # a hit saves the average duration of a search of the group
+        saved = 0.
+        if miss_latency.count:
+            saved = self.hits * (
+                miss_latency.sum / miss_latency.count
+                - self.hit_latency.sum / max(self.hits, 1)
+            )
+        stats = {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.,
+            'time_saved': max(saved, 0.),
+        }
+        if latencies:
+            stats['hit_latency'] = self.hit_latency.stats()
+            stats['miss_latency'] = miss_latency.stats()
+        return stats
+
+
+class CacheStats(object):
+    """Thread safe statistics of cached searches of one server.
+
+    Counts cache hits and misses in total, per operation and per search base
+    and records latencies of cache lookups and of searches sent to the
+    server on cache misses. The time saved by the cache is estimated from
+    the average duration of searches with the same base. To bound memory
+    usage, at most ``max_bases`` search bases are tracked, further ones are
+    counted as ``OTHER_BASES``.
+    """
+
+    def __init__(self, max_bases=1000):
+        self.max_bases = max_bases
+        self._lock = threading.Lock()
+        self.reset()
+
+    def hit(self, operation, base, duration, stale=False):
+        """Count a cache hit.
+
+        :param operation: Name of the operation, e.g. ``search``.
+        :param base: Normalized search base.
+        :param duration: Seconds the cache lookup took.
+        :param stale: Flag whether result was stale.
+        """
+        with self._lock:
+            for counters in self._counters(operation, base):
+                counters.hit(duration, stale)
+
+    def miss(self, operation, base, duration):
+        """Count a cache miss.
+
+        :param operation: Name of the operation, e.g. ``search``.
+        :param base: Normalized search base.
+        :param duration: Seconds the search on the server took.
+        """
+        with self._lock:
+            for counters in self._counters(operation, base):
+                counters.miss(duration)
+
+    def reset(self):
+        with self._lock:
+            self._total = _Counters()
+            self._operations = dict()
+            self._bases = dict()
+
+    def stats(self):
+        """Return dict containing counters and latency histograms in total
+        and counters by operation and by search base.
+        """
+        with self._lock:
+            stats = self._total.stats()
+            stats['operations'] = dict([
+                (name, counters.stats())
+                for name, counters in self._operations.items()
+            ])
+            stats['bases'] = dict([
+                (base, counters.stats(latencies=False))
+                for base, counters in self._bases.items()
+            ])
+            return stats
+
+    def _counters(self, operation, base):
+        # needs to be called with acquired lock.
+        counters = self._operations.get(operation)
+        if counters is None:
+            counters = self._operations[operation] = _Counters()
+        base_counters = self._bases.get(base)
+        if base_counters is None:
+            if len(self._bases) >= self.max_bases:
+                base = OTHER_BASES
+                base_counters = self._bases.get(base)
+            if base_counters is None:
+                base_counters = self._bases[base] = _Counters()
+        return self._total, counters, base_counters
+
+
+_cache_stats = dict()
+_cache_stats_lock = threading.Lock()
+
+
+def get_cache_stats(name):
+    """Return process wide ``CacheStats`` registered by ``name``.
+
+    Gets created if not exists yet.
+    """
+    with _cache_stats_lock:
+        stats = _cache_stats.get(name)
+        if stats is None:
+            stats = _cache_stats[name] = CacheStats()
+        return stats
+
+
+def cache_stats():
+    """Return dict containing stats of cached searches by name.
+    """
+    with _cache_stats_lock:
+        items = list(_cache_stats.items())
+    return dict([(name, stats.stats()) for name, stats in items])
+
+
+def reset_cache_stats():
+    """Forget all registered cache stats.
+    """
+    with _cache_stats_lock:
+        _cache_stats.clear()
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+from ldap.dn import explode_dn
+from ldap.ldapobject import ReconnectLDAPObject
+from ldap.syncrepl import SyncreplConsumer
+from node.ext.ldap.base import LDAPCommunicator
+from node.ext.ldap.base import LDAPConnector
+from node.ext.ldap.base import dn_within
+from node.ext.ldap.base import normalize_dn
+from node.ext.ldap.scope import SUBTREE
+from node.locking import TreeLock
+import ldap
+import logging
+import threading
+import weakref
+
+
+logger = logging.getLogger('node.ext.ldap')
+
+
+class SyncreplConnection(ReconnectLDAPObject, SyncreplConsumer):
+    """Connection passing syncrepl notifications to a ``SyncConsumer``.
+    """
+
+    def __init__(self, uri, consumer, **kw):
+        ReconnectLDAPObject.__init__(self, uri, **kw)
+        self._consumer = consumer
+
+    def syncrepl_get_cookie(self):
+        return self._consumer.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self._consumer.cookie = cookie
+
+    def syncrepl_entry(self, dn, attributes, uuid):
+        self._consumer._entry(dn, uuid)
+
+    def syncrepl_delete(self, uuids):
+        self._consumer._delete(uuids)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        self._consumer._present(uuids, refreshDeletes)
+
+    def syncrepl_refreshdone(self):
+        self._consumer._refresh_done()
+
+
+class SyncConsumer(object):
+    """Background syncrepl (RFC 4533) consumer in refreshAndPersist mode.
+
+    A daemon thread keeps a syncrepl search running against the server at
+    ``uri`` of props. For each entry added, modified, renamed or deleted
+    below ``baseDN``, cached searches which might contain the entry are
+    invalidated and watched node trees and principal storages drop the
+    materialized entry, thus it gets reloaded on next access. Changes
+    contained in the initial refresh are not notified, since nothing could
+    have been cached about them by this consumer yet. If the connection gets
+    lost, the consumer reconnects after ``retry_delay`` seconds and resumes
+    with the last sync cookie.
+
+    Watched node trees and principal storages are modified by the consumer
+    thread while holding their ``node.locking.TreeLock``. Node trees are not
+    thread safe, thus threads accessing watched ones must hold this lock as
+    well, e.g. via ``node.locking.locktree``. Cached searches and listeners
+    do not require locking.
+
+    Requires the ``syncprov`` overlay on the server.
+    """
+
+    connection_factory = SyncreplConnection
+
+    def __init__(self, props, baseDN, scope=SUBTREE,
+                 queryFilter='(objectClass=*)', poll_timeout=1.,
+                 retry_delay=5.):
+        """Initialize syncrepl consumer.
+
+        :param props: ``LDAPProps`` instance. The cache configured by props
+            gets invalidated.
+        :param baseDN: Base DN of the synchronized entries.
+        :param scope: Scope of the synchronized entries.
+        :param queryFilter: Filter of the synchronized entries.
+        :param poll_timeout: Seconds between checks whether the consumer has
+            been stopped.
+        :param retry_delay: Seconds to wait before reconnecting after the
+            connection failed.
+        """
+        self.props = props
+        self.baseDN = baseDN
+        self.scope = scope
+        self.queryFilter = queryFilter
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self.cookie = None
+        self._communicator = LDAPCommunicator(LDAPConnector(props=props))
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._refreshed = threading.Event()
+        self._thread = None
+        # DNs of synchronized entries by entryUUID
+        self._dns = dict()
+        # entryUUIDs reported present in present phase
+        self._present_uuids = set()
+        self._refreshing = False
+        self._notify = False
+        self._nodes = weakref.WeakSet()
+        self._principals = weakref.WeakSet()
+        self._listeners = list()
+        self._notifications = 0
+        self._last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start consumer thread.
+        """
+        with self._lock:
+            if self.running:
+                return
+            self._stopped.clear()
+            self._refreshed.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop consumer thread and wait up to ``timeout`` seconds for it.
+        """
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def wait_refreshed(self, timeout=None):
+        """Wait until the initial refresh is done.
+
+        :return: Flag whether refresh is done.
+        """
+        return self._refreshed.wait(timeout)
+
+    def watch_node(self, node):
+        """Drop changed entries from materialized children of ``node``.
+
+        Node is referenced weakly.
+        """
+        self._nodes.add(node)
+
+    def watch_principals(self, principals):
+        """Drop changed principals from ``LDAPPrincipals`` storage.
+
+        Principals are referenced weakly.
+        """
+        self._principals.add(principals)
+
+    def subscribe(self, listener):
+        """Register callable getting passed the normalized DN of each
+        changed entry.
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def stats(self):
+        """Return dict containing state and counters of the consumer.
+        """
+        return {
+            'running': self.running,
+            'refreshed': self._refreshed.is_set(),
+            'entries': len(self._dns),
+            'notifications': self._notifications,
+            'cookie': self.cookie,
+            'last_error': self._last_error,
+        }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._consume()
+            except ldap.LDAPError as e:
+                self._last_error = str(e)
+                logger.warning(
+                    u'Syncrepl consumer of {} failed: {}'.format(
+                        self._communicator._connector._uri,
+                        e
+                    )
+                )
+                self._stopped.wait(self.retry_delay)
+
+    def _consume(self):
+        connector = self._communicator._connector
+        con = self.connection_factory(
+            connector._uri,
+            self,
+            bytes_mode=False,
+            bytes_strictness='silent',
+            retry_max=connector._retry_max,
+            retry_delay=connector._retry_delay
+        )
+        try:
+            # see ``LDAPConnector.connect``
+            con.set_option(ldap.OPT_REFERRALS, 0)
+            con.protocol_version = connector.protocol
+            if connector._start_tls:  # pragma: no cover
+                con.start_tls_s()
+            con.simple_bind_s(connector._bindDN, connector._bindPW)
+            # changes missed while disconnected get notified
+            self._notify = self.cookie is not None
+            self._refreshing = True
+            self._present_uuids = set()
+            msgid = con.syncrepl_search(
+                self.baseDN,
+                self.scope,
+                mode='refreshAndPersist',
+                filterstr=self.queryFilter,
+                attrlist=['1.1']
+            )
+            while not self._stopped.is_set():
+                try:
+                    if not con.syncrepl_poll(
+                        msgid=msgid,
+                        timeout=self.poll_timeout,
+                        all=1
+                    ):
+                        # search finished by server
+                        return
+                except ldap.TIMEOUT:
+                    continue
+        finally:
+            try:
+                con.unbind_s()
+            except ldap.LDAPError:  # pragma: no cover
+                pass
+
+    def _entry(self, dn, uuid):
+        if self._refreshing:
+            self._present_uuids.add(uuid)
+        previous = self._dns.get(uuid)
+        self._dns[uuid] = dn
+        if previous is not None \
+                and normalize_dn(previous) != normalize_dn(dn):
+            # renamed
+            self._changed(previous)
+        self._changed(dn)
+
+    def _delete(self, uuids):
+        for uuid in uuids:
+            dn = self._dns.pop(uuid, None)
+            if dn is not None:
+                self._changed(dn)
+
+    def _present(self, uuids, refresh_deletes):
+        if uuids is not None:
+            if refresh_deletes:
+                self._delete(uuids)
+            else:
+                self._present_uuids.update(uuids)
+            return
+        if not refresh_deletes:
+            # present phase done, entries not reported present are deleted
+            self._delete([
+                uuid for uuid in list(self._dns)
+                if uuid not in self._present_uuids
+            ])
+        self._present_uuids = set()
+
+    def _refresh_done(self):
+        self._refreshing = False
+        self._present_uuids = set()
+        self._notify = True
+        self._refreshed.set()
+
+    def _changed(self, dn):
+        if not self._notify:
+            return
+        self._notifications += 1
+        self._communicator.invalidate(dn)
+        dn = normalize_dn(dn)
+        for node in list(self._nodes):
+            invalidate_node(node, dn)
+        for principals in list(self._principals):
+            invalidate_principals(principals, dn)
+        for listener in list(self._listeners):
+            try:
+                listener(dn)
+            except Exception:
+                logger.exception(u'Syncrepl listener failed')
+
+
+def invalidate_node(node, dn):
+    """Drop entry at normalized ``dn`` from materialized children of
+    ``node``.
+
+    If ``node`` itself is the entry, its attributes get reloaded. Changed
+    nodes are left untouched. Tree is modified while holding the
+    ``TreeLock`` of ``node``.
+    """
+    base = normalize_dn(node.DN)
+    if not dn_within(dn, base):
+        return
+    with TreeLock(node):
+        if dn == base:
+            attrs = node.nodespaces.get('__attrs__')
+            if attrs is None:
+                # forget attributes returned by a search of the parent
+                node._seed_attrs = None
+            elif not node.changed:
+                attrs.load()
+            return
+        rdns = explode_dn(dn)[:-len(explode_dn(base)) or None]
+        parent = node
+        for rdn in reversed(rdns[1:]):
+            parent = _materialized_child(parent, rdn)
+            if parent is None:
+                return
+        key = _materialized_key(parent, rdns[0])
+        if key is None:
+            return
+        try:
+            parent.invalidate(key)
+        except RuntimeError as e:
+            logger.warning(
+                u'Not invalidating changed node {}: {}'.format(dn, e)
+            )
+
+
+def invalidate_principals(principals, dn):
+    """Drop principal with context at normalized ``dn`` from storage of
+    ``LDAPPrincipals`` instance ``principals``.
+
+    Storage is modified while holding the ``TreeLock`` of ``principals``.
+    """
+    with TreeLock(principals):
+        for key, principal in list(principals.storage.items()):
+            if normalize_dn(principal.context.DN) == dn:
+                try:
+                    principals.invalidate(key)
+                except RuntimeError as e:
+                    logger.warning(
+                        u'Not invalidating changed principal {}: {}'.format(
+                            key,
+                            e
+                        )
+                    )
+                return
+
+
+def _materialized_key(node, rdn):
+    # return key of child by normalized ``rdn`` if loaded in memory
+    for key in list(node.storage.keys()):
+        if normalize_dn(key) == rdn:
+            return key
+
+
+def _materialized_child(node, rdn):
+    key = _materialized_key(node, rdn)
+    if key is not None:
+        return node.storage[key]
@@ -19,6 +19,11 @@ import time
 SCHEMA = os.environ.get('SCHEMA')
 SLAPDBIN = os.environ.get('SLAPD_BIN', 'slapd')
 SLAPDURIS = os.environ.get('SLAPD_URIS', 'ldap://127.0.0.1:12345')
+# additional URIs the test server listens on, used as read replicas
+SLAPDREPLICAURIS = os.environ.get(
+    'SLAPD_REPLICA_URIS',
+    'ldap://127.0.0.1:12346 ldap://127.0.0.1:12347'
+)
 SLAPDDB = os.environ.get('SLAPD_DB', 'mdb')  # or 'bdb', but its deprecated
 LDAPADDBIN = os.environ.get('LDAP_ADD_BIN', 'ldapadd')
 LDAPDELETEBIN = os.environ.get('LDAP_DELETE_BIN', 'ldapdelete')
@@ -73,8 +78,13 @@ directory   %(dbdir)s
 
 # Indices to maintain
 index       objectClass eq
+index       entryCSN,entryUUID eq
 
 overlay     memberof
+
+# syncrepl provider, see ``node.ext.ldap.sync``
+overlay     syncprov
+syncprov-checkpoint 100 10
 """
 
 
@@ -197,7 +207,7 @@ class Slapd(LDAPLayer):
         print("done.")
 
 
-SLAPD = Slapd()
+SLAPD = Slapd(uris=' '.join([SLAPDURIS, SLAPDREPLICAURIS]))
 
 
 class Ldif(LDAPLayer):
@@ -281,6 +291,10 @@ props = LDAPProps(
 )
 
 
+# read replica URIs
+replica_uris = SLAPDREPLICAURIS.split()
+
+
 # base users config
 ucfg = UsersConfig(
     baseDN='dc=my-domain,dc=com',
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Benchmark ``LDAPSession.authenticate`` against the testing LDAP server.
+
+Starts the test LDAP server with ``LDIF_principals`` loaded and measures
+logins per second with and without authentication connection pooling::
+
+    python -m node.ext.ldap.testing.benchmark [logins] [threads]
+"""
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import LDAPSession
+from node.ext.ldap import testing
+from node.ext.ldap.main import flatlayers
+from node.ext.ldap.pool import close_pools
+import sys
+import threading
+import time
+
+
+USER_DN = 'cn=user1,dc=my-domain,dc=com'
+USER_PW = 'foo1'
+
+
+def run_logins(session, logins, threads):
+    """Run ``logins`` credential checks distributed to ``threads`` threads
+    and return logins per second.
+    """
+    per_thread = logins // threads
+    errors = list()
+
+    def login():
+        try:
+            for i in range(per_thread):
+                if not session.authenticate(USER_DN, USER_PW):
+                    raise RuntimeError(u'Authentication failed')
+        except Exception as e:
+            errors.append(e)
+    workers = [threading.Thread(target=login) for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.time() - start
+    if errors:
+        raise errors[0]
+    return per_thread * threads / duration
+
+
+def benchmark(logins=1000, threads=4):
+    """Return tuple containing logins per second without and with
+    authentication connection pooling.
+    """
+    kw = dict(
+        uri=testing.props.uri,
+        user=testing.props.user,
+        password=testing.props.password,
+        cache=False
+    )
+    unpooled = LDAPSession(LDAPProps(**kw))
+    pooled = LDAPSession(LDAPProps(auth_pool_size=threads, **kw))
+    try:
+        return (
+            run_logins(unpooled, logins, threads),
+            run_logins(pooled, logins, threads)
+        )
+    finally:
+        close_pools()
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    layers = flatlayers(testing.LDIF_principals, [])
+    for layer in layers:
+        layer.setUp()
+    try:
+        unpooled, pooled = benchmark(logins=logins, threads=threads)
+    finally:
+        for layer in reversed(layers):
+            layer.tearDown()
+    print(u'{} logins, {} threads'.format(logins, threads))
+    print(u'without authentication pool: {:.1f} logins/s'.format(unpooled))
+    print(u'with authentication pool:    {:.1f} logins/s'.format(pooled))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -4,12 +4,20 @@ import unittest
 
 def test_suite():
     from node.ext.ldap.tests import test_base
+    from node.ext.ldap.tests import test_breaker
     from node.ext.ldap.tests import test_cache
+    from node.ext.ldap.tests import test_codec
     from node.ext.ldap.tests import test_filter
+    from node.ext.ldap.tests import test_flight
     from node.ext.ldap.tests import test_node
+    from node.ext.ldap.tests import test_pool
     from node.ext.ldap.tests import test_properties
+    from node.ext.ldap.tests import test_replica
     from node.ext.ldap.tests import test_schema
     from node.ext.ldap.tests import test_session
+    from node.ext.ldap.tests import test_shm
+    from node.ext.ldap.tests import test_stats
+    from node.ext.ldap.tests import test_sync
 
     from node.ext.ldap.tests import test_ugm_defaults
     from node.ext.ldap.tests import test_ugm_group_of_names
@@ -19,13 +27,25 @@ def test_suite():
 
     suite = unittest.TestSuite()
 
+    if sys.version_info[0] >= 3:
+        from node.ext.ldap.tests import test_aio
+        suite.addTest(unittest.findTestCases(test_aio))
+
     suite.addTest(unittest.findTestCases(test_base))
+    suite.addTest(unittest.findTestCases(test_breaker))
     suite.addTest(unittest.findTestCases(test_cache))
+    suite.addTest(unittest.findTestCases(test_codec))
     suite.addTest(unittest.findTestCases(test_filter))
+    suite.addTest(unittest.findTestCases(test_flight))
     suite.addTest(unittest.findTestCases(test_node))
+    suite.addTest(unittest.findTestCases(test_pool))
     suite.addTest(unittest.findTestCases(test_properties))
+    suite.addTest(unittest.findTestCases(test_replica))
     suite.addTest(unittest.findTestCases(test_schema))
     suite.addTest(unittest.findTestCases(test_session))
+    suite.addTest(unittest.findTestCases(test_shm))
+    suite.addTest(unittest.findTestCases(test_stats))
+    suite.addTest(unittest.findTestCases(test_sync))
 
     suite.addTest(unittest.findTestCases(test_ugm_defaults))
     suite.addTest(unittest.findTestCases(test_ugm_group_of_names))
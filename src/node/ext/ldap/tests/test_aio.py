@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap import LDAPNode
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import LDAPSession
+from node.ext.ldap import SUBTREE
+from node.ext.ldap import testing
+from node.ext.ldap.aio import AsyncLDAPSession
+from node.ext.ldap.aio import async_session
+from node.ext.ldap.cache import LRUCacheProviderFactory
+from node.ext.ldap.testing import props
+from node.ext.ldap.ugm import Users
+from node.tests import NodeTestCase
+from zope.component import getGlobalSiteManager
+import asyncio
+import time
+
+
+def run_until_complete(coro):
+    # ``asyncio.run`` requires Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestAIO(NodeTestCase):
+    layer = testing.LDIF_principals
+
+    def test_session(self):
+        session = AsyncLDAPSession(props)
+
+        async def run():
+            # There's no search base DN set yet
+            err = None
+            try:
+                await session.search('(objectClass=*)', SUBTREE)
+            except ValueError as e:
+                err = e
+            self.assertEqual(str(err), 'baseDN unset.')
+
+            session.baseDN = 'dc=my-domain,dc=com'
+            res = await session.search('(cn=user1)', SUBTREE)
+            self.assertEqual(res[0][0], 'cn=user1,dc=my-domain,dc=com')
+            self.assertEqual(res[0][1]['sn'], [b'Meier'])
+
+            # Paged search
+            res, cookie = await session.search(
+                '(objectClass=person)',
+                SUBTREE,
+                attrlist=['cn'],
+                page_size=2
+            )
+            self.assertEqual(len(res), 2)
+            self.assertTrue(len(cookie) > 0)
+
+            # Many concurrent searches share one connection
+            filters = ['(cn=user{})'.format(i % 3 + 1) for i in range(300)]
+            results = await asyncio.gather(*[
+                session.search(f, SUBTREE, attrlist=['cn']) for f in filters
+            ])
+            self.assertEqual(len(results), 300)
+            for i, res in enumerate(results):
+                cn = 'user{}'.format(i % 3 + 1).encode()
+                self.assertEqual(res[0][1]['cn'], [cn])
+            self.assertEqual(session._dispatcher.pending, 0)
+
+            # Authenticate
+            dn = 'cn=user1,dc=my-domain,dc=com'
+            results = await asyncio.gather(
+                session.authenticate(dn, 'foo1'),
+                session.authenticate(dn, 'invalid'),
+                session.authenticate(dn, 'foo1')
+            )
+            self.assertEqual(results, [True, False, True])
+
+        run_until_complete(run())
+        session.unbind()
+        self.assertEqual(session._dispatcher, None)
+        self.assertEqual(session._auth_cons, [])
+
+    def test_node(self):
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        root.search_scope = SUBTREE
+
+        async def run():
+            res = await root.async_search(queryFilter='(cn=user1)')
+            self.assertEqual(res, ['cn=user1,dc=my-domain,dc=com'])
+
+            res = await root.async_search(
+                queryFilter='(cn=user1)',
+                attrlist=['sn', 'rdn']
+            )
+            self.assertEqual(res, [(
+                'cn=user1,dc=my-domain,dc=com',
+                {'sn': ['Meier'], 'rdn': 'cn=user1'}
+            )])
+
+            sync_res = root.search(queryFilter='(objectClass=person)')
+            res = list()
+            async for dn in root.async_batched_search(
+                    page_size=2,
+                    queryFilter='(objectClass=person)'):
+                res.append(dn)
+            self.assertEqual(sorted(res), sorted(sync_res))
+
+        run_until_complete(run())
+        async_session(root.ldap_session).unbind()
+
+    def test_users(self):
+        users = Users(props, testing.ucfg)
+
+        async def run():
+            self.assertEqual(
+                await users.async_authenticate('user1', 'foo1'),
+                'Meier'
+            )
+            self.assertFalse(await users.async_authenticate('user1', 'bar'))
+            self.assertFalse(await users.async_authenticate('inexistent', 'x'))
+
+        run_until_complete(run())
+        async_session(users.context.ldap_session).unbind()
+
+    def test_shared_cache(self):
+        # Synchronous and asynchronous searches share cached results
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True,
+            timeout=60,
+            cache_soft_timeout=0.05
+        )
+        sync_session = LDAPSession(cache_props)
+        sync_session.baseDN = 'dc=my-domain,dc=com'
+        session = AsyncLDAPSession(cache_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        communicator = session._communicator
+
+        async def run():
+            # Result cached by synchronous search
+            res = sync_session.search('(cn=user1)', SUBTREE, attrlist=['sn'])
+            self.assertEqual(
+                await session.search('(cn=user1)', SUBTREE, attrlist=['sn']),
+                res
+            )
+
+            # Result cached by asynchronous search
+            res = await session.search('(cn=user2)', SUBTREE, attrlist=['sn'])
+            self.assertEqual(len(res), 1)
+            self.assertEqual(
+                sync_session.search('(cn=user2)', SUBTREE, attrlist=['sn']),
+                res
+            )
+
+            # Results are cached with the time they get stale
+            key = communicator.search_key(
+                '(cn=user2)',
+                SUBTREE,
+                'dc=my-domain,dc=com',
+                ['sn']
+            )
+            stale_at, cached = communicator._cache.get(key)
+            self.assertTrue(stale_at > time.time())
+            self.assertEqual(cached, res)
+
+            # Stale results are searched again
+            time.sleep(0.06)
+            self.assertEqual(
+                await session.search('(cn=user2)', SUBTREE, attrlist=['sn']),
+                res
+            )
+            stale_at, cached = communicator._cache.get(key)
+            self.assertTrue(stale_at > time.time())
+
+        run_until_complete(run())
+        session.unbind()
+        sync_session.unbind()
+        gsm.unregisterUtility(factory)
@@ -6,12 +6,22 @@ from node.ext.ldap import LDAPConnector
 from node.ext.ldap import LDAPProps
 from node.ext.ldap import SUBTREE
 from node.ext.ldap import testing
+from node.ext.ldap.base import LDAPOperationTimeout
 from node.ext.ldap.base import cache_key
+from node.ext.ldap.base import common_dn
 from node.ext.ldap.base import main
+from node.ext.ldap.base import operation_deadline
+from node.ext.ldap.base import parent_dn
+from node.ext.ldap.base import prefetch_pages
+from node.ext.ldap.base import simple_bind
 from node.ext.ldap.base import testLDAPConnectivity
+from node.ext.ldap.base import wait_result
 from node.tests import NodeTestCase
 from zope.component import provideAdapter
+import ldap
 import sys
+import threading
+import time
 
 
 class TestBase(NodeTestCase):
@@ -207,3 +217,130 @@ class TestBase(NodeTestCase):
             key,
             u'hällo-wörld-0-None-True-False-hällo-wörld-0-None-True-False'
         )
+
+    def test_parent_dn(self):
+        self.assertEqual(
+            parent_dn(u'cn=foo,ou=bar,dc=my-domain,dc=com'),
+            u'ou=bar,dc=my-domain,dc=com'
+        )
+        self.assertEqual(parent_dn(u'dc=com'), u'dc=com')
+
+    def test_common_dn(self):
+        self.assertEqual(common_dn([
+            u'cn=foo,ou=bar,dc=my-domain,dc=com',
+            u'cn=foo,ou=baz,dc=my-domain,dc=com',
+            u'ou=bar,dc=my-domain,dc=com',
+        ]), u'dc=my-domain,dc=com')
+        self.assertEqual(common_dn([
+            u'ou=bar,dc=my-domain,dc=com',
+        ]), u'ou=bar,dc=my-domain,dc=com')
+        self.assertEqual(common_dn([
+            u'ou=bar,dc=my-domain,dc=com',
+            u'ou=bar,dc=my-domain,dc=org',
+        ]), u'')
+        self.assertEqual(common_dn([]), u'')
+
+    def test_prefetch_pages(self):
+        pages = [([1, 2], 'c1'), ([3, 4], 'c2'), ([5], '')]
+        cookies = list()
+
+        def fetch(cookie):
+            cookies.append(cookie)
+            return pages[len(cookies) - 1]
+        self.assertEqual(
+            list(prefetch_pages(fetch, depth=2)),
+            [[1, 2], [3, 4], [5]]
+        )
+        self.assertEqual(cookies, [None, 'c1', 'c2'])
+
+        # Fetched pages are buffered up to depth
+        fetched = list()
+        release = threading.Event()
+
+        def fetch(cookie):
+            fetched.append(cookie)
+            if len(fetched) > 2:
+                release.wait(1.)
+            return [len(fetched)], 'c{}'.format(len(fetched))
+        res = prefetch_pages(fetch, depth=1)
+        self.assertEqual(next(res), [1])
+        time.sleep(0.1)
+        self.assertEqual(len(fetched), 3)
+        res.close()
+        release.set()
+
+        # Errors are raised in the consuming thread
+        def fetch(cookie):
+            raise ValueError('Fetch failed')
+        err = self.expect_error(ValueError, list, prefetch_pages(fetch))
+        self.assertEqual(str(err), 'Fetch failed')
+
+        err = self.expect_error(
+            ValueError,
+            list,
+            prefetch_pages(fetch, depth=0)
+        )
+        self.assertEqual(str(err), 'Prefetch depth must be >= 1')
+
+    def test_wait_result(self):
+        class DummyConnection(object):
+            abandoned = None
+
+            def result3(self, msgid, all=1, timeout=None):
+                if timeout is not None:
+                    raise ldap.TIMEOUT({'desc': 'Timeout'})
+                return 101, [], msgid, []
+
+            def abandon(self, msgid):
+                self.abandoned = msgid
+
+        con = DummyConnection()
+        self.assertEqual(wait_result(con, 1), (101, [], 1, []))
+        self.assertEqual(con.abandoned, None)
+
+        err = self.expect_error(
+            LDAPOperationTimeout,
+            wait_result,
+            con,
+            2,
+            operation_deadline(10.)
+        )
+        self.assertEqual(err.args[0]['msgid'], 2)
+        self.assertEqual(con.abandoned, 2)
+
+        # Binds can not be abandoned
+        self.expect_error(
+            LDAPOperationTimeout,
+            wait_result,
+            con,
+            3,
+            operation_deadline(10.),
+            abandon=False
+        )
+        self.assertEqual(con.abandoned, 2)
+
+    def test_simple_bind(self):
+        connector = LDAPConnector(props=LDAPProps(
+            uri=testing.props.uri,
+            user=testing.props.user,
+            password=testing.props.password,
+            operation_timeout=10.
+        ))
+        con = connector.bind()
+        self.assertEqual(con.whoami_s(), 'dn:' + testing.props.user)
+
+        # Binds with deadline are replayed when reconnecting
+        con.reconnect(con._uri)
+        self.assertEqual(con.whoami_s(), 'dn:' + testing.props.user)
+        con.unbind_s()
+
+        # Connections not able to reconnect are bound anyway
+        con = ldap.initialize(testing.props.uri)
+        simple_bind(
+            con,
+            testing.props.user,
+            testing.props.password,
+            operation_deadline(10.)
+        )
+        self.assertEqual(con.whoami_s(), 'dn:' + testing.props.user)
+        con.unbind_s()
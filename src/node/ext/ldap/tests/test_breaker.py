@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import LDAPSession
+from node.ext.ldap import SUBTREE
+from node.ext.ldap import testing
+from node.ext.ldap.base import LDAPOperationTimeout
+from node.ext.ldap.breaker import CLOSED
+from node.ext.ldap.breaker import CircuitBreaker
+from node.ext.ldap.breaker import CircuitOpen
+from node.ext.ldap.breaker import HALF_OPEN
+from node.ext.ldap.breaker import OPEN
+from node.ext.ldap.breaker import breaker_stats
+from node.ext.ldap.breaker import reset_breakers
+from node.ext.ldap.testing import props
+from node.tests import NodeTestCase
+import ldap
+import time
+
+
+class TestBreaker(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def tearDown(self):
+        reset_breakers()
+        super(TestBreaker, self).tearDown()
+
+    def test_breaker(self):
+        err = self.expect_error(
+            ValueError,
+            CircuitBreaker,
+            'test',
+            failure_threshold=0
+        )
+        self.assertEqual(str(err), 'failure_threshold must be >= 1')
+
+        breaker = CircuitBreaker(
+            'test',
+            failure_threshold=2,
+            reset_timeout=0.05,
+            max_reset_timeout=0.1,
+            jitter=0.
+        )
+        self.assertEqual(breaker.state, CLOSED)
+
+        def operation(error=None):
+            with breaker.guard():
+                if error is not None:
+                    raise error
+
+        # Errors not indicating an unavailable server do not count
+        self.expect_error(ldap.NO_SUCH_OBJECT, operation, ldap.NO_SUCH_OBJECT({}))
+        self.assertEqual(breaker.stats()['failures'], 0)
+
+        # Circuit opens after consecutive failures
+        self.expect_error(ldap.SERVER_DOWN, operation, ldap.SERVER_DOWN({}))
+        self.assertEqual(breaker.state, CLOSED)
+        self.expect_error(ldap.TIMEOUT, operation, ldap.TIMEOUT({}))
+        self.assertEqual(breaker.state, OPEN)
+
+        # Open circuit rejects operations
+        start = time.time()
+        err = self.expect_error(CircuitOpen, operation)
+        self.assertTrue(time.time() - start < 0.05)
+        self.assertTrue(isinstance(err, ldap.SERVER_DOWN))
+        self.assertEqual(
+            err.args[0]['info'],
+            'Circuit breaker of test is open'
+        )
+        stats = breaker.stats()
+        self.assertEqual(stats['state'], OPEN)
+        self.assertEqual(stats['failures'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['reset_delay'], 0.05)
+
+        # After reset delay one trial passes. Failed trial opens circuit again
+        # with increased delay
+        time.sleep(0.06)
+        breaker.allow()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.expect_error(CircuitOpen, operation)
+        breaker.failed(ldap.SERVER_DOWN({}))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.stats()['reset_delay'], 0.1)
+
+        # Delay is limited by max reset timeout
+        time.sleep(0.11)
+        self.expect_error(ldap.SERVER_DOWN, operation, ldap.SERVER_DOWN({}))
+        self.assertEqual(breaker.stats()['reset_delay'], 0.1)
+
+        # Trials aborted for other reasons allow the next trial immediately
+        time.sleep(0.11)
+        self.expect_error(ValueError, operation, ValueError())
+        self.assertEqual(breaker.state, OPEN)
+
+        # Successful trial closes circuit
+        operation()
+        stats = breaker.stats()
+        self.assertEqual(stats['state'], CLOSED)
+        self.assertEqual(stats['failures'], 0)
+        self.assertEqual(stats['reset_delay'], 0.05)
+        self.assertEqual(stats['total_failures'], 4)
+
+        # Errors of ``aborts`` do not count even if indicating a failure
+        def aborted(error):
+            with breaker.guard(aborts=(ldap.TIMEOUT,)):
+                raise error
+
+        self.expect_error(ldap.TIMEOUT, aborted, ldap.TIMEOUT({}))
+        self.expect_error(ldap.TIMEOUT, aborted, ldap.TIMEOUT({}))
+        stats = breaker.stats()
+        self.assertEqual(stats['state'], CLOSED)
+        self.assertEqual(stats['failures'], 0)
+
+        # Nested guards are passed through
+        with breaker.guard():
+            with breaker.guard():
+                pass
+        self.assertEqual(breaker.stats()['successes'], 3)
+
+        breaker.reset()
+        self.assertEqual(breaker.stats()['successes'], 0)
+
+    def test_breaker_wait(self):
+        # Without fail fast, operations wait for the next trial once
+        breaker = CircuitBreaker(
+            'test',
+            failure_threshold=1,
+            reset_timeout=0.05,
+            jitter=0.,
+            fail_fast=False
+        )
+        breaker.failed(ldap.SERVER_DOWN({}))
+        self.assertEqual(breaker.state, OPEN)
+        start = time.time()
+        with breaker.guard():
+            pass
+        self.assertTrue(time.time() - start >= 0.04)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_session(self):
+        breaker_props = LDAPProps(
+            uri='ldap://127.0.0.1:12399',
+            user=props.user,
+            password=props.password,
+            cache=False,
+            breaker_threshold=2,
+            breaker_reset_timeout=60.
+        )
+        session = LDAPSession(breaker_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        self.expect_error(ldap.SERVER_DOWN, session.search)
+        self.expect_error(ldap.SERVER_DOWN, session.search)
+
+        # Unavailable server is not contacted any more
+        start = time.time()
+        self.expect_error(CircuitOpen, session.search)
+        self.expect_error(CircuitOpen, session.authenticate, 'cn=x', 'x')
+        self.assertTrue(time.time() - start < 0.1)
+        stats = breaker_stats()['ldap://127.0.0.1:12399']
+        self.assertEqual(stats['state'], OPEN)
+        self.assertEqual(stats['rejected'], 2)
+
+        # Available server
+        breaker_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            breaker_threshold=2
+        )
+        session = LDAPSession(breaker_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        self.assertEqual(session.search('(cn=inexistent)', SUBTREE), [])
+        stats = breaker_stats()[props.uri]
+        self.assertEqual(stats['state'], CLOSED)
+        self.assertEqual(stats['successes'], 3)
+
+        # Expired operation deadlines do not indicate an unavailable server
+        for i in range(3):
+            self.expect_error(
+                LDAPOperationTimeout,
+                session.search,
+                '(objectClass=*)',
+                SUBTREE,
+                timeout=0
+            )
+            self.expect_error(
+                LDAPOperationTimeout,
+                list,
+                session.search_stream('(objectClass=*)', SUBTREE, timeout=0)
+            )
+        stats = breaker_stats()[props.uri]
+        self.assertEqual(stats['state'], CLOSED)
+        self.assertEqual(stats['total_failures'], 0)
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        session.unbind()
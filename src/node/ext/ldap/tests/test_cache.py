@@ -1,11 +1,38 @@
+from bda.cache import ICacheManager
 from bda.cache.memcached import Memcached
 from bda.cache.nullcache import NullCache
+from ldap import MOD_DELETE
+from ldap import MOD_REPLACE
+from ldap import NO_SUCH_OBJECT
+from node.ext.ldap import BASE
+from node.ext.ldap import LDAPCommunicator
+from node.ext.ldap import LDAPConnector
+from node.ext.ldap import LDAPNode
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import ONELEVEL
+from node.ext.ldap import SUBTREE
 from node.ext.ldap import testing
+from node.ext.ldap.cache import EncodedCache
+from node.ext.ldap.cache import EncodedCacheManager
+from node.ext.ldap.cache import GENERATION_KEY_PREFIX
+from node.ext.ldap.cache import LRUCache
+from node.ext.ldap.cache import LRUCacheManager
+from node.ext.ldap.cache import LRUCacheProviderFactory
 from node.ext.ldap.cache import MemcachedProviderFactory
+from node.ext.ldap.cache import NegativeCache
+from node.ext.ldap.cache import TieredCache
+from node.ext.ldap.cache import TieredCacheManager
+from node.ext.ldap.cache import TieredCacheProviderFactory
+from node.ext.ldap.cache import negative_cache_stats
 from node.ext.ldap.cache import nullcacheProviderFactory
+from node.ext.ldap.cache import reset_negative_caches
+from node.ext.ldap.codec import encode
 from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.testing import props
 from node.tests import NodeTestCase
+from zope.component import getGlobalSiteManager
 from zope.component import registry
+import time
 
 
 class TestCache(NodeTestCase):
@@ -33,3 +60,614 @@ class TestCache(NodeTestCase):
         self.assertTrue(isinstance(cache, Memcached))
 
         components.unregisterUtility(cache_factory)
+
+    def test_lru_cache(self):
+        err = self.expect_error(ValueError, LRUCache, max_entries=0)
+        self.assertEqual(str(err), 'max_entries must be >= 1')
+
+        cache = LRUCache(max_entries=2)
+        cache['a'] = [('cn=a', {'cn': [b'a']})]
+        self.assertEqual(cache['a'], [('cn=a', {'cn': [b'a']})])
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache['b'], None)
+
+        # Callers get copies of cached values
+        cache['a'][0][1]['cn'].append(b'b')
+        self.assertEqual(cache['a'], [('cn=a', {'cn': [b'a']})])
+
+        # Least recently used entry gets evicted
+        cache['b'] = 'b'
+        cache['a']
+        cache['c'] = 'c'
+        self.assertEqual(sorted(cache.keys()), ['a', 'c'])
+        self.assertEqual(len(cache), 2)
+
+        del cache['a']
+        del cache['inexistent']
+        self.assertEqual(cache.keys(), ['c'])
+        self.assertEqual(cache.values(), ['c'])
+
+        # Bound by size in bytes
+        cache = LRUCache(max_bytes=100)
+        cache['a'] = b'a' * 60
+        cache['b'] = b'b' * 60
+        self.assertEqual(sorted(cache.keys()), ['b'])
+        self.assertTrue(0 < cache.size() <= 100)
+        cache['c'] = b'c' * 200
+        self.assertEqual(cache['c'], None)
+        cache.reset()
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(len(cache), 0)
+
+        # Entries expire after timeout of the cache or of the entry
+        cache = LRUCache(timeout=0.05)
+        cache['a'] = 'a'
+        cache.set('b', 'b', timeout=60)
+        time.sleep(0.06)
+        self.assertEqual(cache['a'], None)
+        self.assertEqual(cache['b'], 'b')
+
+        # Cache manager. Timeout is kept per manager, since managers of
+        # several communicators share the cache
+        manager = ICacheManager(cache)
+        self.assertTrue(isinstance(manager, LRUCacheManager))
+        manager.setTimeout(60)
+        other = ICacheManager(cache)
+        other.setTimeout(0.01)
+        self.assertEqual(cache.timeout, 0.05)
+        manager.set('m', 'm')
+        other.set('o', 'o')
+        time.sleep(0.02)
+        self.assertEqual(manager.get('m'), 'm')
+        self.assertEqual(other.get('o'), None)
+        self.assertEqual(manager.getData(lambda: 'x', 'x'), 'x')
+        self.assertEqual(manager.getData(lambda: 'y', 'x'), 'x')
+        self.assertEqual(manager.getData(lambda: 'y', 'x', True), 'y')
+        manager.rem('x')
+        self.assertEqual(manager.get('x'), None)
+
+    def test_lru_communicator(self):
+        # Register LRU cache provider factory as utility. All communicators
+        # share one cache
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+        self.assertTrue(factory() is factory())
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        communicator.baseDN = 'dc=my-domain,dc=com'
+        res = communicator.search('(objectClass=*)', SUBTREE)
+        self.assertEqual(len(res), 7)
+        # search result and generation of search base
+        self.assertEqual(len(factory()), 2)
+
+        other = LDAPCommunicator(LDAPConnector(cache_props))
+        other.bind()
+        self.assertEqual(
+            other.search('(objectClass=*)', SUBTREE, 'dc=my-domain,dc=com'),
+            res
+        )
+        self.assertEqual(len(factory()), 2)
+
+        communicator.unbind()
+        other.unbind()
+        gsm.unregisterUtility(factory)
+
+    def test_invalidation(self):
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        communicator.baseDN = 'dc=my-domain,dc=com'
+        other = LDAPCommunicator(LDAPConnector(props))
+        other.bind()
+
+        customers = 'ou=customers,dc=my-domain,dc=com'
+        customer1 = 'ou=customer1,' + customers
+        dn = 'cn=cached,' + customer1
+        other.add(dn, {
+            'cn': b'cached',
+            'sn': b'a',
+            'objectclass': (b'person', b'top'),
+        })
+
+        def searches(base=True):
+            search = communicator.search
+            res = [
+                search('(cn=cached)', ONELEVEL, customer1, attrlist=['sn']),
+                search('(cn=cached)', SUBTREE, attrlist=['sn']),
+                len(search('(objectClass=*)', ONELEVEL, customers)),
+            ]
+            if base:
+                res.append(
+                    search('(objectClass=*)', BASE, dn, attrlist=['sn'])
+                )
+            return res
+
+        def sn(value):
+            return [(dn, {'sn': [value]})]
+
+        self.assertEqual(searches(), [sn(b'a'), sn(b'a'), 4, sn(b'a')])
+
+        # Writes of other communicators without cache are not noticed
+        other.modify(dn, [(MOD_REPLACE, 'sn', b'b')])
+        other.add('ou=customer3,' + customers, {
+            'ou': b'customer3',
+            'objectclass': (b'organizationalUnit',),
+        })
+        self.assertEqual(searches(), [sn(b'a'), sn(b'a'), 4, sn(b'a')])
+
+        # Writes invalidate searches which might contain the written entry.
+        # Unrelated searches are still cached
+        communicator.modify(dn, [(MOD_REPLACE, 'sn', b'c')])
+        self.assertEqual(searches(), [sn(b'c'), sn(b'c'), 4, sn(b'c')])
+
+        # Adding and deleting invalidates the ONELEVEL search of the parent
+        communicator.add('ou=customer4,' + customers, {
+            'ou': b'customer4',
+            'objectclass': (b'organizationalUnit',),
+        })
+        self.assertEqual(searches(), [sn(b'c'), sn(b'c'), 6, sn(b'c')])
+        communicator.delete(dn)
+        self.assertEqual(searches(base=False), [[], [], 6])
+        self.expect_error(
+            NO_SUCH_OBJECT,
+            communicator.search,
+            '(objectClass=*)',
+            BASE,
+            dn
+        )
+
+        # Invalidation is shared by all communicators using the cache
+        shared = LDAPCommunicator(LDAPConnector(cache_props))
+        shared.bind()
+        self.assertEqual(
+            len(shared.search('(objectClass=*)', ONELEVEL, customers)),
+            6
+        )
+        shared.delete('ou=customer3,' + customers)
+        shared.delete('ou=customer4,' + customers)
+        self.assertEqual(searches(base=False), [[], [], 4])
+
+        communicator.unbind()
+        other.unbind()
+        shared.unbind()
+        gsm.unregisterUtility(factory)
+
+    def test_tiered_cache(self):
+        # Tiered cache provider factory using memcached as second level
+        factory = TieredCacheProviderFactory(max_entries=10)
+        cache = factory()
+        self.assertTrue(cache is factory())
+        self.assertTrue(isinstance(cache.l1, LRUCache))
+        self.assertEqual(cache.l1.max_entries, 10)
+        self.assertTrue(isinstance(cache.l2, Memcached))
+
+        # Two processes sharing a second level cache
+        l2 = LRUCache()
+        cache = TieredCache(LRUCache(), l2, generation_timeout=0.05)
+        other = TieredCache(LRUCache(), l2, generation_timeout=0.05)
+        manager = ICacheManager(cache)
+        self.assertTrue(isinstance(manager, TieredCacheManager))
+        manager.setTimeout(60)
+        self.assertEqual(cache.l1.timeout, 60)
+        self.assertEqual(l2.timeout, 60)
+
+        # Values are written to both levels
+        cache['a'] = 'a'
+        self.assertEqual(cache.l1['a'], 'a')
+        self.assertEqual(l2['a'], 'a')
+
+        # Values found in second level get promoted
+        self.assertEqual(other.l1['a'], None)
+        self.assertEqual(other['a'], 'a')
+        self.assertEqual(other.l1['a'], 'a')
+
+        # Deleting affects both levels
+        del other['a']
+        self.assertEqual(other['a'], None)
+        self.assertEqual(l2['a'], None)
+        self.assertEqual(cache['a'], 'a')
+
+        # Generations are kept in first level for generation timeout only
+        key = GENERATION_KEY_PREFIX + 'x'
+        cache[key] = '1'
+        self.assertEqual(other[key], '1')
+        del cache[key]
+        cache[key] = '2'
+        self.assertEqual(other[key], '1')
+        time.sleep(0.06)
+        self.assertEqual(other[key], '2')
+
+        cache.reset()
+        self.assertEqual(len(cache.l1), 0)
+        self.assertEqual(len(l2), 0)
+
+    def test_tiered_communicator(self):
+        # Communicators of two processes sharing a second level cache
+        l2 = LRUCache()
+        caches = [
+            TieredCache(LRUCache(), l2, generation_timeout=0.05),
+            TieredCache(LRUCache(), l2, generation_timeout=0.05)
+        ]
+        gsm = getGlobalSiteManager()
+        factory = caches.pop
+        gsm.registerUtility(factory, ICacheProviderFactory)
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        other = LDAPCommunicator(LDAPConnector(cache_props))
+        other.bind()
+        gsm.unregisterUtility(factory, ICacheProviderFactory)
+
+        customers = 'ou=customers,dc=my-domain,dc=com'
+        self.assertEqual(
+            len(communicator.search('(objectClass=*)', ONELEVEL, customers)),
+            4
+        )
+        # Result of other process is promoted from second level
+        self.assertEqual(len(other._cache.cache.l1), 0)
+        self.assertEqual(
+            len(other.search('(objectClass=*)', ONELEVEL, customers)),
+            4
+        )
+        self.assertEqual(len(other._cache.cache.l1), 2)
+
+        # Writes invalidate searches in all processes after generation
+        # timeout
+        dn = 'ou=customer3,' + customers
+        communicator.add(dn, {
+            'ou': b'customer3',
+            'objectclass': (b'organizationalUnit',),
+        })
+        self.assertEqual(
+            len(communicator.search('(objectClass=*)', ONELEVEL, customers)),
+            5
+        )
+        self.assertEqual(
+            len(other.search('(objectClass=*)', ONELEVEL, customers)),
+            4
+        )
+        time.sleep(0.06)
+        self.assertEqual(
+            len(other.search('(objectClass=*)', ONELEVEL, customers)),
+            5
+        )
+
+        other.delete(dn)
+        time.sleep(0.06)
+        self.assertEqual(
+            len(communicator.search('(objectClass=*)', ONELEVEL, customers)),
+            4
+        )
+        communicator.unbind()
+        other.unbind()
+
+    def test_encoded_cache(self):
+        # Memcached provider factory storing values encoded
+        cache = MemcachedProviderFactory(encoded=True)()
+        self.assertTrue(isinstance(cache, EncodedCache))
+        self.assertTrue(isinstance(cache.cache, Memcached))
+        cache = TieredCacheProviderFactory(encoded=True)()
+        self.assertTrue(isinstance(cache.l2, EncodedCache))
+
+        # Values are stored encoded in the wrapped cache provider
+        inner = LRUCache()
+        cache = EncodedCache(inner, compress_threshold=None)
+        manager = ICacheManager(cache)
+        self.assertTrue(isinstance(manager, EncodedCacheManager))
+        manager.setTimeout(60)
+        self.assertEqual(inner.timeout, 60)
+
+        res = [(u'cn=a', {u'cn': [b'a'], u'sn': [b'b']})]
+        cache['a'] = res
+        self.assertEqual(inner['a'], encode(res, None))
+        self.assertEqual(cache['a'], res)
+        self.assertEqual(manager.get('a'), res)
+        self.assertEqual(cache.keys(), ['a'])
+        self.assertEqual(cache.values(), [res])
+        self.assertEqual(cache.get('b', 'default'), 'default')
+
+        # Undecodable values are treated as missing
+        inner['b'] = b'\x00'
+        self.assertEqual(cache['b'], None)
+
+        cache.set('c', u'c', timeout=60)
+        self.assertEqual(cache['c'], u'c')
+        del cache['c']
+        self.assertEqual(cache['c'], None)
+        cache.reset()
+        self.assertEqual(len(inner), 0)
+
+    def test_encoded_communicator(self):
+        cache = EncodedCache(LRUCache())
+        gsm = getGlobalSiteManager()
+
+        def factory():
+            return cache
+        gsm.registerUtility(factory, ICacheProviderFactory)
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        gsm.unregisterUtility(factory, ICacheProviderFactory)
+
+        customers = 'ou=customers,dc=my-domain,dc=com'
+        res = communicator.search('(objectClass=*)', ONELEVEL, customers)
+        self.assertEqual(len(res), 4)
+        self.assertEqual(
+            communicator.search('(objectClass=*)', ONELEVEL, customers),
+            res
+        )
+
+        # Paged results. Only pages not followed by further pages are cached
+        page, cookie = communicator.search(
+            '(objectClass=*)',
+            ONELEVEL,
+            customers,
+            page_size=10
+        )
+        self.assertEqual(len(page), 4)
+        self.assertEqual(
+            communicator.search(
+                '(objectClass=*)',
+                ONELEVEL,
+                customers,
+                page_size=10
+            ),
+            (page, cookie)
+        )
+        page, cookie = communicator.search(
+            '(objectClass=*)',
+            ONELEVEL,
+            customers,
+            page_size=2
+        )
+        self.assertEqual(len(page), 2)
+        self.assertEqual(cache.get(communicator.search_key(
+            '(objectClass=*)',
+            ONELEVEL,
+            customers,
+            page_size=2,
+            cookie=''
+        )), None)
+        communicator.unbind()
+
+    def test_stale_while_revalidate(self):
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True,
+            timeout=60,
+            cache_soft_timeout=0.05
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        other = LDAPCommunicator(LDAPConnector(props))
+        other.bind()
+
+        customers = 'ou=customers,dc=my-domain,dc=com'
+
+        def search():
+            return len(communicator.search(
+                '(objectClass=*)',
+                ONELEVEL,
+                customers
+            ))
+
+        def search_many():
+            return len(communicator.search_many([dict(
+                queryFilter='(objectClass=*)',
+                scope=ONELEVEL,
+                baseDN=customers
+            )])[0])
+
+        self.assertEqual(search(), 4)
+        dn = 'ou=customer3,' + customers
+        other.add(dn, {
+            'ou': b'customer3',
+            'objectclass': (b'organizationalUnit',),
+        })
+        self.assertEqual(search(), 4)
+        self.assertEqual(search_many(), 4)
+
+        # Stale result is returned and refreshed in background
+        time.sleep(0.06)
+        self.assertEqual(search(), 4)
+        for i in range(50):
+            if search() == 5:
+                break
+            time.sleep(0.01)
+        self.assertEqual(search(), 5)
+
+        # ``search_many`` searches stale results again
+        other.delete(dn)
+        self.assertEqual(search_many(), 5)
+        time.sleep(0.06)
+        self.assertEqual(search_many(), 4)
+        self.assertEqual(search(), 4)
+
+        communicator.unbind()
+        other.unbind()
+        gsm.unregisterUtility(factory)
+
+    def test_negative_cache(self):
+        err = self.expect_error(ValueError, NegativeCache, 0)
+        self.assertEqual(str(err), 'max_entries must be >= 1')
+
+        cache = NegativeCache(max_entries=2)
+        self.assertEqual(cache.get('a'), (False, None))
+
+        error = NO_SUCH_OBJECT({})
+        cache.set('a', u'cn=a,dc=x', 60, error=error)
+        cache.set('b', u'dc=x', 60)
+        self.assertEqual(cache.get('a'), (True, error))
+        self.assertEqual(cache.get('b'), (True, None))
+
+        # Oldest entries get evicted
+        cache.set('c', u'dc=y', 60)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), (False, None))
+
+        # Entries expire
+        cache.set('d', u'dc=y', 0.01)
+        time.sleep(0.02)
+        self.assertEqual(cache.get('d'), (False, None))
+
+        # Entries are invalidated by search base
+        cache.set('a', u'cn=a,dc=x', 60, error=error)
+        cache.invalidate([u'dc=x'])
+        self.assertEqual(cache.get('a'), (True, error))
+        self.assertEqual(cache.get('b'), (False, None))
+        cache.invalidate([u'cn=a,dc=x'])
+        self.assertEqual(cache.get('a'), (False, None))
+
+        self.assertEqual(
+            cache.stats(),
+            {'entries': 1, 'hits': 3, 'misses': 5}
+        )
+        cache.reset()
+        self.assertEqual(
+            cache.stats(),
+            {'entries': 0, 'hits': 0, 'misses': 0}
+        )
+
+    def test_negative_communicator(self):
+        negative_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            negative_cache_timeout=60
+        )
+        communicator = LDAPCommunicator(LDAPConnector(negative_props))
+        communicator.bind()
+        communicator.baseDN = 'dc=my-domain,dc=com'
+        other = LDAPCommunicator(LDAPConnector(props))
+        other.bind()
+
+        customer1 = 'ou=customer1,ou=customers,dc=my-domain,dc=com'
+        dn = 'cn=negative,' + customer1
+        data = {
+            'cn': b'negative',
+            'sn': b'negative',
+            'objectclass': (b'person', b'top'),
+        }
+
+        # Inexistent entries and searches without result are remembered
+        self.expect_error(
+            NO_SUCH_OBJECT,
+            communicator.search,
+            '(objectClass=*)',
+            BASE,
+            dn
+        )
+        self.assertEqual(
+            communicator.search('(cn=negative)', SUBTREE),
+            []
+        )
+        other.add(dn, data)
+        self.expect_error(
+            NO_SUCH_OBJECT,
+            communicator.search,
+            '(objectClass=*)',
+            BASE,
+            dn
+        )
+        self.assertEqual(
+            communicator.search('(cn=negative)', SUBTREE),
+            []
+        )
+        stats = negative_cache_stats()[props.uri]
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['hits'], 2)
+
+        # Searches which could not be sent are not remembered
+        self.assertEqual(communicator.search('(cn=negative', SUBTREE), [])
+        self.assertEqual(negative_cache_stats()[props.uri]['entries'], 2)
+
+        # Reloaded searches bypass and update the negative cache
+        self.assertEqual(
+            len(communicator.search(
+                '(cn=negative)',
+                SUBTREE,
+                force_reload=True
+            )),
+            1
+        )
+        self.assertEqual(
+            len(communicator.search('(cn=negative)', SUBTREE)),
+            1
+        )
+        self.assertEqual(negative_cache_stats()[props.uri]['entries'], 1)
+
+        # Writes outside of search base do not affect remembered searches
+        communicator.modify(
+            'ou=demo,dc=my-domain,dc=com',
+            [(MOD_REPLACE, 'description', b'negative')]
+        )
+        self.expect_error(
+            NO_SUCH_OBJECT,
+            communicator.search,
+            '(objectClass=*)',
+            BASE,
+            dn
+        )
+
+        # Writes at or below search base invalidate remembered searches
+        other.delete(dn)
+        communicator.add(dn, data)
+        self.assertEqual(
+            len(communicator.search('(objectClass=*)', BASE, dn)),
+            1
+        )
+        self.assertEqual(
+            len(communicator.search('(cn=negative)', SUBTREE)),
+            1
+        )
+        communicator.delete(dn)
+        communicator.modify(
+            'ou=demo,dc=my-domain,dc=com',
+            [(MOD_DELETE, 'description', None)]
+        )
+
+        # Nodes benefit from negative cache
+        node = LDAPNode(customer1, negative_props)
+        self.expect_error(KeyError, node.__getitem__, 'cn=negative')
+        self.expect_error(KeyError, node.__getitem__, 'cn=negative')
+        self.assertEqual(negative_cache_stats()[props.uri]['hits'], 4)
+
+        communicator.unbind()
+        other.unbind()
+        reset_negative_caches()
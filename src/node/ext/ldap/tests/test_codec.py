@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap import testing
+from node.ext.ldap.codec import CodecError
+from node.ext.ldap.codec import FLAG_SHORT
+from node.ext.ldap.codec import FLAG_ZLIB
+from node.ext.ldap.codec import VERSION
+from node.ext.ldap.codec import decode
+from node.ext.ldap.codec import encode
+from node.tests import NodeTestCase
+from six.moves import cPickle as pickle
+import struct
+
+
+def results(count):
+    return [(
+        u'uid=user{},ou=people,dc=my-domain,dc=com'.format(i),
+        {
+            u'objectClass': [b'top', b'person', b'inetOrgPerson'],
+            u'uid': [u'user{}'.format(i).encode('utf-8')],
+            u'cn': [u'Üser {}'.format(i).encode('utf-8')],
+            u'memberOf': [
+                u'cn=group{},dc=my-domain,dc=com'.format(j).encode('utf-8')
+                for j in range(3)
+            ],
+        }
+    ) for i in range(count)]
+
+
+class TestCodec(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def test_codec(self):
+        # Search results
+        res = results(2)
+        data = encode(res)
+        self.assertTrue(isinstance(data, bytes))
+        self.assertEqual(decode(data), res)
+        self.assertTrue(
+            len(data) < len(pickle.dumps(res, pickle.HIGHEST_PROTOCOL))
+        )
+
+        # Attribute names are stored once
+        self.assertEqual(data.count(b'memberOf'), 1)
+
+        # Header contains version and flags
+        version, flags = struct.unpack('!BB', data[:2])
+        self.assertEqual(version, VERSION)
+        self.assertEqual(flags, FLAG_SHORT)
+
+        # Empty results, attribute only results and unicode DNs
+        self.assertEqual(decode(encode([])), [])
+        res = [(u'cn=Müller,dc=my-domain,dc=com', {u'cn': []})]
+        self.assertEqual(decode(encode(res)), res)
+
+        # Paged results, stale while revalidate entries and generations
+        for value in [
+            (results(2), b'cookie'),
+            (1.5, (results(2), u'')),
+            u'6a1f',
+            b'6a1f',
+            None,
+        ]:
+            self.assertEqual(decode(encode(value)), value)
+
+        # Other values get pickled
+        for value in [[1, 2], {'a': 1}, 1, [(b'cn=a', {})]]:
+            self.assertEqual(decode(encode(value)), value)
+
+        # Large values are compressed
+        res = results(200)
+        data = encode(res)
+        self.assertEqual(
+            struct.unpack('!BB', data[:2])[1],
+            FLAG_ZLIB | FLAG_SHORT
+        )
+        self.assertTrue(len(data) * 5 < len(encode(res, None)))
+        self.assertEqual(decode(data), res)
+
+        # Values containing lengths above 65535
+        res = [(u'cn=a', {u'jpegPhoto': [b'x' * 70000]})]
+        data = encode(res, None)
+        self.assertEqual(struct.unpack('!BB', data[:2])[1], 0)
+        self.assertEqual(decode(data), res)
+
+        # Invalid data
+        data = struct.pack('!BBII', 2, 0, 0, 0)
+        err = self.expect_error(CodecError, decode, data)
+        self.assertEqual(str(err), 'Unsupported encoding version 2')
+        data = encode(results(2))
+        self.expect_error(CodecError, decode, data[:-1])
+        self.expect_error(CodecError, decode, data + b'x')
+        self.expect_error(CodecError, decode, b'')
+        self.expect_error(CodecError, decode, None)
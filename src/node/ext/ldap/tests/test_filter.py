@@ -2,6 +2,7 @@
 from node.base import AttributedNode
 from node.ext.ldap import testing
 from node.ext.ldap.filter import dict_to_filter
+from node.ext.ldap.filter import equality_filter
 from node.ext.ldap.filter import LDAPDictFilter
 from node.ext.ldap.filter import LDAPFilter
 from node.ext.ldap.filter import LDAPRelationFilter
@@ -193,3 +194,17 @@ class TestFilter(NodeTestCase):
             'someUid:otherUid|inexistent:inexistent'
         )
         self.assertEqual(str(rel_filter), '(otherUid=123ä)')
+
+    def test_equality_filter(self):
+        # All special characters are escaped, including ``*``
+        self.assertEqual(
+            equality_filter('member', 'cn=a*(b)\\c'),
+            '(member=cn=a\\2a\\28b\\29\\5cc)'
+        )
+        self.assertEqual(equality_filter('cn', '123ä'), '(cn=123ä)')
+
+        # Bytes get escaped byte wise
+        self.assertEqual(
+            equality_filter('jpegPhoto', b'\x00*a'),
+            '(jpegPhoto=\\00\\2a\\61)'
+        )
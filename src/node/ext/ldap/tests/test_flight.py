@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import LDAPSession
+from node.ext.ldap import SUBTREE
+from node.ext.ldap import testing
+from node.ext.ldap.flight import FlightTimeout
+from node.ext.ldap.flight import SingleFlight
+from node.ext.ldap.flight import flight_stats
+from node.ext.ldap.flight import reset_flights
+from node.ext.ldap.pool import close_pools
+from node.ext.ldap.testing import props
+from node.tests import NodeTestCase
+import ldap
+import threading
+import time
+
+
+class TestFlight(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def tearDown(self):
+        reset_flights()
+        close_pools()
+        super(TestFlight, self).tearDown()
+
+    def test_single_flight(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        proceed = threading.Event()
+        calls = list()
+
+        def func(value):
+            calls.append(value)
+            started.set()
+            proceed.wait()
+            if isinstance(value, Exception):
+                raise value
+            return [value]
+
+        def call(key, value, results, timeout=None):
+            try:
+                results.append(flights.do(key, func, (value,), timeout))
+            except Exception as e:
+                results.append(e)
+
+        # Concurrent calls with equal key are executed once
+        results = list()
+        leader = threading.Thread(target=call, args=('a', 'x', results))
+        leader.start()
+        started.wait()
+        followers = [
+            threading.Thread(target=call, args=('a', 'y', results))
+            for i in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        for i in range(100):
+            if flights.stats()['coalesced'] == 3:
+                break
+            time.sleep(0.01)
+        proceed.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual(calls, ['x'])
+        self.assertEqual(results, [['x']] * 4)
+
+        # Callers get copies of the result
+        self.assertEqual(len(set([id(_) for _ in results])), 4)
+        self.assertEqual(
+            flights.stats(),
+            {'calls': 4, 'coalesced': 3, 'in_flight': 0}
+        )
+
+        # Errors are raised to all callers
+        started.clear()
+        proceed.clear()
+        results = list()
+        error = ldap.NO_SUCH_OBJECT({})
+        leader = threading.Thread(target=call, args=('a', error, results))
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call, args=('a', 'y', results))
+        follower.start()
+        for i in range(100):
+            if flights.stats()['coalesced'] == 4:
+                break
+            time.sleep(0.01)
+        proceed.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(results, [error, error])
+
+        # Waiting callers time out
+        started.clear()
+        proceed.clear()
+        results = list()
+        leader = threading.Thread(target=call, args=('a', 'x', results))
+        leader.start()
+        started.wait()
+        call('a', 'y', results, 0.01)
+        self.assertTrue(isinstance(results[0], FlightTimeout))
+
+        # Calls in progress are forgotten, but still return their result
+        flights.forget()
+        self.assertEqual(flights.stats()['in_flight'], 0)
+        proceed.set()
+        leader.join()
+        self.assertEqual(results[1], ['x'])
+        call('a', 'z', results)
+        self.assertEqual(results[2], ['z'])
+
+        flights.reset()
+        self.assertEqual(
+            flights.stats(),
+            {'calls': 0, 'coalesced': 0, 'in_flight': 0}
+        )
+
+    def test_session(self):
+        flight_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            pool_size=4,
+            single_flight=True
+        )
+        session = LDAPSession(flight_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        results = list()
+
+        def search():
+            results.append(session.search('(objectClass=*)', SUBTREE))
+
+        threads = [threading.Thread(target=search) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([len(_) for _ in results], [7] * 8)
+        self.assertEqual(len(set([id(_) for _ in results])), 8)
+        stats = flight_stats()
+        self.assertEqual(stats['calls'], 8)
+        self.assertEqual(stats['in_flight'], 0)
+
+        # Paged searches are not coalesced
+        res, cookie = session.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(res), 4)
+        self.assertEqual(flight_stats()['calls'], 8)
+        session.unbind()
@@ -3,18 +3,22 @@ from node.base import AttributedNode
 from node.base import BaseNode
 from node.ext.ldap import LDAPNode
 from node.ext.ldap import LDAPNodeAttributes
+from node.ext.ldap import LDAPProps
 from node.ext.ldap import testing
 from node.ext.ldap._node import ACTION_ADD
 from node.ext.ldap._node import ACTION_MODIFY
+from node.ext.ldap.cache import LRUCacheProviderFactory
 from node.ext.ldap.events import LDAPNodeAddedEvent
 from node.ext.ldap.filter import LDAPFilter
 from node.ext.ldap.filter import LDAPRelationFilter
+from node.ext.ldap.filter import equality_filter
 from node.ext.ldap.interfaces import ILDAPNodeAddedEvent
 from node.ext.ldap.interfaces import ILDAPNodeCreatedEvent
 from node.ext.ldap.interfaces import ILDAPNodeDetachedEvent
 from node.ext.ldap.interfaces import ILDAPNodeModifiedEvent
 from node.ext.ldap.interfaces import ILDAPNodeRemovedEvent
 from node.ext.ldap.schema import LDAPSchemaInfo
+from node.ext.ldap.scope import BASE
 from node.ext.ldap.scope import ONELEVEL
 from node.ext.ldap.scope import SUBTREE
 from node.ext.ldap.session import LDAPSession
@@ -25,10 +29,38 @@ from odict import odict
 from plone.testing.zca import popGlobalRegistry
 from plone.testing.zca import pushGlobalRegistry
 from zope.component import adapter
+from zope.component import getGlobalSiteManager
 from zope.component import provideHandler
 from zope.component.event import objectEventNotify
 import ldap
 import os
+import threading
+
+
+def count_searches(node):
+    # record base DNs of searches performed by LDAP session of node
+    searches = list()
+    session = node.ldap_session
+    search = session.search
+
+    def counting_search(*args, **kw):
+        searches.append(kw.get('baseDN'))
+        return search(*args, **kw)
+    session.search = counting_search
+    return searches
+
+
+def record_modlists(node):
+    # record modlists sent by LDAP session of node
+    modlists = list()
+    session = node.ldap_session
+    modify = session.modify
+
+    def recording_modify(dn, modlist, *args, **kw):
+        modlists.append(modlist)
+        return modify(dn, modlist, *args, **kw)
+    session.modify = recording_modify
+    return modlists
 
 
 class TestNode(NodeTestCase):
@@ -978,6 +1010,107 @@ class TestNode(NodeTestCase):
 
         self.assertEqual(cookie, b'')
 
+        # Batched search with streamed results yields items as they arrive
+        all_dns = sorted(node.search())
+        self.assertEqual(
+            sorted(node.batched_search(page_size=3, stream=True)),
+            all_dns
+        )
+        res = sorted(node.batched_search(
+            page_size=3,
+            stream=True,
+            queryFilter='(ou=customer1)',
+            attrlist=['ou', 'rdn']
+        ))
+        self.assertEqual(res, [(
+            u'ou=customer1,ou=customers,dc=my-domain,dc=com',
+            {u'ou': [u'customer1'], u'rdn': u'ou=customer1'}
+        )])
+
+        # Stopping iteration early abandons the search
+        items = node.batched_search(page_size=3, stream=True)
+        self.assertTrue(next(items) in all_dns)
+        items.close()
+        self.assertEqual(sorted(node.search()), all_dns)
+
+        err = self.expect_error(
+            ValueError,
+            list,
+            node.batched_search(stream=True, exact_match=True)
+        )
+        self.assertEqual(str(err), "Exact match can't be streamed")
+
+        # Batched search fetching following pages in background
+        self.assertEqual(
+            sorted(node.batched_search(page_size=2, prefetch=2)),
+            all_dns
+        )
+        err = self.expect_error(
+            ValueError,
+            list,
+            node.batched_search(page_size=2, prefetch=1, exact_match=True)
+        )
+        self.assertEqual(str(err), 'Exact match asked but result not unique')
+        err = self.expect_error(
+            ValueError,
+            list,
+            node.batched_search(stream=True, prefetch=1)
+        )
+        self.assertEqual(str(err), "Streamed results can't be prefetched")
+
+        # Nodes of prefetched pages are created by the iterating thread
+        threads = set()
+        node_from_search = node._node_from_search
+
+        def recording_node_from_search(dn, attrs=None):
+            threads.add(threading.current_thread())
+            return node_from_search(dn, attrs)
+        node._node_from_search = recording_node_from_search
+        nodes = list(node.batched_search(
+            page_size=2,
+            prefetch=2,
+            get_nodes=True
+        ))
+        del node._node_from_search
+        self.assertEqual(threads, set([threading.current_thread()]))
+        self.assertEqual(
+            sorted([n.DN for n in nodes]),
+            sorted([n.DN for n in node.search(get_nodes=True)])
+        )
+        err = self.expect_error(
+            ValueError,
+            list,
+            node.batched_search(
+                page_size=2,
+                prefetch=1,
+                get_nodes=True,
+                search_func=node.search
+            )
+        )
+        self.assertEqual(
+            str(err),
+            "Nodes of custom search_func can't be prefetched"
+        )
+
+        # Children iteration fetches following pages in background if
+        # ``page_prefetch`` is set on props
+        prefetch_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            page_size=2,
+            page_prefetch=1
+        )
+        prefetch_node = LDAPNode(
+            'ou=customers,dc=my-domain,dc=com',
+            prefetch_props
+        )
+        self.assertEqual(
+            sorted(prefetch_node.keys()),
+            sorted(node['ou=customers'].keys())
+        )
+
         # Lets add a default search filter.
         filter = LDAPFilter('(objectClass=organizationalUnit)')
         node.search_filter = filter
@@ -1174,6 +1307,386 @@ class TestNode(NodeTestCase):
         root()
         self.assertEqual(root.keys(), [u'ou=customers', u'ou=demo'])
 
+    def test_load_children(self):
+        # Children and their attributes are created from one paged one level
+        # search
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customers = root['ou=customers']
+        searches = count_searches(root)
+        children = customers.load_children()
+        self.assertEqual([child.name for child in children], [
+            u'ou=customer1', u'ou=customer2',
+            u'ou=n\xe4sty\\, customer', u'uid=binary'
+        ])
+        customer = children[0]
+        self.assertTrue(customers['ou=customer1'] is customer)
+        self.assertEqual(
+            customer.DN,
+            u'ou=customer1,ou=customers,dc=my-domain,dc=com'
+        )
+        self.assertEqual(sorted(customer.attrs.items()), [
+            ('businessCategory', 'customers'),
+            ('description', 'customer1'),
+            ('objectClass', ['top', 'organizationalUnit']),
+            ('ou', 'customer1')
+        ])
+        self.assertFalse(customer.changed)
+        self.assertFalse(customers.changed)
+        self.assertEqual(searches, [customers.DN])
+
+        # Attributes of children are modified as usual
+        customer.attrs['description'] = 'changed'
+        customers()
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customer = root['ou=customers']['ou=customer1']
+        self.assertEqual(customer.attrs['description'], 'changed')
+        customer.attrs['description'] = 'customer1'
+        customer()
+
+        # With other attribute lists, only the child nodes are created
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customers = root['ou=customers']
+        searches = count_searches(root)
+        children = customers.load_children(attrlist=['ou'])
+        self.assertEqual(len(children), 4)
+        self.assertEqual(len(searches), 1)
+        self.assertEqual(children[1].attrs['description'], 'customer2')
+        self.assertEqual(len(searches), 2)
+
+        # Create children whenever iterating the node
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customers = root['ou=customers']
+        customers.child_attrlist = ['*']
+        searches = count_searches(root)
+        values = customers.values()
+        self.assertEqual(
+            [value.attrs['ou'] for value in values[:2]],
+            ['customer1', 'customer2']
+        )
+        self.assertEqual(len(searches), 1)
+
+    def test_search_nodes(self):
+        # Nodes of search results are created from the returned DN and
+        # attributes
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        root.search_scope = SUBTREE
+        searches = count_searches(root)
+        res = root.search(queryFilter='(ou=customer1)', get_nodes=True)
+        self.assertEqual(
+            [repr(node) for node in res],
+            ['<ou=customer1,ou=customers,dc=my-domain,dc=com:ou=customer1 - False>']
+        )
+        customer = res[0]
+        self.assertTrue(root['ou=customers']['ou=customer1'] is customer)
+        self.assertEqual(customer.attrs['description'], 'customer1')
+        self.assertFalse(customer.changed)
+        self.assertEqual(searches, [root.DN])
+
+        # Nodes on the path are created without searching
+        customers = customer.parent
+        self.assertEqual(customers.DN, 'ou=customers,dc=my-domain,dc=com')
+        self.assertEqual(len(searches), 1)
+        self.assertEqual(customers.attrs['description'], 'customers')
+        self.assertEqual(searches[1], customers.DN)
+
+        # Attributes are loaded separately if not all attributes are searched
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        root.search_scope = SUBTREE
+        searches = count_searches(root)
+        res = root.search(
+            queryFilter='(ou=customer2)',
+            attrlist=['dn', 'ou'],
+            get_nodes=True
+        )
+        customer, attrs = res[0]
+        self.assertEqual(attrs, {
+            u'dn': u'ou=customer2,ou=customers,dc=my-domain,dc=com',
+            u'ou': [u'customer2']
+        })
+        self.assertEqual(len(searches), 1)
+        self.assertEqual(customer.attrs['description'], 'customer2')
+        self.assertEqual(len(searches), 2)
+
+    def test_persisted_attributes(self):
+        # Modifications are computed from the attribute values persisted when
+        # loading, without reading the entry again
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customer = root['ou=customers']['ou=customer1']
+        # Loaded values are copied not before the first modification
+        self.assertEqual(customer.attrs._persisted, None)
+        self.assertEqual(dict(customer.attrs._persisted_values()), {
+            u'businessCategory': u'customers',
+            u'description': u'customer1',
+            u'objectClass': [u'top', u'organizationalUnit'],
+            u'ou': u'customer1'
+        })
+        searches = count_searches(root)
+        customer.attrs['description'] = 'changed'
+        customer.attrs['objectClass'].append('extensibleObject')
+        del customer.attrs['businessCategory']
+        customer.attrs['seeAlso'] = 'cn=other'
+        self.assertEqual(customer.attrs._persisted['objectClass'], [
+            u'top', u'organizationalUnit'
+        ])
+        root()
+        self.assertEqual(searches, [])
+        self.assertEqual(dict(customer.attrs._persisted_values()), {
+            u'description': u'changed',
+            u'objectClass': [
+                u'top', u'organizationalUnit', u'extensibleObject'
+            ],
+            u'ou': u'customer1',
+            u'seeAlso': u'cn=other'
+        })
+
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customer = root['ou=customers']['ou=customer1']
+        self.assertEqual(sorted(customer.attrs.items()), [
+            ('description', 'changed'),
+            ('objectClass', ['top', 'organizationalUnit', 'extensibleObject']),
+            ('ou', 'customer1'),
+            ('seeAlso', 'cn=other')
+        ])
+
+        # Values written are the persisted values for following writes
+        customer.attrs['description'] = 'customer1'
+        customer.attrs['businessCategory'] = 'customers'
+        customer()
+        customer.attrs['objectClass'] = ['top', 'organizationalUnit']
+        del customer.attrs['seeAlso']
+        customer()
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customer = root['ou=customers']['ou=customer1']
+        self.assertEqual(sorted(customer.attrs.items()), [
+            ('businessCategory', 'customers'),
+            ('description', 'customer1'),
+            ('objectClass', ['top', 'organizationalUnit']),
+            ('ou', 'customer1')
+        ])
+
+        # Added entries get modified without reading them
+        customers = root['ou=customers']
+        customer = LDAPNode()
+        customer.attrs['objectClass'] = ['top', 'organizationalUnit']
+        customers['ou=customer3'] = customer
+        customers()
+        searches = count_searches(root)
+        customer.attrs['description'] = 'customer3'
+        customer()
+        self.assertEqual(searches, [])
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        customer = root['ou=customers']['ou=customer3']
+        self.assertEqual(customer.attrs['description'], 'customer3')
+        del root['ou=customers']['ou=customer3']
+        root()
+
+    def test_multivalued_modlist(self):
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        demo = root['ou=demo']
+        group = LDAPNode()
+        group.attrs['objectClass'] = ['groupOfNames']
+        group.attrs['member'] = ['cn=nobody']
+        demo['cn=group'] = group
+        group.delete_values('member', ['cn=nobody'])
+        group.add_values('member', ['cn=member0', 'cn=member1'])
+        self.assertEqual(
+            group.attrs['member'],
+            ['cn=member0', 'cn=member1']
+        )
+        demo()
+
+        # Only changed values of multivalued attributes get written
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        group = root['ou=demo']['cn=group']
+        modlists = record_modlists(root)
+        group.attrs['member'] = ['cn=member1', 'cn=member2', 'cn=member3']
+        group()
+        self.assertEqual(modlists, [[
+            (ldap.MOD_DELETE, 'member', [b'cn=member0']),
+            (ldap.MOD_ADD, 'member', [b'cn=member2', b'cn=member3'])
+        ]])
+
+        # Changed order is no modification
+        del modlists[:]
+        group.attrs['member'] = ['cn=member3', 'cn=member2', 'cn=member1']
+        group()
+        self.assertEqual(modlists, [])
+
+        # Add and delete values without loading the attribute values
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        group = root['ou=demo']['cn=group']
+        modlists = record_modlists(root)
+        searches = count_searches(root)
+        group.add_values('member', ['cn=member3', 'cn=member4'])
+        group.delete_values('member', ['cn=member1', 'cn=member5'])
+        self.assertEqual(modlists, [
+            [(ldap.MOD_ADD, 'member', [b'cn=member4'])],
+            [(ldap.MOD_DELETE, 'member', [b'cn=member1'])]
+        ])
+        self.assertEqual(searches, [])
+        self.assertFalse('__attrs__' in group.nodespaces)
+        self.assertEqual(
+            sorted(group.attrs['member']),
+            ['cn=member2', 'cn=member3', 'cn=member4']
+        )
+
+        # Loaded attributes are kept in sync
+        group.add_values('member', ['cn=member5'])
+        self.assertEqual(
+            sorted(group.attrs['member']),
+            ['cn=member2', 'cn=member3', 'cn=member4', 'cn=member5']
+        )
+        self.assertFalse(group.attrs.changed)
+        del modlists[:]
+        group.attrs['member'] = ['cn=member2']
+        group()
+        self.assertEqual(modlists, [[(
+            ldap.MOD_DELETE,
+            'member',
+            [b'cn=member3', b'cn=member4', b'cn=member5']
+        )]])
+
+        # Presence of values is checked by equality, ``*`` is no wildcard
+        del modlists[:]
+        group.add_values('member', ['cn=member*'])
+        group.delete_values('member', ['cn=member*', 'cn=member2*'])
+        self.assertEqual(modlists, [
+            [(ldap.MOD_ADD, 'member', [b'cn=member*'])],
+            [(ldap.MOD_DELETE, 'member', [b'cn=member*'])]
+        ])
+
+        # Values set twice are added once
+        del modlists[:]
+        group.attrs['member'] = ['cn=member2', 'cn=member6', 'cn=member6']
+        group()
+        self.assertEqual(modlists, [[
+            (ldap.MOD_ADD, 'member', [b'cn=member6'])
+        ]])
+
+        del root['ou=demo']['cn=group']
+        root()
+
+    def test_present_values_stale_cache(self):
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        root = LDAPNode('dc=my-domain,dc=com', cache_props)
+        group = LDAPNode()
+        group.attrs['objectClass'] = ['groupOfNames']
+        group.attrs['member'] = ['cn=member0']
+        root['ou=demo']['cn=group'] = group
+        root()
+
+        # Cache a presence check of a value not present yet
+        request = dict(
+            queryFilter=equality_filter('member', 'cn=member1'),
+            scope=BASE,
+            baseDN=group.DN,
+            attrlist=['']
+        )
+        self.assertEqual(root.ldap_session.search_many([request]), [[]])
+
+        # Value gets added by a session not sharing the cache, which makes
+        # the cached result stale
+        session = LDAPSession(props)
+        session.modify(group.DN, [(ldap.MOD_ADD, 'member', [b'cn=member1'])])
+        self.assertEqual(root.ldap_session.search_many([request]), [[]])
+
+        # Presence of values is checked by the server anyway
+        modlists = record_modlists(root)
+        group.add_values('member', ['cn=member1', 'cn=member2'])
+        self.assertEqual(modlists, [
+            [(ldap.MOD_ADD, 'member', [b'cn=member2'])]
+        ])
+        del modlists[:]
+        group.delete_values('member', ['cn=member1', 'cn=member3'])
+        self.assertEqual(modlists, [
+            [(ldap.MOD_DELETE, 'member', [b'cn=member1'])]
+        ])
+        self.assertEqual(
+            sorted(session.search(
+                '(objectClass=*)',
+                BASE,
+                baseDN=group.DN,
+                attrlist=['member']
+            )[0][1]['member']),
+            [b'cn=member0', b'cn=member2']
+        )
+
+        del root['ou=demo']['cn=group']
+        root()
+        session.unbind()
+        gsm.unregisterUtility(factory)
+
+    def test_bulk_add(self):
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        demo = root['ou=demo']
+
+        def person(sn):
+            node = LDAPNode()
+            node.attrs['objectClass'] = ['person', 'inetOrgPerson']
+            node.attrs['sn'] = sn
+            return node
+
+        # Children are added without searching whether they exist and
+        # written immediately. Failures are reported
+        searches = count_searches(root)
+        children = [('cn=bulk{}'.format(i), person(str(i))) for i in range(3)]
+        children.append(('cn=invalid', LDAPNode()))
+        result = demo.bulk_add(children, window=2)
+        self.assertEqual(searches, [])
+        self.assertEqual(result.added, ['cn=bulk0', 'cn=bulk1', 'cn=bulk2'])
+        self.assertEqual(list(result.errors), ['cn=invalid'])
+        self.assertTrue(isinstance(
+            result.errors['cn=invalid'],
+            ldap.OBJECT_CLASS_VIOLATION
+        ))
+        self.assertEqual(
+            repr(result),
+            '<LDAPBulkResult added=3 errors=1>'
+        )
+
+        # Added children are persisted, failed ones are removed again
+        self.assertFalse(demo.changed)
+        self.assertFalse('cn=invalid' in demo.storage)
+        child = demo['cn=bulk0']
+        self.assertFalse(child.changed)
+        self.assertEqual(child.attrs._persisted_values()['sn'], '0')
+        root = LDAPNode('dc=my-domain,dc=com', props)
+        demo = root['ou=demo']
+        self.assertEqual(demo['cn=bulk2'].attrs['sn'], '2')
+
+        # Existing entries fail to be added
+        result = demo.bulk_add([('cn=bulk0', person('0'))])
+        self.assertEqual(result.added, [])
+        self.assertTrue(isinstance(
+            result.errors['cn=bulk0'],
+            ldap.ALREADY_EXISTS
+        ))
+
+        # They can be checked before with pipelined searches
+        searches = count_searches(root)
+        result = demo.bulk_add([
+            ('cn=bulk0', person('0')),
+            ('cn=bulk3', person('3'))
+        ], check_existence=True)
+        self.assertEqual(searches, [])
+        self.assertEqual(result.added, ['cn=bulk3'])
+        self.assertEqual(
+            result.errors['cn=bulk0'].args[0]['matched'],
+            'cn=bulk0,ou=demo,dc=my-domain,dc=com'
+        )
+
+        for i in range(4):
+            del demo['cn=bulk{}'.format(i)]
+        demo()
+
     def test_events(self):
         pushGlobalRegistry()
 
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap import LDAPNode
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import LDAPSession
+from node.ext.ldap import SUBTREE
+from node.ext.ldap import testing
+from node.ext.ldap.cache import LRUCacheProviderFactory
+from node.ext.ldap.pool import LDAPConnectionPool
+from node.ext.ldap.pool import PoolTimeout
+from node.ext.ldap.pool import close_pools
+from node.ext.ldap.testing import props
+from node.tests import NodeTestCase
+from zope.component import getGlobalSiteManager
+import ldap
+import threading
+import time
+
+
+class DummyConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def whoami_s(self):
+        if not self.healthy:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        return ''
+
+    def unbind_s(self):
+        self.closed = True
+
+
+class TestPool(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def tearDown(self):
+        close_pools()
+        super(TestPool, self).tearDown()
+
+    def test_pool_checkout(self):
+        err = self.expect_error(
+            ValueError,
+            LDAPConnectionPool,
+            object,
+            max_size=0
+        )
+        self.assertEqual(str(err), 'max_size must be >= 1')
+
+        err = self.expect_error(
+            ValueError,
+            LDAPConnectionPool,
+            object,
+            min_size=2,
+            max_size=1
+        )
+        self.assertEqual(str(err), 'min_size must not exceed max_size')
+
+        pool = LDAPConnectionPool(DummyConnection, max_size=2, timeout=0.1)
+        self.assertEqual(pool.size, 0)
+        self.assertEqual(pool.idle, 0)
+
+        # Connections are created on demand
+        con_1 = pool.acquire()
+        con_2 = pool.acquire()
+        self.assertFalse(con_1 is con_2)
+        self.assertEqual(pool.size, 2)
+        self.assertEqual(pool.idle, 0)
+
+        # Pool exhausted
+        err = self.expect_error(PoolTimeout, pool.acquire)
+        self.assertEqual(err.args[0]['desc'], 'No LDAP connection available')
+
+        # Released connections get reused
+        pool.release(con_1)
+        self.assertEqual(pool.idle, 1)
+        self.assertTrue(pool.acquire() is con_1)
+
+        # Discarded connections get closed and free a slot
+        pool.release(con_2, discard=True)
+        self.assertTrue(con_2.closed)
+        self.assertEqual(pool.size, 1)
+        con_3 = pool.acquire()
+        self.assertFalse(con_3 is con_2)
+
+        # Waiting checkouts get served when a connection is released
+        def release():
+            time.sleep(0.05)
+            pool.release(con_3)
+        thread = threading.Thread(target=release)
+        thread.start()
+        self.assertTrue(pool.acquire(timeout=1.) is con_3)
+        thread.join()
+
+        # Connection context manager
+        pool.release(con_1)
+        with pool.connection() as con:
+            self.assertTrue(con is con_1)
+            self.assertEqual(pool.idle, 0)
+        self.assertEqual(pool.idle, 1)
+
+        # SERVER_DOWN discards connection
+        def server_down():
+            with pool.connection():
+                raise ldap.SERVER_DOWN({})
+        self.expect_error(ldap.SERVER_DOWN, server_down)
+        self.assertTrue(con_1.closed)
+        self.assertEqual(pool.size, 1)
+
+        pool.close()
+        self.assertEqual(pool.idle, 0)
+
+    def test_pool_maintenance(self):
+        # Idle connections exceeding min size get reaped
+        pool = LDAPConnectionPool(
+            DummyConnection,
+            min_size=1,
+            max_size=3,
+            idle_timeout=0.05
+        )
+        cons = [pool.acquire() for i in range(3)]
+        for con in cons:
+            pool.release(con)
+        self.assertEqual(pool.size, 3)
+        time.sleep(0.1)
+        pool.reap()
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(len([con for con in cons if con.closed]), 2)
+
+        # Connections idle for ``check_interval`` get health checked
+        pool = LDAPConnectionPool(
+            DummyConnection,
+            max_size=2,
+            check_interval=0.
+        )
+        con = pool.acquire()
+        con.healthy = False
+        pool.release(con)
+        new_con = pool.acquire()
+        self.assertTrue(con.closed)
+        self.assertFalse(new_con is con)
+        self.assertEqual(pool.size, 1)
+
+    def test_pooled_session(self):
+        pooled_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            pool_size=3,
+        )
+        session_1 = LDAPSession(pooled_props)
+        session_1.baseDN = 'dc=my-domain,dc=com'
+        session_2 = LDAPSession(pooled_props)
+        session_2.baseDN = 'dc=my-domain,dc=com'
+
+        # Sessions with same server and credentials share the pool
+        session_1.ensure_connection()
+        session_2.ensure_connection()
+        pool = session_1._communicator._pool
+        self.assertTrue(pool is session_2._communicator._pool)
+        self.assertEqual(pool.max_size, 3)
+
+        self.assertEqual(len(session_1.search('(objectClass=*)', SUBTREE)), 7)
+        self.assertEqual(len(session_2.search('(objectClass=*)', SUBTREE)), 7)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(pool.idle, 1)
+
+        # Paged searches keep their connection until last page is fetched
+        res, cookie = session_1.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(res), 4)
+        self.assertEqual(pool.idle, 0)
+        self.assertEqual(len(session_2.search('(objectClass=*)', SUBTREE)), 7)
+        self.assertEqual(pool.size, 2)
+        res, cookie = session_1.search(
+            '(objectClass=*)',
+            SUBTREE,
+            page_size=4,
+            cookie=cookie
+        )
+        self.assertEqual(len(res), 3)
+        self.assertEqual(cookie, b'')
+        self.assertEqual(pool.idle, 2)
+
+        # Streamed searches occupy a connection until consumed or closed
+        stream = session_1.search_stream('(objectClass=*)', SUBTREE)
+        self.assertEqual(pool.idle, 1)
+        self.assertEqual(len(list(stream)), 7)
+        self.assertEqual(pool.idle, 2)
+        stream = session_1.search_stream('(objectClass=*)', SUBTREE)
+        stream.close()
+        self.assertEqual(pool.idle, 2)
+
+        # Paged searches abandoned before the last page release their
+        # connection
+        res, cookie = session_1.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(pool.idle, 1)
+        session_1.abandon_paged(cookie)
+        self.assertEqual(pool.idle, 2)
+
+        # So do page generators closed early. Prefetched pages are abandoned
+        # by the background thread as soon as it notices
+        node = LDAPNode('dc=my-domain,dc=com', pooled_props)
+        node.search_scope = SUBTREE
+        for kw in (dict(), dict(stream=True), dict(prefetch=1)):
+            results = node.batched_search(page_size=2, **kw)
+            next(results)
+            next(results)
+            next(results)
+            self.assertEqual(pool.idle, 1)
+            results.close()
+            for i in range(50):
+                if pool.idle == 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(pool.idle, 2)
+        self.assertEqual(pool.size, 2)
+
+        # Concurrent searches from several threads
+        errors = list()
+
+        def search():
+            try:
+                for i in range(10):
+                    res = session_1.search('(objectClass=*)', SUBTREE)
+                    assert len(res) == 7
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=search) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(pool.size <= 3)
+
+        # Writes borrow connections as well
+        dn = 'cn=pooled,ou=customer1,ou=customers,dc=my-domain,dc=com'
+        session_1.add(dn, {
+            'cn': b'pooled',
+            'sn': b'pooled',
+            'objectclass': (b'person', b'top'),
+        })
+        self.assertEqual(len(session_2.search('(cn=pooled)', SUBTREE)), 1)
+        session_2.delete(dn)
+        self.assertEqual(session_1.search('(cn=pooled)', SUBTREE), [])
+
+        # Unbind does not close the shared pool
+        session_1.unbind()
+        self.assertFalse(session_1._communicator.bound)
+        self.assertEqual(len(session_2.search('(objectClass=*)', SUBTREE)), 7)
+        session_2.unbind()
+
+    def test_pooled_cached_paged_search(self):
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+        pooled_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True,
+            pool_size=3,
+        )
+        session = LDAPSession(pooled_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        session.ensure_connection()
+        pool = session._communicator._pool
+
+        res, cookie = session.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(res), 4)
+        res, cookie = session.search(
+            '(objectClass=*)',
+            SUBTREE,
+            page_size=4,
+            cookie=cookie
+        )
+        self.assertEqual(len(res), 3)
+        self.assertEqual(pool.idle, pool.size)
+
+        # Pages followed by further pages are not cached, since their cookie
+        # is only valid on the connection of the search
+        res, cookie = session.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(res), 4)
+        self.assertEqual(pool.idle, pool.size - 1)
+        res, cookie = session.search(
+            '(objectClass=*)',
+            SUBTREE,
+            page_size=4,
+            cookie=cookie
+        )
+        self.assertEqual(len(res), 3)
+        self.assertEqual(cookie, b'')
+        self.assertEqual(pool.idle, pool.size)
+
+        # Complete results fitting one page are cached
+        res = session.search('(objectClass=*)', SUBTREE, page_size=10)
+        self.assertEqual(len(res[0]), 7)
+        self.assertEqual(res[1], b'')
+        self.assertEqual(
+            session.search('(objectClass=*)', SUBTREE, page_size=10),
+            res
+        )
+
+        session.unbind()
+        gsm.unregisterUtility(factory)
+
+    def test_auth_pool(self):
+        pooled_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            auth_pool_size=2,
+        )
+        session = LDAPSession(pooled_props)
+        dn = 'cn=authpool,ou=customer1,ou=customers,dc=my-domain,dc=com'
+        session.add(dn, {
+            'cn': b'authpool',
+            'sn': b'authpool',
+            'userPassword': b'secret',
+            'objectclass': (b'person', b'top'),
+        })
+
+        # Authentication connections are rebound and reused
+        self.assertTrue(session.authenticate(dn, 'secret'))
+        pool = session._communicator._connector.auth_pool()
+        self.assertEqual(pool.max_size, 2)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(pool.idle, 1)
+
+        self.assertFalse(session.authenticate(dn, 'invalid'))
+        self.assertTrue(session.authenticate(dn, 'secret'))
+        self.assertEqual(pool.size, 1)
+
+        # Authentication pool is separate from the session connection
+        self.assertFalse(session._communicator._pool is pool)
+
+        # Without authentication pooling
+        unpooled = LDAPSession(props)
+        self.assertTrue(unpooled._communicator._connector.auth_pool() is None)
+        self.assertTrue(unpooled.authenticate(dn, 'secret'))
+        self.assertFalse(unpooled.authenticate(dn, 'invalid'))
+
+        session.delete(dn)
+        session.unbind()
@@ -52,3 +52,23 @@ class TestProperties(NodeTestCase):
         self.assertEqual(props.multivalued_attributes, MULTIVALUED_DEFAULTS)
         self.assertEqual(props.binary_attributes, BINARY_DEFAULTS)
         self.assertEqual(props.page_size, 1000)
+        self.assertEqual(props.page_prefetch, 0)
+        self.assertEqual(props.pool_size, 0)
+        self.assertEqual(props.pool_min_size, 0)
+        self.assertEqual(props.pool_timeout, 10.)
+        self.assertEqual(props.pool_idle_timeout, 300.)
+        self.assertEqual(props.pool_check_interval, 30.)
+        self.assertEqual(props.auth_pool_size, 0)
+        self.assertEqual(props.auth_pool_timeout, 10.)
+        self.assertEqual(props.operation_timeout, None)
+        self.assertEqual(props.breaker_threshold, 0)
+        self.assertEqual(props.breaker_reset_timeout, 1.)
+        self.assertEqual(props.breaker_max_reset_timeout, 60.)
+        self.assertTrue(props.breaker_fail_fast)
+        self.assertEqual(props.read_uris, None)
+        self.assertEqual(props.replica_probe_interval, 10.)
+        self.assertEqual(props.read_your_writes_window, 5.)
+        self.assertEqual(props.cache_soft_timeout, None)
+        self.assertEqual(props.single_flight, False)
+        self.assertEqual(props.negative_cache_timeout, 0)
+        self.assertEqual(props.negative_cache_size, 10000)
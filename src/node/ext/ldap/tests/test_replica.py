@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+from ldap import MOD_REPLACE
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import LDAPSession
+from node.ext.ldap import SUBTREE
+from node.ext.ldap import testing
+from node.ext.ldap.base import WRITTEN_MAX
+from node.ext.ldap.pool import close_pools
+from node.ext.ldap.replica import ReplicaSet
+from node.ext.ldap.replica import replica_stats
+from node.ext.ldap.replica import reset_replicas
+from node.ext.ldap.testing import props
+from node.ext.ldap.testing import replica_uris
+from node.tests import NodeTestCase
+import ldap
+import time
+
+
+DOWN_URI = 'ldap://127.0.0.1:12399'
+
+
+class TestReplica(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def tearDown(self):
+        reset_replicas()
+        close_pools()
+        super(TestReplica, self).tearDown()
+
+    def test_replica_set(self):
+        err = self.expect_error(ValueError, ReplicaSet, [], None)
+        self.assertEqual(str(err), 'At least one replica URI required')
+
+        available = dict(a=True, b=True)
+
+        def probe(uri):
+            if not available[uri]:
+                raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+            return 0.5
+
+        replicas = ReplicaSet(['a', 'b'], probe, probe_interval=60., decay=0.5)
+
+        # Replicas without measured latency are preferred
+        self.assertEqual(replicas.select(), ['a', 'b'])
+        replicas.succeeded('a', 0.2)
+        self.assertEqual(replicas.select(), ['b', 'a'])
+
+        # Lowest moving average latency first
+        replicas.succeeded('b', 0.4)
+        self.assertEqual(replicas.select(), ['a', 'b'])
+        replicas.succeeded('a', 1.0)
+        self.assertAlmostEqual(replicas.stats()['a']['latency'], 0.6)
+        self.assertEqual(replicas.select(), ['b', 'a'])
+
+        # Failed replicas are not selected until a probe succeeds
+        replicas.failed('b', ldap.SERVER_DOWN({}))
+        self.assertEqual(replicas.select(), ['a'])
+        available['b'] = False
+        self.assertFalse(replicas.probe('b'))
+        self.assertEqual(replicas.select(), ['a'])
+        available['b'] = True
+        self.assertTrue(replicas.probe('b'))
+        self.assertEqual(replicas.select(), ['b', 'a'])
+        stats = replicas.stats()['b']
+        self.assertTrue(stats['healthy'])
+        self.assertAlmostEqual(stats['latency'], 0.45)
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['failures'], 1)
+
+        # Probes run in background once probe interval passed
+        replicas = ReplicaSet(['a'], probe, probe_interval=0.)
+        replicas.failed('a')
+        self.assertEqual(replicas.select(), [])
+        for i in range(50):
+            if replicas.stats()['a']['healthy']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(replicas.stats()['a']['latency'], 0.5)
+        self.assertEqual(replicas.select(), ['a'])
+
+    def test_routing(self):
+        replica_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            read_uris=[DOWN_URI] + replica_uris,
+            replica_probe_interval=60.
+        )
+        session = LDAPSession(replica_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+
+        # Unavailable replica is skipped
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        stats = replica_stats()[' '.join(replica_props.read_uris)]
+        self.assertFalse(stats[DOWN_URI]['healthy'])
+        self.assertEqual(stats[replica_uris[0]]['requests'], 1)
+        self.assertTrue(stats[replica_uris[0]]['latency'] > 0)
+
+        # Each replica gets used until its latency is known
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        stats = replica_stats()[' '.join(replica_props.read_uris)]
+        self.assertEqual(stats[replica_uris[1]]['requests'], 1)
+
+        # Paged searches are continued on the same replica
+        res, cookie = session.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(res), 4)
+        res, cookie = session.search(
+            '(objectClass=*)',
+            SUBTREE,
+            page_size=4,
+            cookie=cookie
+        )
+        self.assertEqual(len(res), 3)
+        self.assertEqual(cookie, b'')
+
+        stream = session.search_stream('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(list(stream)), 4)
+        stream = session.search_stream(
+            '(objectClass=*)',
+            SUBTREE,
+            page_size=4,
+            cookie=stream.cookie
+        )
+        self.assertEqual(len(list(stream)), 3)
+
+        res = session.search_many([
+            dict(queryFilter='(objectClass=*)', scope=SUBTREE),
+            dict(baseDN='ou=customers,dc=my-domain,dc=com', attrlist=['ou']),
+        ])
+        self.assertEqual(len(res[0]), 7)
+        self.assertEqual(res[1][0][1], {'ou': [b'customers']})
+
+        # Writes are sent to the provider
+        stats = replica_stats()[' '.join(replica_props.read_uris)]
+        requests = sum([_['requests'] for _ in stats.values()])
+        dn = 'cn=replica,ou=customer1,ou=customers,dc=my-domain,dc=com'
+        session.add(dn, {
+            'cn': b'replica',
+            'sn': b'replica',
+            'objectclass': (b'person', b'top'),
+        })
+        session.modify(dn, [(MOD_REPLACE, 'sn', b'changed')])
+        session.delete(dn)
+        stats = replica_stats()[' '.join(replica_props.read_uris)]
+        self.assertEqual(
+            sum([_['requests'] for _ in stats.values()]),
+            requests
+        )
+        session.unbind()
+
+    def test_fallback(self):
+        # If no replica is available, the provider is used
+        replica_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            pool_size=2,
+            read_uris=[DOWN_URI],
+            replica_probe_interval=60.
+        )
+        session = LDAPSession(replica_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        stats = replica_stats()[DOWN_URI][DOWN_URI]
+        self.assertFalse(stats['healthy'])
+        self.assertEqual(stats['requests'], 1)
+        session.unbind()
+
+    def test_read_your_writes(self):
+        replica_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            read_uris=replica_uris,
+            replica_probe_interval=60.,
+            read_your_writes_window=60.
+        )
+        name = ' '.join(replica_uris)
+
+        def replica_requests():
+            stats = replica_stats()[name]
+            return sum([_['requests'] for _ in stats.values()])
+
+        session = LDAPSession(replica_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+        dn = 'cn=sticky,ou=customer1,ou=customers,dc=my-domain,dc=com'
+        session.add(dn, {
+            'cn': b'sticky',
+            'sn': b'sticky',
+            'objectclass': (b'person', b'top'),
+        })
+
+        # Searches touching the written entry are sent to the provider
+        self.assertEqual(len(session.search(baseDN=dn)), 1)
+        self.assertEqual(
+            len(session.search('(cn=sticky)', SUBTREE)),
+            1
+        )
+        self.assertEqual(len(session.search_many([
+            dict(baseDN='ou=customer1,ou=customers,dc=my-domain,dc=com'),
+        ])[0]), 1)
+        self.assertEqual(len(list(session.search_stream(
+            '(cn=sticky)',
+            SUBTREE
+        ))), 1)
+        self.assertEqual(replica_requests(), 0)
+
+        # DNs are compared normalized
+        session.search(
+            baseDN='CN=sticky, ou=customer1,ou=customers,dc=my-domain,dc=com'
+        )
+        self.assertEqual(replica_requests(), 0)
+
+        # Other searches are sent to replicas
+        session.search(baseDN='ou=customer2,ou=customers,dc=my-domain,dc=com')
+        self.assertEqual(replica_requests(), 1)
+
+        # Other sessions are not affected
+        other = LDAPSession(replica_props)
+        self.assertEqual(len(other.search(baseDN=dn)), 1)
+        self.assertEqual(replica_requests(), 2)
+        other.unbind()
+
+        # After window has passed, replicas are used again
+        session._communicator._written.clear()
+        session.search(baseDN=dn)
+        self.assertEqual(replica_requests(), 3)
+
+        # Written entries are remembered by their parent. Beyond
+        # ``WRITTEN_MAX`` parents they are collapsed to their common parent
+        communicator = session._communicator
+        for i in range(WRITTEN_MAX):
+            communicator._wrote(
+                'cn=x,ou=c{},ou=customers,dc=my-domain,dc=com'.format(i)
+            )
+        self.assertEqual(len(communicator._written), WRITTEN_MAX)
+        session.search(baseDN='ou=customer1,ou=customers,dc=my-domain,dc=com')
+        self.assertEqual(replica_requests(), 4)
+        communicator._wrote('cn=x,ou=c,ou=customers,dc=my-domain,dc=com')
+        self.assertEqual(
+            list(communicator._written),
+            ['ou=customers,dc=my-domain,dc=com']
+        )
+        session.search(baseDN='ou=customer1,ou=customers,dc=my-domain,dc=com')
+        self.assertEqual(replica_requests(), 4)
+        session.search(baseDN='dc=my-domain,dc=com')
+        self.assertEqual(replica_requests(), 4)
+        communicator._written.clear()
+
+        session.delete(dn)
+        self.assertEqual(session.search('(cn=sticky)', SUBTREE), [])
+        self.assertEqual(replica_requests(), 4)
+        session.unbind()
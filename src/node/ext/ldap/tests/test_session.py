@@ -3,8 +3,10 @@ from node.ext.ldap import LDAPProps
 from node.ext.ldap import LDAPSession
 from node.ext.ldap import SUBTREE
 from node.ext.ldap import testing
+from node.ext.ldap.base import LDAPOperationTimeout
 from node.ext.ldap.testing import props
 from node.tests import NodeTestCase
+import ldap
 
 
 class TestSession(NodeTestCase):
@@ -82,8 +84,79 @@ class TestSession(NodeTestCase):
             {'sn': []}
         )])
 
+        # Stream search results. Entries are read one by one as they arrive
+        stream = session.search_stream('(objectClass=*)', SUBTREE)
+        self.assertEqual(len(list(stream)), 8)
+        self.assertEqual(stream.cookie, None)
+
+        # Streamed pagination, cookie is available after iteration
+        stream = session.search_stream(
+            '(objectClass=*)',
+            SUBTREE,
+            attrlist=['cn'],
+            page_size=5
+        )
+        self.assertEqual(len(list(stream)), 5)
+        self.assertTrue(len(stream.cookie) > 0)
+        stream = session.search_stream(
+            '(objectClass=*)',
+            SUBTREE,
+            attrlist=['cn'],
+            page_size=5,
+            cookie=stream.cookie
+        )
+        self.assertEqual(len(list(stream)), 3)
+        self.assertEqual(stream.cookie, b'')
+
+        # Closing the stream abandons the search
+        with session.search_stream('(objectClass=*)', SUBTREE) as stream:
+            next(iter(stream))
+        self.assertEqual(stream._con, None)
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 8)
+
+        # Perform several searches with one round trip. Results are returned
+        # in order of requests
+        res = session.search_many([
+            dict(queryFilter='(cn=foo)', scope=SUBTREE, attrlist=('sn',)),
+            dict(baseDN='ou=customers,dc=my-domain,dc=com', attrlist=['ou']),
+        ])
+        self.assertEqual(res, [[(
+            'cn=foo,ou=customer1,ou=customers,dc=my-domain,dc=com',
+            {'sn': [b'baz']}
+        )], [(
+            'ou=customers,dc=my-domain,dc=com',
+            {'ou': [b'customers']}
+        )]])
+
+        # ``window`` limits the number of searches waiting for their result
+        self.assertEqual(session.search_many([
+            dict(queryFilter='(cn=foo)', scope=SUBTREE, attrlist=('sn',)),
+            dict(baseDN='ou=customers,dc=my-domain,dc=com', attrlist=['ou']),
+            dict(queryFilter='(cn=inexistent)', scope=SUBTREE),
+        ], window=1), res + [[]])
+
+        # Errors of individual searches are raised after all results are read
+        requests = [
+            dict(baseDN='cn=inexistent,dc=my-domain,dc=com'),
+            dict(queryFilter='(cn=foo)', scope=SUBTREE, attrlist=('sn',)),
+        ]
+        self.expect_error(ldap.NO_SUCH_OBJECT, session.search_many, requests)
+
+        # or returned in place of the result
+        res = session.search_many(requests, return_errors=True)
+        self.assertTrue(isinstance(res[0], ldap.NO_SUCH_OBJECT))
+        self.assertEqual(len(res[1]), 1)
+
+        # Pagination is not supported
+        err = self.expect_error(
+            ValueError,
+            session.search_many,
+            [dict(page_size=2)]
+        )
+        self.assertEqual(str(err), 'Pagination not supported by search_many')
+
         # Delete this entry and check the result
-        session.delete(res[0][0])
+        session.delete(res[1][0][0])
         self.assertEqual(session.search('(cn=foo)', SUBTREE), [])
 
         # Unbind from Server
@@ -98,3 +171,122 @@ class TestSession(NodeTestCase):
             'errno': 107,
             'desc': "Can't contact LDAP server"
         })
+
+    def test_timeout(self):
+        timeout_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=False,
+            operation_timeout=10.
+        )
+        session = LDAPSession(timeout_props)
+        session.baseDN = 'dc=my-domain,dc=com'
+
+        # Operations completing within their deadline
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 7)
+        res, cookie = session.search('(objectClass=*)', SUBTREE, page_size=4)
+        self.assertEqual(len(res), 4)
+        self.assertEqual(len(list(session.search_stream(
+            '(objectClass=*)',
+            SUBTREE
+        ))), 7)
+        self.assertEqual(len(session.search_many([
+            dict(queryFilter='(objectClass=*)', scope=SUBTREE)
+        ])[0]), 7)
+
+        dn = 'cn=timeout,ou=customer1,ou=customers,dc=my-domain,dc=com'
+        session.add(dn, {
+            'cn': b'timeout',
+            'sn': b'timeout',
+            'userPassword': b'secret',
+            'objectclass': (b'person', b'top'),
+        })
+        session.modify(dn, [(MOD_REPLACE, 'sn', b'changed')])
+        self.assertEqual(
+            session.search('(cn=timeout)', SUBTREE, attrlist=['sn']),
+            [(dn, {'sn': [b'changed']})]
+        )
+        self.assertTrue(session.authenticate(dn, 'secret'))
+        self.assertFalse(session.authenticate(dn, 'invalid'))
+
+        # Exceeded deadlines abandon the operation and raise a timeout error.
+        # Per call timeout overrides the default of props
+        err = self.expect_error(
+            LDAPOperationTimeout,
+            session.search,
+            '(objectClass=*)',
+            SUBTREE,
+            timeout=0
+        )
+        self.assertEqual(err.args[0]['desc'], 'LDAP operation timed out')
+        self.assertTrue(isinstance(err, ldap.TIMEOUT))
+        self.expect_error(
+            LDAPOperationTimeout,
+            list,
+            session.search_stream('(objectClass=*)', SUBTREE, timeout=0)
+        )
+        res = session.search_many([
+            dict(queryFilter='(objectClass=*)', scope=SUBTREE),
+            dict(queryFilter='(cn=timeout)', scope=SUBTREE),
+        ], return_errors=True, timeout=0)
+        self.assertTrue(isinstance(res[0], LDAPOperationTimeout))
+        self.assertTrue(isinstance(res[1], LDAPOperationTimeout))
+        self.expect_error(
+            LDAPOperationTimeout,
+            session.authenticate,
+            dn,
+            'secret',
+            timeout=0
+        )
+
+        # Session remains usable
+        self.assertEqual(len(session.search('(objectClass=*)', SUBTREE)), 8)
+        session.delete(dn)
+        self.assertEqual(session.search('(cn=timeout)', SUBTREE), [])
+        session.unbind()
+
+    def test_add_many(self):
+        session = LDAPSession(props)
+        session.baseDN = 'ou=customer1,ou=customers,dc=my-domain,dc=com'
+
+        def entry(cn):
+            return ('cn={},{}'.format(cn, session.baseDN), {
+                'cn': cn.encode(),
+                'sn': cn.encode(),
+                'objectclass': (b'person', b'top'),
+            })
+
+        # Several entries are added with at most ``window`` adds waiting for
+        # their result. Errors of individual adds are returned in order of
+        # the entries instead of being raised
+        entries = [entry('bulk{}'.format(i)) for i in range(5)]
+        entries.insert(2, entry('bulk0'))
+        entries.append((
+            'cn=invalid,ou=inexistent,dc=my-domain,dc=com',
+            {'cn': b'invalid', 'sn': b'invalid', 'objectclass': b'person'}
+        ))
+        errors = session.add_many(entries, window=2)
+        self.assertEqual(len(errors), 7)
+        self.assertEqual(
+            [error is None for error in errors],
+            [True, True, False, True, True, True, False]
+        )
+        self.assertTrue(isinstance(errors[2], ldap.ALREADY_EXISTS))
+        self.assertTrue(isinstance(errors[6], ldap.NO_SUCH_OBJECT))
+        self.assertEqual(
+            len(session.search('(cn=bulk*)', SUBTREE)),
+            5
+        )
+
+        # Each add may wait ``timeout`` seconds for its result
+        errors = session.add_many([entry('bulk5')], timeout=0)
+        self.assertTrue(isinstance(errors[0], LDAPOperationTimeout))
+
+        for i in range(6):
+            try:
+                session.delete(entry('bulk{}'.format(i))[0])
+            except ldap.NO_SUCH_OBJECT:
+                pass
+        self.assertEqual(session.search('(cn=bulk*)', SUBTREE), [])
+        session.unbind()
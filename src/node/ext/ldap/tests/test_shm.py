@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+from bda.cache import ICacheManager
+from node.ext.ldap import LDAPCommunicator
+from node.ext.ldap import LDAPConnector
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import ONELEVEL
+from node.ext.ldap import testing
+from node.ext.ldap.cache import GENERATION_KEY_PREFIX
+from node.ext.ldap.interfaces import ICacheProviderFactory
+from node.ext.ldap.shm import SharedMemoryCache
+from node.ext.ldap.shm import SharedMemoryCacheManager
+from node.ext.ldap.shm import SharedMemoryCacheProviderFactory
+from node.ext.ldap.shm import _slot_header
+from node.ext.ldap.testing import props
+from node.tests import NodeTestCase
+from zope.component import getGlobalSiteManager
+import os
+import shutil
+import tempfile
+import time
+
+
+class TestSharedMemoryCache(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def setUp(self):
+        super(TestSharedMemoryCache, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(TestSharedMemoryCache, self).tearDown()
+
+    def test_shared_memory_cache(self):
+        err = self.expect_error(
+            ValueError,
+            SharedMemoryCache,
+            self.path,
+            max_entries=0
+        )
+        self.assertEqual(str(err), 'max_entries must be >= 1')
+
+        cache = SharedMemoryCache(
+            self.path,
+            max_entries=2,
+            slot_size=256,
+            ways=2
+        )
+        manager = ICacheManager(cache)
+        self.assertTrue(isinstance(manager, SharedMemoryCacheManager))
+        manager.setTimeout(60)
+        self.assertEqual(cache.timeout, 60)
+
+        res = [(u'cn=a', {u'cn': [b'a']})]
+        cache['a'] = res
+        self.assertEqual(cache['a'], res)
+        self.assertEqual(cache.get('b', 'default'), 'default')
+        self.assertEqual(cache.keys(), ['a'])
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(cache.size() > 0)
+
+        # Least recently used entry of a set gets evicted
+        cache['b'] = 'b'
+        cache['a']
+        cache['c'] = 'c'
+        self.assertEqual(sorted(cache.keys()), ['a', 'c'])
+
+        # Values not fitting into a slot are not cached
+        cache['c'] = 'c' * 256
+        self.assertEqual(cache['c'], None)
+
+        # Entries expire
+        cache.set('d', 'd', timeout=0.05)
+        self.assertEqual(cache['d'], 'd')
+        time.sleep(0.06)
+        self.assertEqual(cache['d'], None)
+
+        # Counters are per process
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['expirations'], 1)
+        self.assertEqual(stats['entries'], 1)
+        cache.reset_stats()
+        self.assertEqual(cache.stats()['hits'], 0)
+
+        # Lookups of generations are counted separately
+        generation = GENERATION_KEY_PREFIX + 'x'
+        cache[generation]
+        cache[generation] = 'g'
+        cache[generation]
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+        self.assertEqual(
+            (stats['generation_hits'], stats['generation_misses']),
+            (1, 1)
+        )
+        cache.reset_stats()
+
+        del cache['a']
+        self.assertEqual(cache['a'], None)
+
+        # Processes mapping the same file share the values
+        other = SharedMemoryCache(
+            self.path,
+            max_entries=2,
+            slot_size=256,
+            ways=2
+        )
+        cache['e'] = 'e'
+        self.assertEqual(other['e'], 'e')
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            try:
+                child = SharedMemoryCache(
+                    self.path,
+                    max_entries=2,
+                    slot_size=256,
+                    ways=2
+                )
+                child['f'] = child['e'] + 'f'
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(cache['f'], 'ef')
+        other.reset()
+        self.assertEqual(cache.keys(), [])
+        other.close()
+
+        # Files initialized with different layout are refused
+        err = self.expect_error(
+            ValueError,
+            SharedMemoryCache,
+            self.path,
+            max_entries=4,
+            slot_size=256,
+            ways=2
+        )
+        self.assertEqual(
+            str(err),
+            'Shared memory cache {} has different layout'.format(self.path)
+        )
+        cache.close()
+
+    def test_crash_safety(self):
+        cache = SharedMemoryCache(
+            self.path,
+            max_entries=2,
+            slot_size=256,
+            ways=2
+        )
+        cache['a'] = 'a'
+
+        # Half written slots are treated as empty
+        offset = cache._find(cache._set(b'a'), b'a')
+        key_length, length = cache._header(offset)[:2]
+        end = offset + _slot_header.size + key_length + length
+        cache._map[end - 1:end] = b'b'
+        self.assertEqual(cache['a'], None)
+        self.assertEqual(cache.keys(), [])
+        self.assertEqual(cache.stats()['corrupted'], 1)
+
+        # Files with invalid header get initialized again
+        cache['a'] = 'a'
+        cache._map[:8] = b'\x00' * 8
+        cache.close()
+        cache = SharedMemoryCache(
+            self.path,
+            max_entries=2,
+            slot_size=256,
+            ways=2
+        )
+        self.assertEqual(cache['a'], None)
+        cache['a'] = 'a'
+        self.assertEqual(cache['a'], 'a')
+        cache.close()
+
+    def test_communicator(self):
+        factory = SharedMemoryCacheProviderFactory(
+            name='test',
+            directory=self.tempdir,
+            max_entries=100
+        )
+        self.assertEqual(
+            factory.path,
+            os.path.join(self.tempdir, 'node.ext.ldap-test-1-100-65536-8')
+        )
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory, ICacheProviderFactory)
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        other = LDAPCommunicator(LDAPConnector(cache_props))
+        other.bind()
+        gsm.unregisterUtility(factory, ICacheProviderFactory)
+        self.assertTrue(communicator._cache.cache is factory())
+
+        customers = 'ou=customers,dc=my-domain,dc=com'
+        res = communicator.search('(objectClass=*)', ONELEVEL, customers)
+        self.assertEqual(len(res), 4)
+        self.assertTrue(len(factory()) > 0)
+        self.assertEqual(
+            other.search('(objectClass=*)', ONELEVEL, customers),
+            res
+        )
+
+        # Writes invalidate searches of all processes
+        dn = 'ou=customer3,' + customers
+        communicator.add(dn, {
+            'ou': b'customer3',
+            'objectclass': (b'organizationalUnit',),
+        })
+        self.assertEqual(
+            len(other.search('(objectClass=*)', ONELEVEL, customers)),
+            5
+        )
+        other.delete(dn)
+        self.assertEqual(
+            len(communicator.search('(objectClass=*)', ONELEVEL, customers)),
+            4
+        )
+        communicator.unbind()
+        other.unbind()
+        factory().close()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+from node.ext.ldap import LDAPCommunicator
+from node.ext.ldap import LDAPConnector
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import ONELEVEL
+from node.ext.ldap import SUBTREE
+from node.ext.ldap import testing
+from node.ext.ldap.cache import EncodedCache
+from node.ext.ldap.cache import GENERATION_KEY_PREFIX
+from node.ext.ldap.cache import LRUCache
+from node.ext.ldap.cache import LRUCacheProviderFactory
+from node.ext.ldap.cache import TieredCache
+from node.ext.ldap.stats import CacheStats
+from node.ext.ldap.stats import Histogram
+from node.ext.ldap.stats import OTHER_BASES
+from node.ext.ldap.stats import cache_stats
+from node.ext.ldap.stats import get_cache_stats
+from node.ext.ldap.stats import reset_cache_stats
+from node.ext.ldap.testing import props
+from node.tests import NodeTestCase
+from zope.component import getGlobalSiteManager
+import time
+
+
+class TestStats(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def tearDown(self):
+        reset_cache_stats()
+        super(TestStats, self).tearDown()
+
+    def test_histogram(self):
+        histogram = Histogram(bounds=(0.1, 1.))
+        for value in (0.05, 0.1, 0.5, 2.):
+            histogram.observe(value)
+        self.assertEqual(histogram.stats(), {
+            'count': 4,
+            'sum': 2.65,
+            'buckets': [(0.1, 2), (1., 1), (None, 1)],
+        })
+        histogram.reset()
+        self.assertEqual(histogram.stats()['count'], 0)
+        self.assertEqual(
+            histogram.stats()['buckets'],
+            [(0.1, 0), (1., 0), (None, 0)]
+        )
+
+    def test_cache_stats(self):
+        stats = CacheStats(max_bases=1)
+        stats.miss('search', 'ou=a', 0.2)
+        stats.hit('search', 'ou=a', 0.001)
+        stats.hit('search', 'ou=a', 0.001, stale=True)
+        stats.miss('search_many', 'ou=b', 0.1)
+        stats.miss('search', 'ou=c', 0.1)
+
+        res = stats.stats()
+        self.assertEqual(res['hits'], 2)
+        self.assertEqual(res['stale_hits'], 1)
+        self.assertEqual(res['misses'], 3)
+        self.assertEqual(res['hit_ratio'], 0.4)
+        self.assertEqual(res['hit_latency']['count'], 2)
+        self.assertEqual(res['miss_latency']['count'], 3)
+        self.assertEqual(sorted(res['operations']), ['search', 'search_many'])
+        self.assertEqual(res['operations']['search']['misses'], 2)
+
+        # Bases exceeding ``max_bases`` are aggregated
+        self.assertEqual(sorted(res['bases']), [OTHER_BASES, 'ou=a'])
+        base = res['bases']['ou=a']
+        self.assertEqual(base['hits'], 2)
+        self.assertFalse('hit_latency' in base)
+
+        # Time saved is estimated from the average search duration
+        self.assertEqual(round(base['time_saved'], 3), 0.398)
+
+        stats.reset()
+        self.assertEqual(stats.stats()['hits'], 0)
+        self.assertEqual(stats.stats()['bases'], {})
+
+        # Process wide registry
+        self.assertTrue(get_cache_stats('a') is get_cache_stats('a'))
+        get_cache_stats('a').hit('search', 'ou=a', 0.001)
+        self.assertEqual(cache_stats()['a']['hits'], 1)
+        reset_cache_stats()
+        self.assertEqual(cache_stats(), {})
+
+    def test_provider_stats(self):
+        cache = LRUCache(max_entries=1, max_bytes=100)
+        cache['a'] = 'a'
+        cache['a']
+        cache['b']
+        cache['b'] = 'b'
+        cache['c'] = 'c' * 200
+        cache.set('d', 'd', timeout=0.01)
+        time.sleep(0.02)
+        cache['d']
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['expirations'], 1)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['entries'], 0)
+        self.assertEqual(stats['max_entries'], 1)
+        cache.reset_stats()
+        self.assertEqual(cache.stats()['hits'], 0)
+
+        encoded = EncodedCache(LRUCache())
+        encoded['a'] = 'a'
+        encoded['a']
+        encoded['b']
+        encoded.cache['c'] = b'\x00'
+        encoded['c']
+        stats = encoded.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['stored'], 1)
+        self.assertTrue(stats['stored_bytes'] > 0)
+        self.assertEqual(stats['cache']['hits'], 2)
+
+        tiered = TieredCache(LRUCache(), encoded)
+        tiered['b'] = 'b'
+        tiered['b']
+        del tiered.l1['b']
+        tiered['b']
+        tiered['x']
+        stats = tiered.stats()
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(stats['l2_hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['l1']['hits'], 1)
+        self.assertEqual(stats['l2']['cache']['hits'], 3)
+        tiered.reset_stats()
+        self.assertEqual(tiered.stats()['l2']['hits'], 0)
+        self.assertEqual(tiered.stats()['l2']['cache']['hits'], 0)
+
+        # Lookups of generations are counted separately
+        generation = GENERATION_KEY_PREFIX + 'x'
+        tiered[generation]
+        tiered[generation] = 'g'
+        tiered[generation]
+        stats = tiered.stats()
+        self.assertEqual(stats['misses'], 0)
+        self.assertEqual(stats['l1_hits'], 0)
+        self.assertEqual(stats['generation_misses'], 1)
+        self.assertEqual(stats['generation_l1_hits'], 1)
+        self.assertEqual(stats['l1']['hits'], 0)
+        self.assertEqual(stats['l1']['misses'], 0)
+        self.assertEqual(stats['l1']['generation_hits'], 1)
+        self.assertEqual(stats['l1']['generation_misses'], 1)
+        self.assertEqual(stats['l2']['misses'], 0)
+        self.assertEqual(stats['l2']['generation_misses'], 1)
+        self.assertEqual(stats['l2']['cache']['generation_misses'], 1)
+
+    def test_communicator(self):
+        factory = LRUCacheProviderFactory(max_entries=100)
+        gsm = getGlobalSiteManager()
+        gsm.registerUtility(factory)
+
+        cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        communicator = LDAPCommunicator(LDAPConnector(cache_props))
+        communicator.bind()
+        communicator.reset_cache_stats()
+        customers = 'ou=customers,dc=my-domain,dc=com'
+        for i in range(3):
+            communicator.search('(objectClass=*)', ONELEVEL, customers)
+        communicator.search_many([
+            dict(queryFilter='(objectClass=*)', scope=ONELEVEL,
+                 baseDN=customers),
+            dict(queryFilter='(ou=customer1)', scope=SUBTREE,
+                 baseDN=customers),
+        ])
+
+        stats = communicator.cache_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['operations']['search']['hits'], 2)
+        self.assertEqual(stats['operations']['search_many']['hits'], 1)
+        self.assertEqual(stats['operations']['search_many']['misses'], 1)
+        self.assertEqual(list(stats['bases']), [customers])
+        self.assertEqual(stats['miss_latency']['count'], 2)
+
+        # Stats are shared by communicators using the same server
+        self.assertEqual(cache_stats()[props.uri]['hits'], 3)
+
+        # Stats of cache provider. Lookups of generations are not counted as
+        # hits respective misses
+        self.assertEqual(stats['provider']['entries'], 4)
+        self.assertEqual(stats['provider']['hits'], 3)
+        self.assertEqual(stats['provider']['misses'], 2)
+        self.assertTrue(stats['provider']['generation_hits'] > 0)
+
+        communicator.reset_cache_stats()
+        stats = communicator.cache_stats()
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['provider']['hits'], 0)
+        communicator.unbind()
+        gsm.unregisterUtility(factory)
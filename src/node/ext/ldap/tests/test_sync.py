@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from ldap import MOD_REPLACE
+from node.ext.ldap import BASE
+from node.ext.ldap import LDAPCommunicator
+from node.ext.ldap import LDAPConnector
+from node.ext.ldap import LDAPNode
+from node.ext.ldap import LDAPProps
+from node.ext.ldap import testing
+from node.ext.ldap.cache import LRUCacheProviderFactory
+from node.ext.ldap.sync import SyncConsumer
+from node.ext.ldap.sync import invalidate_node
+from node.ext.ldap.testing import props
+from node.locking import TreeLock
+from node.tests import NodeTestCase
+from zope.component import getGlobalSiteManager
+import threading
+import time
+
+
+def wait_for(condition, timeout=5.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestSync(NodeTestCase):
+    layer = testing.LDIF_data
+
+    def setUp(self):
+        super(TestSync, self).setUp()
+        self.factory = LRUCacheProviderFactory(max_entries=100)
+        getGlobalSiteManager().registerUtility(self.factory)
+        self.cache_props = LDAPProps(
+            uri=props.uri,
+            user=props.user,
+            password=props.password,
+            cache=True
+        )
+        self.consumer = SyncConsumer(
+            self.cache_props,
+            'dc=my-domain,dc=com',
+            poll_timeout=0.05
+        )
+
+    def tearDown(self):
+        self.consumer.stop(5.)
+        getGlobalSiteManager().unregisterUtility(self.factory)
+        super(TestSync, self).tearDown()
+
+    def test_consumer(self):
+        consumer = self.consumer
+        self.assertFalse(consumer.running)
+        consumer.start()
+        self.assertTrue(consumer.wait_refreshed(5.))
+        stats = consumer.stats()
+        self.assertTrue(stats['running'])
+        self.assertTrue(stats['refreshed'])
+        self.assertEqual(stats['notifications'], 0)
+        self.assertTrue(stats['entries'] > 0)
+
+        changed = list()
+        consumer.subscribe(changed.append)
+
+        communicator = LDAPCommunicator(LDAPConnector(self.cache_props))
+        communicator.bind()
+        other = LDAPCommunicator(LDAPConnector(props))
+        other.bind()
+        dn = 'ou=customer1,ou=customers,dc=my-domain,dc=com'
+
+        def description():
+            res = communicator.search(
+                '(objectClass=*)',
+                BASE,
+                dn,
+                attrlist=['description']
+            )
+            return res[0][1]['description']
+
+        self.assertEqual(description(), [b'customer1'])
+
+        # Writes of other communicators without cache get noticed by
+        # syncrepl and invalidate cached searches
+        other.modify(dn, [(MOD_REPLACE, 'description', b'synced')])
+        self.assertTrue(wait_for(lambda: description() == [b'synced']))
+        self.assertTrue(wait_for(lambda: changed))
+        self.assertEqual(changed[-1], dn)
+        self.assertTrue(consumer.stats()['notifications'] > 0)
+        self.assertTrue(consumer.stats()['cookie'] is not None)
+
+        # Watched node trees drop changed children
+        node = LDAPNode('ou=customers,dc=my-domain,dc=com', self.cache_props)
+        consumer.watch_node(node)
+        customer = node['ou=customer1']
+        self.assertEqual(customer.attrs['description'], u'synced')
+        self.assertTrue('ou=customer1' in node.storage)
+        other.modify(dn, [(MOD_REPLACE, 'description', b'resynced')])
+        self.assertTrue(
+            wait_for(lambda: 'ou=customer1' not in node.storage)
+        )
+        self.assertEqual(
+            node['ou=customer1'].attrs['description'],
+            u'resynced'
+        )
+
+        # The watched node itself reloads its attributes
+        other.modify(
+            'ou=customers,dc=my-domain,dc=com',
+            [(MOD_REPLACE, 'description', b'changed')]
+        )
+        self.assertTrue(wait_for(
+            lambda: node.attrs['description'] == u'changed'
+        ))
+
+        consumer.unsubscribe(changed.append)
+        del changed[:]
+        other.modify(dn, [(MOD_REPLACE, 'description', b'unsubscribed')])
+        self.assertTrue(wait_for(lambda: description() == [b'unsubscribed']))
+        self.assertEqual(changed, [])
+
+        other.modify(dn, [(MOD_REPLACE, 'description', b'customer1')])
+        other.modify(
+            'ou=customers,dc=my-domain,dc=com',
+            [(MOD_REPLACE, 'description', b'customers')]
+        )
+        communicator.unbind()
+        other.unbind()
+
+        consumer.stop(5.)
+        self.assertFalse(consumer.running)
+        self.assertFalse(consumer.stats()['running'])
+
+    def test_invalidate_locking(self):
+        node = LDAPNode('ou=customers,dc=my-domain,dc=com', props)
+        node['ou=customer1']
+        dn = 'ou=customer1,ou=customers,dc=my-domain,dc=com'
+
+        # Watched trees are modified while holding their tree lock
+        lock = TreeLock(node['ou=customer1'])
+        lock.acquire()
+        thread = threading.Thread(target=invalidate_node, args=(node, dn))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertTrue('ou=customer1' in node.storage)
+        lock.release()
+        thread.join(5.)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse('ou=customer1' in node.storage)
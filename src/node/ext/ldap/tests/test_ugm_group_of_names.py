@@ -185,6 +185,43 @@ class TestUGMGroupOfNames(NodeTestCase):
         del users['sepp']
         ugm()
 
+    @group_of_names_ugm
+    def test_create_many(self, ugm):
+        users = ugm.users
+        groups = ugm.groups
+
+        # Principals are created in bulk and written immediately. Failures
+        # are reported instead of raised
+        result = users.create_many([
+            ('sepp', dict(cn='Sepp', sn='Bla', mail='sepp@bar.com')),
+            ('uid0', dict(cn='Uid0', sn='Uid0')),
+            ('hans', dict(cn='Hans', sn='Blub', mail='hans@bar.com')),
+        ])
+        self.assertEqual(result.added, [u'sepp', u'hans'])
+        self.assertEqual(list(result.errors), [u'uid0'])
+        self.assertTrue(isinstance(result.errors['uid0'], ldap.ALREADY_EXISTS))
+        self.assertFalse(users.changed)
+        self.assertEqual(
+            users.keys(),
+            [u'uid0', u'uid1', u'uid2', u'sepp', u'hans']
+        )
+        # the existing principal is untouched
+        self.assertEqual(users['uid0'].attrs['sn'], u'sn0')
+        self.assertEqual(
+            create_ugm().users['hans'].attrs['mail'],
+            u'hans@bar.com'
+        )
+
+        # Groups get the dummy member
+        result = groups.create_many([('group99', dict())])
+        self.assertEqual(result.added, [u'group99'])
+        self.assertEqual(groups['group99'].attrs['member'], [u'cn=nobody'])
+
+        del users['sepp']
+        del users['hans']
+        del groups['group99']
+        ugm()
+
     @group_of_names_ugm
     def test_fetch_groups(self, ugm):
         groups = ugm.groups
@@ -304,6 +341,36 @@ class TestUGMGroupOfNames(NodeTestCase):
         self.assertEqual(user_1.group_ids, [u'group1', u'group2'])
         self.assertEqual(user_2.group_ids, [u'group2'])
 
+    @group_of_names_ugm
+    def test_add_remove_members(self, ugm):
+        groups = ugm.groups
+        group_2 = groups['group2']
+
+        # Members are added and removed in bulk without rewriting the
+        # member attribute. Changes are written immediately, existing
+        # respective missing members are skipped.
+        group_2.add_members(['uid0', 'uid1'])
+        self.assertEqual(group_2.member_ids, [u'uid1', u'uid2', u'uid0'])
+        self.assertFalse(group_2.context.changed)
+        ugm_fresh = create_ugm()
+        self.assertEqual(
+            ugm_fresh.groups['group2'].member_ids,
+            [u'uid1', u'uid2', u'uid0']
+        )
+
+        group_2.remove_members(['uid0', 'uid2'])
+        group_2.remove_members(['uid0'])
+        self.assertEqual(group_2.member_ids, [u'uid1'])
+        ugm_fresh = create_ugm()
+        self.assertEqual(ugm_fresh.groups['group2'].member_ids, [u'uid1'])
+
+        group_2.add_members(['uid2'])
+        ugm_fresh = create_ugm()
+        self.assertEqual(
+            ugm_fresh.groups['group2'].member_ids,
+            [u'uid1', u'uid2']
+        )
+
     @group_of_names_ugm
     def test_search(self, ugm):
         users = ugm.users
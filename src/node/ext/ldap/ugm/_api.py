@@ -10,7 +10,9 @@ from node.behaviors import Nodify
 from node.behaviors import OdictStorage
 from node.behaviors import Storage
 from node.behaviors.alias import DictAliaser
+from node.ext.ldap._node import LDAPBulkResult
 from node.ext.ldap._node import LDAPNode
+from node.ext.ldap.base import ADD_WINDOW
 from node.ext.ldap.base import ensure_text
 from node.ext.ldap.interfaces import ILDAPGroupsConfig as IGroupsConfig
 from node.ext.ldap.interfaces import ILDAPUsersConfig as IUsersConfig
@@ -352,6 +354,31 @@ class LDAPGroupMapping(Behavior):
             # XXX: call here immediately?
             # self.context()
 
+    @default
+    @locktree
+    def add_members(self, keys):
+        """Add principals by ``keys`` to group and write immediately.
+
+        The member attribute is neither loaded nor rewritten, only the new
+        members are sent to the server. Existing members are skipped.
+        """
+        self.context.add_values(
+            self._member_attribute,
+            [self.translate_key(ensure_text(key)) for key in keys]
+        )
+
+    @default
+    @locktree
+    def remove_members(self, keys):
+        """Remove principals by ``keys`` from group and write immediately.
+
+        See ``add_members``. Keys which are no members are skipped.
+        """
+        self.context.delete_values(
+            self._member_attribute,
+            [self.translate_key(ensure_text(key)) for key in keys]
+        )
+
     @default
     @property
     def member_ids(self):
@@ -413,14 +440,8 @@ class LDAPGroup(LDAPGroupMapping, LDAPPrincipal, UgmGroup):
         if self._member_format != FORMAT_DN:
             return members
         principals = self.related_principals()
-        translated = list()
-        for dn in members:
-            try:
-                translated.append(principals.idbydn(dn))
-            except KeyError:
-                # inexistent DN
-                pass
-        return translated
+        # inexistent DNs are skipped
+        return principals.ids_by_dn(members)
 
     @default
     def translate_key(self, key):
@@ -495,6 +516,28 @@ class LDAPPrincipals(OdictStorage):
         except ldap.NO_SUCH_OBJECT:
             raise KeyError(dn)
 
+    @default
+    def ids_by_dn(self, dns):
+        """Return principal ids for given DNs with one pipelined request.
+
+        DNs of inexistent entries are skipped.
+        """
+        results = self.context.ldap_session.search_many([dict(
+            baseDN=dn,
+            attrlist=[self._key_attr]
+        ) for dn in dns], return_errors=True)
+        ids = list()
+        for res in results:
+            if isinstance(res, Exception):
+                if isinstance(res, ldap.NO_SUCH_OBJECT):
+                    continue
+                raise res
+            try:
+                ids.append(ensure_text(res[0][1][self._key_attr][0]))
+            except (IndexError, KeyError):
+                continue
+        return ids
+
     @override
     @property
     def ids(self):
@@ -561,11 +604,13 @@ class LDAPPrincipals(OdictStorage):
             ))
         # XXX: check if there is valid user context
         exists = False
-        try:
-            self[name]
-            exists = True
-        except KeyError:
-            pass
+        # skipped when creating principals in bulk, see ``create_many``
+        if not self.context._skip_existence_check:
+            try:
+                self[name]
+                exists = True
+            except KeyError:
+                pass
         if exists:
             raise KeyError(
                 u"Principal with id '{0}' already exists.".format(name)
@@ -688,6 +733,66 @@ class LDAPPrincipals(OdictStorage):
     @locktree
     def create(self, pid, **kw):
         # XXX: mechanism for defining a target container if scope is SUBTREE
+        principal = self._create_principal(pid, kw)
+        # set principal to self
+        self[pid] = principal
+        # if setting principal has been successful, hook up principal context
+        # to ldap tree
+        self.context[self._principal_rdn(principal)] = principal.context
+        # return newly created principal
+        return self[pid]
+
+    @default
+    @locktree
+    def create_many(self, principals, check_existence=False,
+                    window=ADD_WINDOW, timeout=None):
+        """Create principals and write them immediately.
+
+        Other than ``create``, the directory is not searched whether the
+        principals exist already and the adds are pipelined, see
+        ``LDAPNode.bulk_add``. Principals failing to be created are reported
+        instead of aborting.
+
+        :param principals: Iterable of ``(pid, attrs)`` tuples. ``attrs`` is
+            a dict containing the principal attributes as passed to
+            ``create`` as keyword arguments.
+        :param check_existence: Flag whether to search for existing entries
+            by DN first. Existing ones are reported with
+            ``ldap.ALREADY_EXISTS``.
+        :param window: Maximum number of adds waiting for their result.
+        :param timeout: Seconds each add may wait for its result.
+        :return: ``LDAPBulkResult`` instance with principal ids as keys.
+        """
+        pids = dict()
+        children = list()
+        context = self.context
+        context._skip_existence_check = True
+        try:
+            for pid, kw in principals:
+                pid = ensure_text(pid)
+                principal = self._create_principal(pid, dict(kw))
+                self[pid] = principal
+                rdn = self._principal_rdn(principal)
+                pids[rdn] = pid
+                children.append((rdn, principal.context))
+        finally:
+            context._skip_existence_check = False
+        res = context.bulk_add(
+            children,
+            check_existence=check_existence,
+            window=window,
+            timeout=timeout
+        )
+        result = LDAPBulkResult()
+        result.added = [pids[rdn] for rdn in res.added]
+        for rdn, error in res.errors.items():
+            pid = pids[rdn]
+            del self.storage[pid]
+            result.errors[pid] = error
+        return result
+
+    @default
+    def _create_principal(self, pid, kw):
         # create principal with LDAPNode as context
         context = LDAPNode()
         principal = self.principal_factory(
@@ -702,17 +807,15 @@ class LDAPPrincipals(OdictStorage):
         # set additional attributes on principal
         for k, v in kw.items():
             principal.attrs[k] = v
-        # set principal to self
-        self[pid] = principal
-        # if setting principal has been successful, hook up principal context
-        # to ldap tree
-        rdn = u'{0}={1}'.format(
+        return principal
+
+    @default
+    def _principal_rdn(self, principal):
+        # return RDN of principal context
+        return u'{0}={1}'.format(
             self._rdn_attr,
             principal.context.attrs[self._rdn_attr]
         )
-        self.context[rdn] = context
-        # return newly created principal
-        return self[pid]
 
 
 def calculate_expired(expiresUnit, expires):
@@ -784,6 +887,28 @@ class LDAPUsers(LDAPPrincipals, UgmUsers):
             res = self.context.search(criteria=criteria, attrlist=attrlist)
         except ldap.NO_SUCH_OBJECT:  # pragma: no cover
             return False
+        authorized = self._authenticate_entry(user_id, res)
+        if authorized is not True:
+            return authorized
+        user_dn = res[0][1]['dn']
+        session = self.context.ldap_session
+        authenticated = session.authenticate(user_dn, pw)
+        return authenticated and user_id or False
+
+    @default
+    def async_authenticate(self, login=None, pw=None):
+        """Coroutine verifying credentials without blocking the event loop.
+
+        Requires Python 3.
+        """
+        from node.ext.ldap.aio import users_authenticate
+        return users_authenticate(self, login=login, pw=pw)
+
+    @default
+    def _authenticate_entry(self, user_id, res):
+        # check user search result before verifying credentials. Return True
+        # if credentials should be verified, otherwise False or
+        # ``ACCOUNT_EXPIRED``.
         if not res:
             return False
         if len(res) > 1:  # pragma: no cover
@@ -800,14 +925,11 @@ class LDAPUsers(LDAPPrincipals, UgmUsers):
                     u"Accound expiration flag for user '{0}' "
                     u"contains unknown data"
                 )
-                logger.error(msg.format(id))
+                logger.error(msg.format(user_id))
                 return False
             if expired:
                 return ACCOUNT_EXPIRED
-        user_dn = res[0][1]['dn']
-        session = self.context.ldap_session
-        authenticated = session.authenticate(user_dn, pw)
-        return authenticated and user_id or False
+        return True
 
     @default
     @debug
@@ -954,18 +1076,10 @@ class LDAPRole(LDAPGroupMapping, AliasedPrincipal):
             ugm = self.parent.parent
             users = ugm.users
             groups = ugm.groups
-            user_members = list()
-            for dn in members:
-                try:
-                    user_members.append(users.idbydn(dn, True))
-                except KeyError:
-                    pass
-            group_members = list()
-            for dn in members:
-                try:
-                    group_members.append('group:{}'.format(groups.idbydn(dn, True)))
-                except KeyError:
-                    pass
+            user_members = users.ids_by_dn(members)
+            group_members = [
+                'group:{}'.format(gid) for gid in groups.ids_by_dn(members)
+            ]
             members = user_members + group_members
         return members
 